@@ -23,25 +23,48 @@
 #
 
 POINT_SNAP_PIXEL_DIST = 25
-
-import copy
-import os
-import time
+HUD_FRAME_WINDOW = 60
+HUD_FRAME_BUDGET = 1.0 / 30.0
+# Upper edges (seconds) of the HUD frame time histogram buckets
+HUD_HISTOGRAM_EDGES = [0.004, 0.008, 0.016, 0.033, 0.066, 0.133, None]
+# Preview zoom per mouse wheel notch and its limits
+VIEW_ZOOM_STEP = 1.25
+VIEW_ZOOM_MIN = 0.25
+VIEW_ZOOM_MAX = 1024.0
+# Iterations smaller than this on screen are not drawn
+LOD_PIXELS = 0.5
+# Background image pyramid stops halving at this size
+BG_MIP_MIN_SIZE = 64
+# Preview triangles over all shapes before depths are scaled back, 0 for no limit
+PREVIEW_BUDGET = 200000
+
+import collections
+import math
+import multiprocessing
+import threading
+from timeit import default_timer
 
 import wx
 
-from recursion_excursion import generate_recursion, generate_svg
+from recursion_excursion import generate_budget_recursion, generate_recursion, iteration_bounds, plan_warning, RecursionStats, STOP_STEP, STOP_FOOTER
+from export import ExportCancelled, write_output, export_project_shapes
+from tile_export import TileGrid, export_tiles
+from recursion_cache import RecursionCache, default_cache_dir
 from project import project, shape, polygon, vec2
 
 # File menu
 ID_EXPORT_FULL = wx.NewId()
 ID_EXPORT_INDIVIDUAL = wx.NewId()
+ID_EXPORT_TILES = wx.NewId()
 # Control panel
 ID_BTN_ADD_LINE = wx.NewId()
 ID_BTN_DEL_LINE = wx.NewId()
 ID_CHK_SNAP = wx.NewId()
 ID_CHK_HIDE_GUIDE = wx.NewId()
 ID_CHK_HIDE_NUM = wx.NewId()
+ID_CHK_HUD = wx.NewId()
+ID_SP_LOD_PIXELS = wx.NewId()
+ID_SP_PREVIEW_BUDGET = wx.NewId()
 ID_RAD_PREVIEW = wx.NewId()
 ID_RAD_ASPECT_RATIO = wx.NewId()
 # Attributes panel
@@ -92,12 +115,22 @@ class ControlsState(object):
     do_hide_shape_numbers = False
     do_draw_recursion = False
     aspect_ratio_fit = True
-    bg_bitmap = None
+    do_show_hud = False
+    lod_pixels = LOD_PIXELS
+    preview_budget = PREVIEW_BUDGET
+    bg_image = None                 # BackgroundImage
+    bg_loading = None               # filename being loaded
+    # Preview zoom and pan (pixels)
+    view_zoom = 1.0
+    view_offset = (0.0, 0.0)
+    # Persistent recursion cache used when (re)loading whole projects
+    rec_cache = None
 
 
 class AppState(object):
     project = None
     rec_list = None
+    truncated = None                # shape indices previewed below their depth
     canvas_w = None
     canvas_h = None
     # Shape selection
@@ -110,6 +143,126 @@ class AppState(object):
     add_line_stage_info = None      # list of accepted proposed infos
     # Guide line deletion
     del_line_stage = None           # [vec2,vec2] of proposed line to delete
+    # Right button drag
+    pan_anchor = None               # wx.Point last dragged from
+
+
+class PerfStats(object):
+    """ Timings of the last recursion generation and preview frames for the HUD """
+    def __init__(self):
+        self.frames = collections.deque(maxlen=HUD_FRAME_WINDOW)
+        self.recursion_s = 0.0
+        self.triangles = 0
+        self.drawn_triangles = 0
+        self.stopped_by_step = 0
+        self.stopped_by_footer = 0
+
+    def set_recursion(self, seconds, rec_list, stats):
+        self.recursion_s = seconds
+        self.triangles = sum(len(r) for r in rec_list)
+        if stats is not None:
+            reasons = stats.stop_reasons()
+            self.stopped_by_step = reasons.get(STOP_STEP, 0)
+            self.stopped_by_footer = reasons.get(STOP_FOOTER, 0)
+
+    def add_frame(self, frame_s, path_s, fill_s, brush_switches):
+        self.frames.append((frame_s, path_s, fill_s, brush_switches))
+
+    def last(self):
+        return self.frames[-1] if self.frames else (0.0, 0.0, 0.0, 0)
+
+    def avg_frame_s(self):
+        if not self.frames:
+            return 0.0
+        return sum(f[0] for f in self.frames) / len(self.frames)
+
+    def histogram(self):
+        counts = [0] * len(HUD_HISTOGRAM_EDGES)
+        for f in self.frames:
+            for i,edge in enumerate(HUD_HISTOGRAM_EDGES):
+                if (edge is None) or (f[0] < edge):
+                    counts[i] += 1
+                    break
+        return counts
+
+
+class BackgroundImage(object):
+    """
+        Background image with a pyramid of halved copies. The bitmap for the
+        current view is scaled from the nearest level, cropped to what's
+        visible and kept until the view changes.
+    """
+    def __init__(self, image):
+        self.levels = [image]
+        while min(image.GetWidth(), image.GetHeight()) >= 2 * BG_MIP_MIN_SIZE:
+            image = image.Scale(image.GetWidth() // 2, image.GetHeight() // 2, wx.IMAGE_QUALITY_HIGH)
+            self.levels.append(image)
+        self._view = None
+        self._bitmap = None
+
+    @classmethod
+    def load(cls, filename):
+        img = wx.Image(filename)
+        if not img.IsOk():
+            return None
+        return cls(img)
+
+    def bitmap(self, bgw, bgh, ox, oy, w, h):
+        """
+            (bitmap, x, y) of the part of the image visible in a w by h view
+            when drawn bgw by bgh pixels at ox,oy. x,y are relative to ox,oy.
+            None if no part is visible.
+        """
+        view = (bgw, bgh, ox, oy, w, h)
+        if view == self._view:
+            return self._bitmap
+        self._view = view
+        self._bitmap = None
+        # Visible area in view pixels, relative to the image origin
+        x0 = int(math.floor(max(0.0, -ox)))
+        y0 = int(math.floor(max(0.0, -oy)))
+        x1 = int(math.ceil(min(bgw, w - ox)))
+        y1 = int(math.ceil(min(bgh, h - oy)))
+        if (x1 <= x0) or (y1 <= y0):
+            return None
+        # Smallest level still at least as large as drawn
+        level = self.levels[0]
+        for img in self.levels[1:]:
+            if (img.GetWidth() < bgw) or (img.GetHeight() < bgh):
+                break
+            level = img
+        sx = level.GetWidth() / float(bgw)
+        sy = level.GetHeight() / float(bgh)
+        lx0 = min(int(x0 * sx), level.GetWidth() - 1)
+        ly0 = min(int(y0 * sy), level.GetHeight() - 1)
+        lx1 = min(max(int(math.ceil(x1 * sx)), lx0 + 1), level.GetWidth())
+        ly1 = min(max(int(math.ceil(y1 * sy)), ly0 + 1), level.GetHeight())
+        img = level.GetSubImage(wx.Rect(lx0, ly0, lx1 - lx0, ly1 - ly0))
+        img = img.Scale(x1 - x0, y1 - y0, wx.IMAGE_QUALITY_NORMAL)
+        self._bitmap = (wx.BitmapFromImage(img), x0, y0)
+        return self._bitmap
+
+
+def load_bg_image(filename):
+    """ Thread: decode the image and build its pyramid off the UI thread """
+    try:
+        bg = BackgroundImage.load(filename)
+    except Exception as e:
+        print 'Failed to load bg image:', e
+        bg = None
+    wx.CallAfter(set_bg_image, filename, bg)
+
+
+def set_bg_image(filename, bg):
+    if filename != g_controls.bg_loading:
+        # Another image was picked meanwhile
+        return
+    g_controls.bg_loading = None
+    if bg is None:
+        print 'Failed to load bg image', filename
+        return
+    g_controls.bg_image = bg
+    g_app.force_redraw_internal()
 
 
 class UndoStack(object):
@@ -161,6 +314,9 @@ g_app = None
 g_state = AppState()
 g_controls = ControlsState()
 g_undo_stack = UndoStack()
+g_perf = PerfStats()
+# Last project save started, see save_project()
+g_save_thread = None
 
 
 def get_scale(view_xy):
@@ -177,25 +333,84 @@ def get_scale(view_xy):
     return xs,ys
 
 
+def get_view(view_xy):
+    """ Scale and pixel offset of the canvas including zoom and pan """
+    xs,ys = get_scale(view_xy)
+    ox,oy = g_controls.view_offset
+    return xs * g_controls.view_zoom, ys * g_controls.view_zoom, ox, oy
+
+
+def screen_to_canvas(sp, view_xy):
+    xs,ys,ox,oy = get_view(view_xy)
+    return vec2((sp.x - ox) / xs, (sp.y - oy) / ys)
+
+
+def reset_view():
+    g_controls.view_zoom = 1.0
+    g_controls.view_offset = (0.0, 0.0)
+
+
+def shapes_overlap(shapes):
+    """ True if any two enabled shapes overlap, sweeping along x """
+    boxed = sorted(((s.poly.bounds(), s.poly) for s in shapes if not s.disabled), key=lambda e: e[0])
+    active = []
+    for b,poly in boxed:
+        active = [(ab,ap) for ab,ap in active if ab[2] > b[0]]
+        for ab,ap in active:
+            if (ab[1] < b[3]) and (b[1] < ab[3]) and poly.overlaps(ap):
+                return True
+        active.append((b, poly))
+    return False
+
+
 def colour_from_name(color_name):
     c = wx.Colour()
     c.SetFromName(color_name)
     return c
 
+def regenerate(proj, cache=None):
+    """
+        Recursion for the preview within the triangle budget, timed for the
+        HUD. Returns (rec_list, indices of shapes cut short by the budget).
+    """
+    # Per-shape stats only while the HUD is up
+    stats = RecursionStats() if g_controls.do_show_hud else None
+    start = default_timer()
+    if g_controls.preview_budget:
+        rl, truncated = generate_budget_recursion(proj, g_controls.preview_budget, cache, stats)
+    else:
+        rl, truncated = generate_recursion(proj, cache, stats), []
+    g_perf.set_recursion(default_timer() - start, rl, stats)
+    return rl, truncated
+
 def post_project_modification():
-    p_copy = copy.deepcopy(g_state.project)
-    g_undo_stack.do(p_copy)
+    g_undo_stack.do(g_state.project.snapshot())
+
+def edit_shape(s, index=None):
+    """
+        Shape to modify in place of s, see project.edit_shape(). Undo
+        entries and exports share shapes with g_state.project, so nothing
+        may be modified without this first.
+    """
+    e = g_state.project.edit_shape(s, index)
+    if g_state.selected_shape is s:
+        g_state.selected_shape = e
+    return e
 
 def state_from_project(orig_proj, with_undo_reset=True):
     global g_state
+    if with_undo_reset:
+        reset_view()
     try:
-        proj = copy.deepcopy(orig_proj)
+        # Undo entries stay as they are, edits copy the shapes they touch
+        proj = orig_proj.snapshot()
         cw = proj.canvas[2] - proj.canvas[0]
         ch = proj.canvas[3] - proj.canvas[1]
-        rl = generate_recursion(proj)
+        rl, truncated = regenerate(proj, g_controls.rec_cache)
         g_state = AppState()
         g_state.project = proj
         g_state.rec_list = rl
+        g_state.truncated = truncated
         g_state.canvas_w = cw
         g_state.canvas_h = ch
         g_app.set_global_ui()
@@ -243,43 +458,146 @@ def save_project(filename, keep_filename):
     if g_state is None:
         print 'Nothing to save!'
         return
+    global g_save_thread
     print 'Saving project file:', filename
+    # Written from a snapshot while editing carries on, not a daemon so
+    # quitting waits for it
+    t = threading.Thread(target=save_snapshot, args=(g_state.project.snapshot(), filename, keep_filename,
+                                                     g_save_thread))
+    g_save_thread = t
+    t.start()
+
+def save_snapshot(p_snapshot, filename, keep_filename, previous):
+    # One save at a time, in the order they were asked for
+    if previous is not None:
+        previous.join()
     try:
-        p_copy = copy.deepcopy(g_state.project)
-        p_copy.save_file(filename)
+        p_snapshot.save_file(filename)
         if keep_filename:
-            g_controls.json_save_filename = filename
+            wx.CallAfter(set_save_filename, filename)
     except Exception as e:
         print 'Failed:', e
 
-def export_full(filename):
+def set_save_filename(filename):
+    g_controls.json_save_filename = filename
+
+class ExportWorker(threading.Thread):
+    """ Runs work(progress) off the UI thread, see run_export() """
+    def __init__(self, work):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.work = work
+        self.cancelled = False
+        self.shapes_done = 0
+        self.bytes_written = 0
+        self.error = None
+
+    def progress(self, shapes_done, bytes_written):
+        if self.cancelled:
+            raise ExportCancelled()
+        self.shapes_done = shapes_done
+        self.bytes_written = bytes_written
+
+    def run(self):
+        try:
+            self.work(self.progress)
+        except ExportCancelled:
+            pass
+        except Exception as e:
+            self.error = e
+
+
+def export_snapshot():
+    """
+        (canvas, get_rec_list) to export, get_rec_list() is called from the
+        worker. The preview's rec_list is regenerated on every change so is
+        normally reused, unless the preview budget cut shapes short. It is
+        only ever replaced, never modified, so safe to read from another
+        thread.
+    """
+    canvas = list(g_state.project.canvas)
+    rl = g_state.rec_list
+    if (rl is not None) and (not g_state.truncated):
+        return canvas, lambda: rl
+    p_copy = g_state.project.snapshot()
+    return canvas, lambda: generate_recursion(p_copy)
+
+
+def run_export(parent, title, work, total=None, unit='shapes'):
+    """
+        Runs work(progress) on an ExportWorker behind a progress dialog
+        with a cancel button, returns True if it completed. progress counts
+        up to total (default: number of shapes) of unit.
+    """
+    if total is None:
+        total = len(g_state.project.shapes)
+    total = max(total, 1)
+    worker = ExportWorker(work)
+    dlg = wx.ProgressDialog(title, 'Exporting...', maximum=total, parent=parent,
+                            style=wx.PD_CAN_ABORT|wx.PD_APP_MODAL|wx.PD_ELAPSED_TIME)
+    worker.start()
+    while worker.is_alive():
+        msg = '%d of %d %s, %.1f MB written' % (worker.shapes_done, total, unit,
+                                                worker.bytes_written / (1024.0 * 1024.0))
+        # Reaching the maximum would finish the dialog early
+        keep_going = dlg.Update(min(worker.shapes_done, total - 1), msg)[0]
+        if not keep_going:
+            worker.cancelled = True
+        worker.join(0.05)
+    dlg.Destroy()
+    if worker.error:
+        print 'Failed:', worker.error
+        wx.MessageBox(str(worker.error), 'Export error', wx.OK|wx.ICON_ERROR)
+        return False
+    if worker.cancelled:
+        print 'Cancelled after %d of %d %s' % (worker.shapes_done, total, unit)
+        return False
+    return True
+
+def confirm_large_export(parent, fmt):
+    """ Asks first if the planned output is huge, True to go ahead """
+    warning = plan_warning(g_state.project, fmt)
+    if warning is None:
+        return True
+    return wx.MessageBox(warning + '\n\nExport anyway?', 'Large export',
+                         wx.YES_NO|wx.ICON_WARNING, parent) == wx.YES
+
+def export_full(filename, parent=None):
     if g_state is None:
         print 'Nothing to export!'
         return
+    ext = filename.lower()
+    fmt = 'dxf' if ext.endswith('.dxf') else ('vrwm' if ext.endswith('.vrwm') else 'svg')
+    if not confirm_large_export(parent, fmt):
+        return
     print 'Exporting SVG file:', filename
-    try:
-        p_copy = copy.deepcopy(g_state.project)
-        rl = generate_recursion(p_copy)
-        with open(filename, 'w') as f:
-            generate_svg(p_copy.canvas, rl, f)
-    except Exception as e:
-        print 'Failed:', e
+    canvas, get_rec_list = export_snapshot()
+    run_export(parent, 'Export', lambda progress: write_output(filename, canvas, get_rec_list(), progress))
 
-def export_individual(directory):
+def export_individual(directory, parent=None):
     if g_state is None:
         print 'Nothing to export!'
         return
+    if not confirm_large_export(parent, 'svg'):
+        return
     print 'Exporting individual SVG files to:', directory
-    try:
-        p_copy = copy.deepcopy(g_state.project)
-        rl = generate_recursion(p_copy)
-        for i,r in enumerate(rl):
-            if r:
-                filename = '%02d.svg' % (i + 1)
-                with open(os.path.join(directory, filename), 'w') as f:
-                    generate_svg(p_copy.canvas, [r], f)
-    except Exception as e:
-        print 'Failed:', e
+    # Shapes are generated in worker processes, only unchanged files are kept
+    p_copy = g_state.project.snapshot()
+    run_export(parent, 'Export Shapes',
+               lambda progress: export_project_shapes(directory, p_copy, skip_unchanged=True, progress=progress))
+
+def export_tiled(directory, width, height, overlap, parent=None):
+    if g_state is None:
+        print 'Nothing to export!'
+        return
+    if not confirm_large_export(parent, 'svg'):
+        return
+    print 'Exporting %gx%g tiles to:' % (width, height), directory
+    p_copy = g_state.project.snapshot()
+    grid = TileGrid(p_copy.canvas, width, height, overlap)
+    run_export(parent, 'Export Tiles',
+               lambda progress: export_tiles(directory, p_copy, width, height, overlap, progress=progress),
+               len(grid.strips()), 'strips')
 
 def unique_list(l):
     out = []
@@ -295,6 +613,9 @@ class BaseDrawPanel(wx.Panel):
     def bind_events(self, target):
         target.Bind(wx.EVT_LEFT_UP, self.OnLeftUp)
         target.Bind(wx.EVT_MOTION, self.OnMotion)
+        target.Bind(wx.EVT_RIGHT_DOWN, self.OnRightDown)
+        target.Bind(wx.EVT_RIGHT_UP, self.OnRightUp)
+        target.Bind(wx.EVT_MOUSEWHEEL, self.OnMouseWheel)
 
     #
     # Events
@@ -369,7 +690,7 @@ class BaseDrawPanel(wx.Panel):
                 )
                 g_state.project.shapes.extend([s_a, s_b])
                 # Generate
-                g_state.rec_list = generate_recursion(g_state.project)
+                g_state.rec_list, g_state.truncated = regenerate(g_state.project)
                 post_project_modification()
                 # Clear
                 g_state.add_line_stage = None
@@ -396,7 +717,7 @@ class BaseDrawPanel(wx.Panel):
                 if len(t_poly.points) < 3:
                     g_state.project.shapes.remove(shapes[0])
                 elif t_poly.is_concave():
-                    shapes[0].poly = t_poly
+                    edit_shape(shapes[0]).poly = t_poly
                 else:
                     error_msg = 'Combined shape is convex!'
             elif len(shapes) == 2:
@@ -427,7 +748,7 @@ class BaseDrawPanel(wx.Panel):
                             break
                 t_poly = polygon(points)
                 if t_poly.is_concave():
-                    shapes[0].poly = t_poly
+                    edit_shape(shapes[0]).poly = t_poly
                     g_state.project.shapes.remove(shapes[1])
                 else:
                     error_msg = 'Combined shape is convex!'
@@ -436,17 +757,13 @@ class BaseDrawPanel(wx.Panel):
             if error_msg:
                 wx.MessageBox(error_msg, 'Deletion error', wx.OK|wx.ICON_ERROR)
             else:
-                g_state.rec_list = generate_recursion(g_state.project)
+                g_state.rec_list, g_state.truncated = regenerate(g_state.project)
                 post_project_modification()
             g_app.force_redraw()
         else:
             # [De]Select shape
             sp = wx.GetMousePosition() - target.GetScreenPosition()
-            w,h = target.GetClientSize()
-            xs,ys = get_scale((w, h))
-            inv_xs,inv_ys = (1.0/xs), (1.0/ys)
-            # Scale to canvas coordinates
-            p = vec2(sp.x * inv_xs, sp.y * inv_ys)
+            p = screen_to_canvas(sp, target.GetClientSize())
             for i,s in enumerate(g_state.project.shapes):
                 if s.poly.contains(p):
                     if g_state.selected_shape == s:
@@ -457,14 +774,45 @@ class BaseDrawPanel(wx.Panel):
             g_app.force_redraw()
         evt.Skip()
 
+    def OnRightDown(target, evt):
+        g_state.pan_anchor = evt.GetPosition()
+        evt.Skip()
+
+    def OnRightUp(target, evt):
+        g_state.pan_anchor = None
+        evt.Skip()
+
+    def OnMouseWheel(target, evt):
+        rot = evt.GetWheelRotation()
+        if rot == 0:
+            return
+        zoom = g_controls.view_zoom
+        if rot > 0:
+            new_zoom = min(zoom * VIEW_ZOOM_STEP, VIEW_ZOOM_MAX)
+        else:
+            new_zoom = max(zoom / VIEW_ZOOM_STEP, VIEW_ZOOM_MIN)
+        # Keep what's under the cursor in place
+        sp = evt.GetPosition()
+        ox,oy = g_controls.view_offset
+        r = new_zoom / zoom
+        g_controls.view_offset = (sp.x - (sp.x - ox) * r, sp.y - (sp.y - oy) * r)
+        g_controls.view_zoom = new_zoom
+        g_app.force_redraw_internal()
+
     def OnMotion(target, evt):
-        w,h = target.GetClientSize()
-        xs,ys = get_scale((w, h))
-        inv_xs,inv_ys = (1.0/xs), (1.0/ys)
-        if g_state.add_line_stage is not None:
+        view_xy = target.GetClientSize()
+        if (g_state.pan_anchor is not None) and evt.RightIsDown():
             sp = evt.GetPosition()
+            ox,oy = g_controls.view_offset
+            g_controls.view_offset = (ox + sp.x - g_state.pan_anchor.x, oy + sp.y - g_state.pan_anchor.y)
+            g_state.pan_anchor = sp
+            g_app.force_redraw_internal()
+            evt.Skip()
+            return
+        xs,ys,ox,oy = get_view(view_xy)
+        if g_state.add_line_stage is not None:
             # Scale to canvas coordinates
-            p = vec2(sp.x * inv_xs, sp.y * inv_ys)
+            p = screen_to_canvas(evt.GetPosition(), view_xy)
             # Snap current point to closest if close enough to existing.
             if g_controls.do_point_snapping:
                 closest = None
@@ -506,9 +854,8 @@ class BaseDrawPanel(wx.Panel):
             g_state.add_line_proposed_info = closest_info
             g_app.force_redraw()
         elif g_state.del_line_stage is not None:
-            sp = evt.GetPosition()
             # Scale to canvas coordinates
-            p = vec2(sp.x * inv_xs, sp.y * inv_ys)
+            p = screen_to_canvas(evt.GetPosition(), view_xy)
             # Find closest line segment
             closest = None
             closest_info = None
@@ -533,6 +880,13 @@ class GraphicsContextDrawPanel(BaseDrawPanel):
 
         self._bg_color = wx.Brush(True and 'white' or self.GetBackgroundColour())
 
+        # Batched recursion fills, see get_fills()
+        self._fills_rec_list = None
+        self._fills_view = None
+        self._fills = []
+        self._bounds_rec_list = None
+        self._bounds = []
+
         # Manual buffer on Windows to prevent resize flicker
         self._use_buffer = ('wxMSW' in wx.PlatformInfo)
         if self._use_buffer:
@@ -558,42 +912,113 @@ class GraphicsContextDrawPanel(BaseDrawPanel):
         dc.Clear()
         self.draw_gc(dc)
 
+    def get_fills(self, gc, view):
+        """
+            (brush, path) pairs covering the visible recursion, one path per
+            color, or per shape and color if shapes overlap so their draw
+            order still holds. Iterations out of view or smaller than
+            g_controls.lod_pixels are left out. view is (xs, ys, ox, oy, w, h)
+            and paths are kept until it or rec_list changes.
+        """
+        view = view + (g_controls.lod_pixels,)
+        if (self._fills_rec_list is g_state.rec_list) and (self._fills_view == view):
+            return self._fills
+        shapes = g_state.project.shapes
+        if self._bounds_rec_list is not g_state.rec_list:
+            self._bounds = [iteration_bounds(s, tlist) for s,tlist in zip(shapes, g_state.rec_list)]
+            self._bounds_rec_list = g_state.rec_list
+        xs,ys,ox,oy,w,h,lod_pixels = view
+        # Visible part of the canvas
+        vx0,vy0 = -ox / xs, -oy / ys
+        vx1,vy1 = (w - ox) / xs, (h - oy) / ys
+        renderer = gc.GetRenderer()
+        overlap = shapes_overlap(shapes)
+        brush_map = {}
+        fills = []
+        paths = collections.OrderedDict()
+        drawn = 0
+        for s,tlist,bounds in zip(shapes, g_state.rec_list, self._bounds):
+            n = len(s.poly.points)
+            for i,(x0,y0,x1,y1) in enumerate(bounds):
+                # Bounds include all later iterations, none of them show either
+                if (x1 < vx0) or (x0 > vx1) or (y1 < vy0) or (y0 > vy1):
+                    break
+                if max((x1 - x0) * xs, (y1 - y0) * ys) < lod_pixels:
+                    break
+                inside = (x0 >= vx0) and (x1 <= vx1) and (y0 >= vy0) and (y1 <= vy1)
+                for c,poly in tlist[i*n:(i+1)*n]:
+                    p0,p1,p2 = poly.points
+                    if not inside:
+                        if (max(p0.x, p1.x, p2.x) < vx0) or (min(p0.x, p1.x, p2.x) > vx1):
+                            continue
+                        if (max(p0.y, p1.y, p2.y) < vy0) or (min(p0.y, p1.y, p2.y) > vy1):
+                            continue
+                    path = paths.get(c)
+                    if path is None:
+                        path = paths[c] = renderer.CreatePath()
+                    path.MoveToPoint(p0.x, p0.y)
+                    path.AddLineToPoint(p1.x, p1.y)
+                    path.AddLineToPoint(p2.x, p2.y)
+                    path.CloseSubpath()
+                    drawn += 1
+            if overlap:
+                # Finish this shape's paths before the next draws over it
+                fills.extend(self.flush_paths(paths, brush_map))
+        fills.extend(self.flush_paths(paths, brush_map))
+        g_perf.drawn_triangles = drawn
+        self._fills_rec_list = g_state.rec_list
+        self._fills_view = view
+        self._fills = fills
+        return fills
+
+    def flush_paths(self, paths, brush_map):
+        out = []
+        for c,path in paths.items():
+            b = brush_map.get(c)
+            if b is None:
+                brush_map[c] = b = wx.Brush(colour_from_name(c))
+            out.append((b, path))
+        paths.clear()
+        return out
+
     def draw_gc(self, dc):
         if g_state.rec_list is None:
             return
 
+        frame_start = default_timer()
+        path_s = fill_s = 0.0
+        brush_switches = 0
         gc = wx.GraphicsContext.Create(dc)
-        xs,ys = get_scale(gc.GetSize())
+        w,h = gc.GetSize()
+        xs,ys,ox,oy = get_view((w, h))
+        # Zoom and pan everything but the HUD
+        gc.PushState()
+        gc.Translate(ox, oy)
 
         if g_controls.do_draw_recursion:
-            brush_map = {}
-            brushes = []
-            paths = []
-            for tlist in g_state.rec_list:
-                for c,poly in tlist:
-                    path = gc.CreatePath()
-                    for n,point in enumerate(poly.points):
-                        x = point.x * xs
-                        y = point.y * ys
-                        if n == 0:
-                            path.MoveToPoint(x, y)
-                        else:
-                            path.AddLineToPoint(x, y)
-                    path.CloseSubpath()
-                    b = brush_map.get(c, None)
-                    if b == None:
-                        brush_map[c] = b = wx.Brush(colour_from_name(c))
-                    brushes.append(b)
-                    paths.append(path)
-
-            for b,p in zip(brushes, paths):
+            start = default_timer()
+            fills = self.get_fills(gc, (xs, ys, ox, oy, w, h))
+            path_s = default_timer() - start
+
+            start = default_timer()
+            # Paths are in canvas coordinates
+            gc.PushState()
+            gc.Scale(xs, ys)
+            for b,p in fills:
                 gc.SetBrush(b)
-                gc.FillPath(p)
+                gc.FillPath(p, wx.WINDING_RULE)
+            gc.PopState()
+            brush_switches = len(fills)
+            fill_s = default_timer() - start
         else:
-            if g_controls.bg_bitmap:
+            if g_controls.bg_image:
                 bgw = (g_state.project.canvas[2] - g_state.project.canvas[0]) * xs
                 bgh = (g_state.project.canvas[3] - g_state.project.canvas[1]) * ys
-                gc.DrawBitmap(g_controls.bg_bitmap, 0, 0, bgw, bgh)
+                # Already at view size, drawn unscaled
+                visible = g_controls.bg_image.bitmap(bgw, bgh, ox, oy, w, h)
+                if visible:
+                    bmp,x,y = visible
+                    gc.DrawBitmap(bmp, x, y, bmp.GetWidth(), bmp.GetHeight())
 
         if not g_controls.do_hide_guide_lines:
             gc.SetPen(wx.Pen('black', 3))
@@ -642,6 +1067,68 @@ class GraphicsContextDrawPanel(BaseDrawPanel):
             path.CloseSubpath()
             gc.DrawPath(path)
 
+        gc.PopState()
+
+        if g_controls.do_draw_recursion and g_state.truncated:
+            self.draw_budget_warning(gc, h)
+
+        # HUD itself isn't part of the measured frame
+        g_perf.add_frame(default_timer() - frame_start, path_s, fill_s, brush_switches)
+        if g_controls.do_show_hud:
+            self.draw_hud(gc)
+
+    def draw_budget_warning(self, gc, h):
+        shapes = ', '.join(str(i + 1) for i in g_state.truncated[:10])
+        if len(g_state.truncated) > 10:
+            shapes += ' and %d more' % (len(g_state.truncated) - 10)
+        text = 'Preview limited to %d triangles, shown at lower depth: %s' % (g_controls.preview_budget, shapes)
+        f = wx.Font(pointSize=9, family=wx.FONTFAMILY_DEFAULT, style=wx.FONTSTYLE_NORMAL, weight=wx.FONTWEIGHT_BOLD)
+        gc.SetFont(f, wx.RED)
+        gc.DrawText(text, 8, h - 20, gc.CreateBrush(wx.Brush(wx.Colour(255, 255, 255, 210))))
+
+    def draw_hud(self, gc):
+        frame_s, path_s, fill_s, brush_switches = g_perf.last()
+        avg_s = g_perf.avg_frame_s()
+        over_budget = (avg_s > HUD_FRAME_BUDGET) or (g_perf.recursion_s > HUD_FRAME_BUDGET)
+        stopped = ''
+        if g_perf.stopped_by_step or g_perf.stopped_by_footer:
+            stopped = ', stopped: %d step %d footer' % (g_perf.stopped_by_step, g_perf.stopped_by_footer)
+        lines = [
+            'Recursion %7.1f ms  %d tris%s' % (g_perf.recursion_s * 1000.0, g_perf.triangles, stopped),
+            'Paths     %7.1f ms  %d tris drawn' % (path_s * 1000.0, g_perf.drawn_triangles),
+            'Fill      %7.1f ms  %d brush switches' % (fill_s * 1000.0, brush_switches),
+            'Frame     %7.1f ms  avg %.1f ms  %.0f fps' % (frame_s * 1000.0, avg_s * 1000.0,
+                                                          (1.0 / avg_s) if avg_s > 0 else 0),
+        ]
+        if over_budget:
+            lines.append('OVER %.0f ms FRAME BUDGET' % (HUD_FRAME_BUDGET * 1000.0))
+        line_h = 15
+        hist_h = 40
+        w = 330
+        h = len(lines) * line_h + hist_h + 30
+        gc.SetPen(wx.Pen('black', 1))
+        gc.SetBrush(wx.Brush(wx.Colour(255, 255, 255, 210)))
+        gc.DrawRectangle(5, 5, w, h)
+        f = wx.Font(pointSize=9, family=wx.FONTFAMILY_TELETYPE, style=wx.FONTSTYLE_NORMAL, weight=wx.FONTWEIGHT_NORMAL)
+        for i,line in enumerate(lines):
+            is_warning = over_budget and (i == len(lines) - 1)
+            gc.SetFont(f, wx.RED if is_warning else wx.BLACK)
+            gc.DrawText(line, 10, 8 + i * line_h)
+        # Histogram of the last HUD_FRAME_WINDOW frame times
+        counts = g_perf.histogram()
+        top = 12 + len(lines) * line_h
+        bar_w = (w - 10) / float(len(counts))
+        peak = max(max(counts), 1)
+        gc.SetFont(f, wx.BLACK)
+        for i,(n,edge) in enumerate(zip(counts, HUD_HISTOGRAM_EDGES)):
+            bh = hist_h * n / float(peak)
+            slow = (edge is None) or (edge > HUD_FRAME_BUDGET)
+            gc.SetPen(wx.TRANSPARENT_PEN)
+            gc.SetBrush(wx.Brush(wx.RED if slow else wx.Colour(0, 160, 0)))
+            gc.DrawRectangle(10 + i * bar_w, top + hist_h - bh, bar_w - 2, max(bh, 1))
+            label = ('<%gms' % (edge * 1000.0)) if edge else 'more'
+            gc.DrawText(label, 10 + i * bar_w, top + hist_h + 2)
+
     #
     # Events
     #
@@ -675,11 +1162,25 @@ class ControlsPanel(wx.Panel):
         chk1 = wx.CheckBox(parent=self, id=ID_CHK_SNAP, label='Snapping')
         chk2 = wx.CheckBox(parent=self, id=ID_CHK_HIDE_GUIDE, label='Hide Guide Lines')
         chk3 = wx.CheckBox(parent=self, id=ID_CHK_HIDE_NUM, label='Hide Shape #\'s')
+        chk4 = wx.CheckBox(parent=self, id=ID_CHK_HUD, label='Show HUD (h)')
+        lod_label = wx.StaticText(parent=self, label='Detail Cutoff (px)')
+        sp1 = wx.SpinCtrlDouble(parent=self, id=ID_SP_LOD_PIXELS, min=0.0, max=50.0, inc=0.25,
+                                initial=g_controls.lod_pixels, style=wx.SP_ARROW_KEYS|wx.ALIGN_RIGHT)
+        sp1.SetDigits(2)
+        budget_label = wx.StaticText(parent=self, label='Preview Triangles (0 = all)')
+        sp2 = wx.SpinCtrl(parent=self, id=ID_SP_PREVIEW_BUDGET, min=0, max=10000000,
+                          initial=g_controls.preview_budget, style=wx.SP_ARROW_KEYS|wx.ALIGN_RIGHT)
+        lod = wx.BoxSizer(wx.VERTICAL)
+        lod.AddF(lod_label, wx.SizerFlags().Left())
+        lod.AddF(sp1, wx.SizerFlags().Left())
+        lod.AddF(budget_label, wx.SizerFlags().Left())
+        lod.AddF(sp2, wx.SizerFlags().Left())
         sf = wx.SizerFlags().Left()
         checks = wx.BoxSizer(wx.VERTICAL)
         checks.AddF(chk1, sf)
         checks.AddF(chk2, sf)
         checks.AddF(chk3, sf)
+        checks.AddF(chk4, sf)
         rbox1 = wx.RadioBox(parent=self, label='Preview',
                             id=ID_RAD_PREVIEW,
                             choices=['Guide Lines', 'Recursion'],
@@ -693,7 +1194,7 @@ class ControlsPanel(wx.Panel):
         sizer = wx.BoxSizer(wx.HORIZONTAL)
         sizer.AddStretchSpacer()
         sf = wx.SizerFlags().Center().DoubleBorder()
-        for c in [btn1, btn2, checks, rbox1, rbox2]:
+        for c in [btn1, btn2, checks, rbox1, rbox2, lod]:
             sizer.AddF(c, sf)
         sizer.AddStretchSpacer()
         self.SetAutoLayout(True)
@@ -703,6 +1204,8 @@ class ControlsPanel(wx.Panel):
         chk1.SetValue(g_controls.do_point_snapping)
         chk2.SetValue(g_controls.do_hide_guide_lines)
         chk3.SetValue(g_controls.do_hide_shape_numbers)
+        chk4.SetValue(g_controls.do_show_hud)
+        self._chk_hud = chk4
         rbox1.SetSelection(1 if g_controls.do_draw_recursion else 0)
 
         # Events
@@ -711,8 +1214,11 @@ class ControlsPanel(wx.Panel):
         chk1.Bind(wx.EVT_CHECKBOX, self.OnSnap)
         chk2.Bind(wx.EVT_CHECKBOX, self.OnHideGuide)
         chk3.Bind(wx.EVT_CHECKBOX, self.OnHideNum)
+        chk4.Bind(wx.EVT_CHECKBOX, self.OnHud)
         rbox1.Bind(wx.EVT_RADIOBOX, self.OnPreview)
         rbox2.Bind(wx.EVT_RADIOBOX, self.OnAspectRatio)
+        sp1.Bind(wx.EVT_SPINCTRLDOUBLE, self.OnLodPixels)
+        sp2.Bind(wx.EVT_SPINCTRL, self.OnPreviewBudget)
 
     #
     # Events
@@ -739,6 +1245,17 @@ class ControlsPanel(wx.Panel):
         g_controls.do_hide_shape_numbers = evt.Checked()
         self.GetParent().force_redraw()
 
+    def OnHud(self, evt):
+        self.set_hud(evt.Checked())
+
+    def set_hud(self, show):
+        g_controls.do_show_hud = show
+        self._chk_hud.SetValue(show)
+        if show:
+            # Re-generate once so recursion timings and stats are current
+            g_state.rec_list, g_state.truncated = regenerate(g_state.project)
+        self.GetParent().force_redraw()
+
     def OnPreview(self, evt):
         g_controls.do_draw_recursion = (evt.GetInt() == 1)
         self.GetParent().force_redraw()
@@ -747,6 +1264,15 @@ class ControlsPanel(wx.Panel):
         g_controls.aspect_ratio_fit = (evt.GetInt() == 0)
         self.GetParent().force_redraw()
 
+    def OnLodPixels(self, evt):
+        g_controls.lod_pixels = evt.GetValue()
+        self.GetParent().force_redraw()
+
+    def OnPreviewBudget(self, evt):
+        g_controls.preview_budget = evt.GetInt()
+        g_state.rec_list, g_state.truncated = regenerate(g_state.project)
+        self.GetParent().force_redraw()
+
 
 class MainFrame(wx.Frame):
     def __init__(self, parent, title, size):
@@ -760,6 +1286,7 @@ class MainFrame(wx.Frame):
         file_menu.Append(wx.ID_SAVEAS, "", "Save Project As")
         file_menu.Append(ID_EXPORT_FULL, "Export", "Export Full SVG");
         file_menu.Append(ID_EXPORT_INDIVIDUAL, "Export Shapes", "Export Individual SVGs");
+        file_menu.Append(ID_EXPORT_TILES, "Export Tiles", "Export Bed Sized SVG Tiles");
         file_menu.Append(wx.ID_EXIT, "", "")
         # Edit menu
         edit_menu = wx.Menu()
@@ -789,6 +1316,7 @@ class MainFrame(wx.Frame):
         self.Bind(wx.EVT_MENU, self.OnSaveAs, id=wx.ID_SAVEAS)
         self.Bind(wx.EVT_MENU, self.OnExportFull, id=ID_EXPORT_FULL)
         self.Bind(wx.EVT_MENU, self.OnExportIndividual, id=ID_EXPORT_INDIVIDUAL)
+        self.Bind(wx.EVT_MENU, self.OnExportTiles, id=ID_EXPORT_TILES)
         self.Bind(wx.EVT_MENU, self.OnExit, id=wx.ID_EXIT)
         # Edit
         self.Bind(wx.EVT_MENU, self.OnUndo, id=wx.ID_UNDO)
@@ -819,18 +1347,20 @@ class MainFrame(wx.Frame):
         self.Update()
         self.Refresh()
 
-    def post_paint(self, start_time):
-        end_time = time.clock()
-        fps = int(1 / (end_time - start_time))
+    def post_paint(self):
         w,h = self._draw_panel.GetSize()
         x,y = self._draw_panel.ScreenToClient(wx.GetMousePosition())
-        #self.SetStatusText('Canvas: %dx%d  Cursor: (%d,%d)  FPS: %d' % (w,h,x,y,fps))
-        self.SetStatusText('Canvas: %dx%d  Cursor: (%d,%d)' % (w,h,x,y))
+        if g_controls.do_show_hud:
+            frame_s = g_perf.last()[0]
+            self.SetStatusText('Canvas: %dx%d  Cursor: (%d,%d)  Zoom: %g  Frame: %.1f ms  Recursion: %.1f ms' %
+                               (w,h,x,y, g_controls.view_zoom, frame_s * 1000.0, g_perf.recursion_s * 1000.0))
+        else:
+            self.SetStatusText('Canvas: %dx%d  Cursor: (%d,%d)  Zoom: %g' % (w,h,x,y, g_controls.view_zoom))
 
     def save_internal(self, title, default_filename, keep_filename):
         filename = default_filename
         if not filename:
-            dlg = wx.FileDialog(self, title, "", "", "JSON Files (*.json)|*.json", wx.FD_SAVE|wx.FD_OVERWRITE_PROMPT)
+            dlg = wx.FileDialog(self, title, "", "", "Projects (*.json;*.vrwc)|*.json;*.vrwc", wx.FD_SAVE|wx.FD_OVERWRITE_PROMPT)
             if dlg.ShowModal() == wx.ID_OK:
                 filename = dlg.GetPath()
             dlg.Destroy()
@@ -849,7 +1379,7 @@ class MainFrame(wx.Frame):
         dlg.Destroy()
 
     def OnOpen(self, evt):
-        dlg = wx.FileDialog(self, "Open project file", "", "", "JSON Files (*.json)|*.json", wx.OPEN|wx.FD_FILE_MUST_EXIST)
+        dlg = wx.FileDialog(self, "Open project file", "", "", "Projects (*.json;*.vrwc)|*.json;*.vrwc", wx.OPEN|wx.FD_FILE_MUST_EXIST)
         if dlg.ShowModal() == wx.ID_OK:
             filename = dlg.GetPath()
             load_project(filename)
@@ -863,17 +1393,36 @@ class MainFrame(wx.Frame):
         self.save_internal("Save project file as", None, False)
 
     def OnExportFull(self, evt):
-        dlg = wx.FileDialog(self, "Export SVG file", "", "", "SVG Files (*.svg)|*.svg", wx.FD_SAVE|wx.FD_OVERWRITE_PROMPT)
+        dlg = wx.FileDialog(self, "Export SVG file", "", "", "SVG Files (*.svg)|*.svg|Compressed SVG Files (*.svgz)|*.svgz|DXF Files (*.dxf)|*.dxf|Triangle Mesh Files (*.vrwm)|*.vrwm",
+                            wx.FD_SAVE|wx.FD_OVERWRITE_PROMPT)
         if dlg.ShowModal() == wx.ID_OK:
             filename = dlg.GetPath()
-            export_full(filename)
+            export_full(filename, self)
         dlg.Destroy()
 
     def OnExportIndividual(self, evt):
         dlg = wx.DirDialog(parent=self)
         if dlg.ShowModal() == wx.ID_OK:
             directory = dlg.GetPath()
-            export_individual(directory)
+            export_individual(directory, self)
+        dlg.Destroy()
+
+    def OnExportTiles(self, evt):
+        c = g_state.project.canvas
+        default = '%g, %g, 0' % ((c[2] - c[0]) / 2.0, (c[3] - c[1]) / 2.0)
+        text = wx.GetTextFromUser('Tile width, height and overlap in canvas units', 'Export Tiles',
+                                  default, parent=self)
+        if not text:
+            return
+        try:
+            width,height,overlap = [float(v) for v in text.split(',')]
+            TileGrid(c, width, height, overlap)
+        except ValueError as e:
+            wx.MessageBox(str(e) or 'Expected width, height, overlap', 'Export Tiles', wx.OK|wx.ICON_ERROR)
+            return
+        dlg = wx.DirDialog(parent=self)
+        if dlg.ShowModal() == wx.ID_OK:
+            export_tiled(dlg.GetPath(), width, height, overlap, self)
         dlg.Destroy()
 
     def OnExit(self, evt):
@@ -894,8 +1443,7 @@ class MainFrame(wx.Frame):
         self.force_redraw()
 
     def OnPaint(self, evt):
-        start_time = time.clock()
-        wx.CallAfter(self.post_paint, start_time)
+        wx.CallAfter(self.post_paint)
 
 
 class AttrFrame(wx.Frame):
@@ -1164,9 +1712,16 @@ class AttrFrame(wx.Frame):
 
     def regen_recursion(self):
         # TODO: Only need to re-generate g_state.selected_shape's
-        g_state.rec_list = generate_recursion(g_state.project)
+        g_state.rec_list, g_state.truncated = regenerate(g_state.project)
         g_app.force_redraw_internal()
 
+    def edit_shape(self, s, index=None):
+        """ edit_shape(), the panel stays on s if it was showing it """
+        e = edit_shape(s, index)
+        if self._last_shape is s:
+            self._last_shape = e
+        return e
+
     def set_enabled_recursive(self, ctrl, enabled):
         for c in ctrl.GetChildren():
             ctrl.Enable(enabled)
@@ -1220,6 +1775,7 @@ class AttrFrame(wx.Frame):
         s = g_state.selected_shape
         clockwise = (evt.GetInt() == 0)
         if s.clockwise != clockwise:
+            s = self.edit_shape(s)
             s.clockwise = clockwise
             self.regen_recursion()
 
@@ -1227,6 +1783,7 @@ class AttrFrame(wx.Frame):
         s = g_state.selected_shape
         d = evt.GetPosition()
         if (s is not None) and (d != s.depth):
+            s = self.edit_shape(s)
             s.depth = d
             self._s_sp_depth.SetValue(d)
             self.regen_recursion()
@@ -1235,6 +1792,7 @@ class AttrFrame(wx.Frame):
         s = g_state.selected_shape
         d = evt.GetInt()
         if (s is not None) and (d != s.depth):
+            s = self.edit_shape(s)
             s.depth = d
             self._s_sl_depth.SetValue(d)
             self.regen_recursion()
@@ -1250,6 +1808,7 @@ class AttrFrame(wx.Frame):
         # [0,1000] -> [0.0,1.0]
         step = (evt.GetPosition() / 1000.0)
         if (s is not None) and (step != s.step):
+            s = self.edit_shape(s)
             s.step = step
             self._s_sp_step.SetValue(s.step)
             self.regen_recursion()
@@ -1258,6 +1817,7 @@ class AttrFrame(wx.Frame):
         s = g_state.selected_shape
         step = evt.GetValue()
         if (s is not None) and (step != s.step):
+            s = self.edit_shape(s)
             s.step = step
             self._s_sl_step.SetValue(step * 1000)
             self.regen_recursion()
@@ -1273,6 +1833,7 @@ class AttrFrame(wx.Frame):
         # [0,1000] -> [0.0,0.1]
         i = (evt.GetPosition() / 10000.0)
         if (s is not None) and (i != s.inc):
+            s = self.edit_shape(s)
             s.inc = i
             self._s_sp_inc.SetValue(i)
             self.regen_recursion()
@@ -1281,6 +1842,7 @@ class AttrFrame(wx.Frame):
         s = g_state.selected_shape
         inc = evt.GetValue()
         if (s is not None) and (inc != s.inc):
+            s = self.edit_shape(s)
             s.inc = inc
             self._s_sl_inc.SetValue(inc * 10000)
             self.regen_recursion()
@@ -1294,12 +1856,14 @@ class AttrFrame(wx.Frame):
     def OnShapeReverseColors(self, evt):
         s = g_state.selected_shape
         if s:
+            s = self.edit_shape(s)
             s.reverse_colors = evt.Checked()
             self.regen_recursion()
 
     def OnShapeDisabled(self, evt):
         s = g_state.selected_shape
         if s:
+            s = self.edit_shape(s)
             s.disabled = evt.Checked()
             self.regen_recursion()
 
@@ -1308,6 +1872,7 @@ class AttrFrame(wx.Frame):
         # [0,1000] -> [0.0,1.0]
         footer = (evt.GetPosition() / 1000.0)
         if (s is not None) and (footer != s.footer):
+            s = self.edit_shape(s)
             s.footer = footer
             self._s_sp_footer.SetValue(footer)
             self.regen_recursion()
@@ -1316,6 +1881,7 @@ class AttrFrame(wx.Frame):
         s = g_state.selected_shape
         footer = evt.GetValue()
         if (s is not None) and (footer != s.footer):
+            s = self.edit_shape(s)
             s.footer = footer
             self._s_sl_footer.SetValue(footer * 1000)
             self.regen_recursion()
@@ -1331,6 +1897,7 @@ class AttrFrame(wx.Frame):
         # [0,1000] -> [0.0,1.0]
         inc = (evt.GetPosition() / 1000.0)
         if (s is not None) and (inc != s.footer_inc):
+            s = self.edit_shape(s)
             s.footer_inc = inc
             self._s_sp_footer_inc.SetValue(inc)
             self.regen_recursion()
@@ -1339,6 +1906,7 @@ class AttrFrame(wx.Frame):
         s = g_state.selected_shape
         inc = evt.GetValue()
         if (s is not None) and (inc != s.footer_inc):
+            s = self.edit_shape(s)
             s.footer_inc = inc
             self._s_sl_footer_inc.SetValue(inc * 1000)
             self.regen_recursion()
@@ -1353,6 +1921,7 @@ class AttrFrame(wx.Frame):
         s = g_state.selected_shape
         offset = evt.GetPosition()
         if (s is not None) and (offset != s.footer_offset):
+            s = self.edit_shape(s)
             s.footer_offset = offset
             self._s_sp_footer_offset.SetValue(offset)
             self.regen_recursion()
@@ -1361,6 +1930,7 @@ class AttrFrame(wx.Frame):
         s = g_state.selected_shape
         offset = evt.GetInt()
         if (s is not None) and (offset != s.footer_offset):
+            s = self.edit_shape(s)
             s.footer_offset = offset
             self._s_sl_footer_offset.SetValue(offset)
             self.regen_recursion()
@@ -1376,8 +1946,8 @@ class AttrFrame(wx.Frame):
         step = (evt.GetPosition() / 1000.0)
         if g_project_defaults.step != step:
             g_project_defaults.step = step
-            for s in g_state.project.shapes:
-                s.step = step
+            for i,s in enumerate(g_state.project.shapes):
+                self.edit_shape(s, i).step = step
             self._g_sp_step.SetValue(step)
             self.update_shape(force=True)
             self.regen_recursion()
@@ -1386,8 +1956,8 @@ class AttrFrame(wx.Frame):
         step = evt.GetValue()
         if g_project_defaults.step != step:
             g_project_defaults.step = step
-            for s in g_state.project.shapes:
-                s.step = step
+            for i,s in enumerate(g_state.project.shapes):
+                self.edit_shape(s, i).step = step
             self._g_sl_step.SetValue(step * 1000)
             self.update_shape(force=True)
             self.regen_recursion()
@@ -1410,8 +1980,8 @@ class AttrFrame(wx.Frame):
         if g_state.project.canvas[2] != w:
             # Scale all points x values
             xs = float(w) / g_state.project.canvas[2]
-            for s in g_state.project.shapes:
-                for p in s.poly.points:
+            for i,s in enumerate(g_state.project.shapes):
+                for p in self.edit_shape(s, i).poly.points:
                     p.x *= xs
             g_state.project.canvas[2] = w
             post_project_modification()
@@ -1426,8 +1996,8 @@ class AttrFrame(wx.Frame):
         if g_state.project.canvas[3] != h:
             # Scale all points y values
             ys = float(h) / g_state.project.canvas[3]
-            for s in g_state.project.shapes:
-                for p in s.poly.points:
+            for i,s in enumerate(g_state.project.shapes):
+                for p in self.edit_shape(s, i).poly.points:
                     p.y *= ys
             g_state.project.canvas[3] = h
             post_project_modification()
@@ -1441,11 +2011,11 @@ class AttrFrame(wx.Frame):
         if dlg.ShowModal() == wx.ID_OK:
             filename = dlg.GetPath()
             print 'Loading bg image file', filename
-            img = wx.Image(filename)
-            if img.IsOk():
-                g_controls.bg_bitmap = wx.BitmapFromImage(img)
+            g_controls.bg_loading = filename
+            t = threading.Thread(target=load_bg_image, args=(filename,))
+            t.daemon = True
+            t.start()
         dlg.Destroy()
-        g_app.force_redraw_internal()
 
 class App(wx.App):
     def OnInit(self):
@@ -1523,6 +2093,12 @@ class App(wx.App):
         elif kc == ord('X'):
             self._frame._control_panel.OnDelLine(None)
             return
+        elif kc == ord('H'):
+            self._frame._control_panel.set_hud(not g_controls.do_show_hud)
+            return
+        elif g_state.do_num_hotkey and (kc == ord('0')):
+            reset_view()
+            do_update = True
         if do_update:
             g_app.force_redraw()
         else:
@@ -1531,8 +2107,14 @@ class App(wx.App):
 
 if __name__ == '__main__':
     import sys
+    # Export worker processes in frozen builds
+    multiprocessing.freeze_support()
     g_app = App()
     g_undo_stack.set_callback(lambda x: g_app._frame.set_undo_state(x))
+    try:
+        g_controls.rec_cache = RecursionCache(default_cache_dir())
+    except (IOError, OSError) as e:
+        print 'Recursion cache disabled:', e
     if len(sys.argv) > 1:
         load_project(sys.argv[1])
     else:
@@ -0,0 +1,180 @@
+#
+# Vector Recursion Workbench
+# Copyright (c) 2014-2016 Nathan Williams, Jason Fletcher
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+import math
+import os
+import shutil
+import sys
+from timeit import default_timer
+
+from project import project
+from recursion_excursion import generate_recursion
+from recursion_cache import GeometryCache
+from export import WorkerPool, add_jobs_argument, write_svg
+from rasterize import rasterize
+from sweep import apply_variant
+
+# Parameters that can be tweened, and how their in between values are kept
+TWEEN_PARAMS = {
+    'depth': lambda v: max(1, int(round(v))),
+    'step': float,
+    'inc': float,
+    'footer': float,
+    'footer_inc': float,
+}
+
+# Shape recursions kept per worker between its frames
+FRAME_CACHE_ENTRIES = 256
+
+# One per worker process, see frame_cache()
+_frame_cache = None
+
+
+def frame_cache():
+    """ Worker's GeometryCache, so frames it renders share triangles """
+    global _frame_cache
+    if _frame_cache is None:
+        _frame_cache = GeometryCache(FRAME_CACHE_ENTRIES)
+    return _frame_cache
+
+
+def ease_in_out(t):
+    return 0.5 - 0.5 * math.cos(math.pi * t)
+
+
+def tween_frames(params, frames, ease=False):
+    """ Override dicts for each frame, params are [(name, start, end)] """
+    out = []
+    for n in range(frames):
+        t = (n / float(frames - 1)) if frames > 1 else 0.0
+        if ease:
+            t = ease_in_out(t)
+        out.append(dict((name, TWEEN_PARAMS[name](start + (end - start) * t)) for name,start,end in params))
+    return out
+
+
+def frame_filename(index, ext):
+    return 'frame_%05d.%s' % (index + 1, ext)
+
+
+def render_frame(args):
+    """ Worker: writes one frame, returns its filename """
+    filename,proj,raster = args
+    cache = frame_cache()
+    if raster is None:
+        write_svg(filename, proj.canvas, generate_recursion(proj, cache))
+    else:
+        width,height,supersample,background = raster
+        rasterize(proj, filename, width, height, supersample, 1, background, cache=cache)
+    return filename
+
+
+def render_animation(directory, proj, params, frames, shapes=None, raster=None, jobs=None, ease=False,
+                     progress=None):
+    """
+        Write frames SVGs (or PNGs if raster is (width, height, supersample,
+        background)) of params [(name, start, end)] tweened over the shapes
+        indexed by shapes (default: all). Frames are rendered by jobs worker
+        processes, each keeping the triangles of the frames it rendered, so
+        only what a frame changes is generated again. At most two frames
+        per worker are in flight and they complete in order, so memory does
+        not grow with the number of frames. Frames identical to the one
+        before are copied. progress, if given, is called with (frame index,
+        filename) in order. Returns the filenames.
+    """
+    for name,start,end in params:
+        if name not in TWEEN_PARAMS:
+            raise ValueError('Cannot tween %s, one of: %s' % (name, ', '.join(sorted(TWEEN_PARAMS))))
+    overrides = tween_frames(params, frames, ease)
+    # Check every frame before starting anything
+    for o in overrides:
+        apply_variant(proj, o, shapes)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    ext = 'svg' if raster is None else 'png'
+    filenames = [os.path.join(directory, frame_filename(i, ext)) for i in range(len(overrides))]
+    # Frames the same as the one before are copied rather than rendered
+    changed = [(i == 0) or (o != overrides[i - 1]) for i,o in enumerate(overrides)]
+    args = ((filenames[i], apply_variant(proj, o, shapes), raster) for i,o in enumerate(overrides) if changed[i])
+    written = []
+    with WorkerPool(jobs, changed.count(True)) as pool:
+        rendered = pool.map(render_frame, args)
+        for index,filename in enumerate(filenames):
+            if changed[index]:
+                next(rendered)
+            else:
+                shutil.copyfile(written[-1], filename)
+            written.append(filename)
+            if progress is not None:
+                progress(index, filename)
+    return written
+
+
+def parse_tween_param(text):
+    """ name=start:end """
+    name, sep, values = text.partition('=')
+    start, colon, end = values.partition(':')
+    if (not sep) or (not colon) or (name not in TWEEN_PARAMS):
+        raise ValueError('Expected name=start:end with name one of: %s' % ', '.join(sorted(TWEEN_PARAMS)))
+    return name, float(start), float(end)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Render frames of shape parameters tweened over time.')
+    parser.add_argument('project', help='project JSON file')
+    parser.add_argument('params', nargs='+', metavar='name=start:end',
+                        help='parameter and its first and last frame values, e.g. step=0.1:0.4 depth=5:60')
+    parser.add_argument('-n', '--frames', type=int, default=60, help='number of frames (default: 60)')
+    parser.add_argument('-s', '--shapes', help='comma separated shape numbers to change (default: all)')
+    parser.add_argument('-o', '--output-dir', metavar='DIR',
+                        help='write frames to DIR (default: directory named after the project)')
+    add_jobs_argument(parser)
+    parser.add_argument('--ease', action='store_true', help='ease in and out instead of a linear tween')
+    parser.add_argument('--png', action='store_true', help='write PNG frames instead of SVG')
+    parser.add_argument('-W', '--width', type=int, default=1920, help='PNG width in pixels (default: 1920)')
+    parser.add_argument('-H', '--height', type=int, default=None,
+                        help='PNG height in pixels (default: keep the canvas aspect ratio)')
+    parser.add_argument('--supersample', type=int, default=1,
+                        help='PNG samples per pixel along each axis (default: 1)')
+    parser.add_argument('--background', default='#FFFFFF', help='PNG background color (default: #FFFFFF)')
+    args = parser.parse_args()
+    try:
+        params = [parse_tween_param(p) for p in args.params]
+    except ValueError as e:
+        parser.error(str(e))
+    if args.frames < 1:
+        parser.error('--frames must be at least 1')
+    shapes = None
+    if args.shapes:
+        shapes = set(int(n) - 1 for n in args.shapes.split(','))
+    raster = (args.width, args.height, args.supersample, args.background) if args.png else None
+    proj = project.load_file(args.project)
+    output_dir = args.output_dir or (os.path.splitext(args.project)[0] + '_frames')
+    start = default_timer()
+    def report(index, filename):
+        sys.stdout.write('\r%d of %d frames' % (index + 1, args.frames))
+        sys.stdout.flush()
+    written = render_animation(output_dir, proj, params, args.frames, shapes, raster, args.jobs, args.ease, report)
+    print '\n%d frames in %.2fs in %s' % (len(written), default_timer() - start, output_dir)
@@ -0,0 +1,205 @@
+#
+# Vector Recursion Workbench
+# Copyright (c) 2014-2016 Nathan Williams, Jason Fletcher
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+import glob
+import os
+import sys
+from timeit import default_timer
+
+from project import project
+from recursion_excursion import ENGINE_VERSION, generate_recursion
+from export import Manifest, WorkerPool, add_jobs_argument, export_shapes, file_hash, write_svg
+
+
+class BatchJob(object):
+    def __init__(self, input_filename, output_dir, shapes, cache_dir):
+        self.input_filename = input_filename
+        self.name = os.path.splitext(os.path.basename(input_filename))[0]
+        self.output_dir = output_dir
+        self.svg_filename = os.path.join(output_dir, self.name + '.svg')
+        # Per-shape SVGs go in a directory named after the project
+        self.shapes_dir = os.path.join(output_dir, self.name) if shapes else None
+        self.cache_dir = cache_dir
+
+    def input_hash(self):
+        return file_hash(self.input_filename, ENGINE_VERSION, bool(self.shapes_dir))
+
+    def outputs_exist(self):
+        if not os.path.exists(self.svg_filename):
+            return False
+        return (self.shapes_dir is None) or os.path.isdir(self.shapes_dir)
+
+
+class BatchResult(object):
+    def __init__(self, job):
+        self.job = job
+        self.skipped = False
+        self.error = None
+        self.triangles = 0
+        self.bytes_written = 0
+        self.files_written = 0
+        self.seconds = 0.0
+
+
+def render_job(job):
+    """ Worker: render one project, never raises so the pool keeps going """
+    result = BatchResult(job)
+    start = default_timer()
+    try:
+        cache = None
+        if job.cache_dir:
+            from recursion_cache import RecursionCache
+            cache = RecursionCache(job.cache_dir)
+        proj = project.load_file(job.input_filename)
+        rec_list = generate_recursion(proj, cache)
+        result.triangles = sum(len(r) for r in rec_list)
+        written = [job.svg_filename]
+        write_svg(job.svg_filename, proj.canvas, rec_list)
+        if job.shapes_dir:
+            if not os.path.isdir(job.shapes_dir):
+                os.makedirs(job.shapes_dir)
+            written.extend(export_shapes(job.shapes_dir, proj.canvas, rec_list))
+        result.files_written = len(written)
+        result.bytes_written = sum(os.path.getsize(f) for f in written)
+    except Exception as e:
+        result.error = '%s: %s' % (type(e).__name__, e)
+    result.seconds = default_timer() - start
+    return result
+
+
+def expand_inputs(patterns):
+    """ Files, globs and directories (all *.json within) in given order """
+    out = []
+    for p in patterns:
+        if os.path.isdir(p):
+            matches = sorted(glob.glob(os.path.join(p, '*.json')))
+        else:
+            matches = sorted(glob.glob(p)) or [p]
+        for m in matches:
+            if m not in out:
+                out.append(m)
+    return out
+
+
+def run_batch(inputs, output_dir=None, shapes=False, jobs=None, force=False, cache_dir=None, log=sys.stdout):
+    """
+        Render all inputs, returns list of BatchResult in input order.
+        Raises ValueError if two inputs would write the same output, e.g.
+        a/x.json and b/x.json with one output_dir.
+    """
+    all_jobs = []
+    outputs = {}
+    for filename in expand_inputs(inputs):
+        out_dir = output_dir or os.path.dirname(filename) or '.'
+        job = BatchJob(filename, out_dir, shapes, cache_dir)
+        # Also their manifest entry, keyed by name within the directory
+        key = os.path.normcase(os.path.abspath(job.svg_filename))
+        if key in outputs:
+            raise ValueError('%s and %s would both be rendered to %s' %
+                             (outputs[key], filename, job.svg_filename))
+        outputs[key] = filename
+        all_jobs.append(job)
+
+    # Skip anything rendered from identical input
+    manifests = {}
+    todo = []
+    results = {}
+    digests = {}
+    for job in all_jobs:
+        if job.output_dir not in manifests:
+            if not os.path.isdir(job.output_dir):
+                os.makedirs(job.output_dir)
+            manifests[job.output_dir] = Manifest(job.output_dir)
+        try:
+            digests[job.input_filename] = job.input_hash()
+        except IOError as e:
+            r = BatchResult(job)
+            r.error = str(e)
+            results[job.input_filename] = r
+            log.write('FAILED  %s (%s)\n' % (job.input_filename, r.error))
+            continue
+        manifest = manifests[job.output_dir]
+        if (not force) and job.outputs_exist() and manifest.is_current(job.name, digests[job.input_filename]):
+            r = BatchResult(job)
+            r.skipped = True
+            results[job.input_filename] = r
+        else:
+            todo.append(job)
+
+    if todo:
+        try:
+            with WorkerPool(jobs, len(todo), wait=True) as pool:
+                for r in pool.map(render_job, todo, ordered=False):
+                    results[r.job.input_filename] = r
+                    manifest = manifests[r.job.output_dir]
+                    if r.error:
+                        manifest.discard(r.job.name)
+                        log.write('FAILED  %s (%s)\n' % (r.job.input_filename, r.error))
+                    else:
+                        manifest.set(r.job.name, digests[r.job.input_filename])
+                        log.write('%6.2fs  %s\n' % (r.seconds, r.job.input_filename))
+        finally:
+            for m in manifests.values():
+                m.save()
+
+    # Keyed by filename as pool results hold pickled copies of the jobs
+    return [results[j.input_filename] for j in all_jobs]
+
+
+def summarize(results, wall_time, log=sys.stdout):
+    rendered = [r for r in results if not (r.skipped or r.error)]
+    skipped = sum(1 for r in results if r.skipped)
+    failed = sum(1 for r in results if r.error)
+    triangles = sum(r.triangles for r in rendered)
+    cpu_time = sum(r.seconds for r in rendered)
+    mbytes = sum(r.bytes_written for r in rendered) / (1024.0 * 1024.0)
+    files = sum(r.files_written for r in rendered)
+    log.write('\n%d rendered, %d up to date, %d failed in %.2fs (%.2fs in workers)\n' %
+              (len(rendered), skipped, failed, wall_time, cpu_time))
+    if rendered and wall_time > 0:
+        log.write('%d triangles, %d files, %.1f MB written\n' % (triangles, files, mbytes))
+        log.write('%.1f projects/s, %.0f triangles/s, %.1f MB/s\n' %
+                  (len(rendered) / wall_time, triangles / wall_time, mbytes / wall_time))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Render many projects to SVG in parallel.')
+    parser.add_argument('inputs', nargs='+', help='project JSON files, globs or directories')
+    parser.add_argument('-o', '--output-dir', metavar='DIR',
+                        help='write SVGs to DIR (default: next to each project)')
+    parser.add_argument('-s', '--shapes', action='store_true',
+                        help='also export one SVG per shape into a directory named after the project')
+    add_jobs_argument(parser)
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='render even if the input is unchanged since the last run')
+    parser.add_argument('--cache-dir', metavar='DIR',
+                        help='reuse shape recursions cached in DIR across runs')
+    args = parser.parse_args()
+    start = default_timer()
+    try:
+        results = run_batch(args.inputs, args.output_dir, args.shapes, args.jobs, args.force, args.cache_dir)
+    except ValueError as e:
+        parser.error(str(e))
+    summarize(results, default_timer() - start)
+    sys.exit(1 if any(r.error for r in results) else 0)
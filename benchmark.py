@@ -0,0 +1,240 @@
+#
+# Vector Recursion Workbench
+# Copyright (c) 2014-2016 Nathan Williams, Jason Fletcher
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+from timeit import default_timer
+
+from project import project
+from recursion_excursion import ENGINE_VERSION, generate_recursion, generate_recursion_with_stats, generate_svg
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Examples')
+
+# name: (columns, rows, depth), each cell is one square shape
+SYNTHETIC_LAYOUTS = [
+    ('synthetic_grid_4x4_d400', (4, 4, 400)),
+    ('synthetic_grid_16x16_d50', (16, 16, 50)),
+    ('synthetic_grid_32x32_d100', (32, 32, 100)),
+]
+
+TIME_METRICS = ('load_s', 'recursion_s', 'svg_s')
+SIZE_METRICS = ('peak_rss_kb',)
+OUTPUT_METRICS = ('triangles', 'svg_bytes')
+
+
+def synthetic_project_dict(columns, rows, depth, size=1000.0):
+    w = size / columns
+    h = size / rows
+    shapes = []
+    for r in range(rows):
+        for c in range(columns):
+            x = c * w
+            y = r * h
+            shapes.append({
+                'points': [[x, y], [x + w, y], [x + w, y + h], [x, y + h]],
+                'depth': depth,
+                # Vary a little so no two shapes are identical
+                'step': 0.05 + 0.1 * ((r * columns + c) % 7) / 7.0,
+                'inc': 0.0,
+                'clockwise': ((r + c) % 2) == 0,
+                'reverse_colors': (r % 2) == 1,
+                'disabled': False,
+                'footer': 0.0,
+                'footer_inc': 0.0,
+                'footer_offset': 0,
+            })
+    return {'canvas': [0, 0, size, size], 'colors': ['#000000', '#FFFFFF'], 'shapes': shapes}
+
+
+class CountingWriter(object):
+    """ File-like sink that only counts what is written """
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, s):
+        self.bytes += len(s)
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # Bytes on Mac, KB elsewhere
+        peak //= 1024
+    return peak
+
+
+def run_case(args):
+    """ Worker, run in a fresh process per case so peak memory is its own """
+    filename, repeat = args
+    result = {}
+    rss_before = peak_rss_kb()
+    for n in range(repeat):
+        start = default_timer()
+        proj = project.load_file(filename)
+        t_load = default_timer() - start
+        start = default_timer()
+        rec_list = generate_recursion(proj)
+        t_rec = default_timer() - start
+        output = CountingWriter()
+        start = default_timer()
+        generate_svg(proj.canvas, rec_list, output)
+        t_svg = default_timer() - start
+        # Best of repeat, least disturbed by everything else on the machine
+        for k,t in zip(TIME_METRICS, (t_load, t_rec, t_svg)):
+            result[k] = min(result.get(k, t), t)
+        result['triangles'] = sum(len(r) for r in rec_list)
+        result['svg_bytes'] = output.bytes
+        del rec_list
+    rss_after = peak_rss_kb()
+    if rss_after is not None:
+        result['peak_rss_kb'] = rss_after - rss_before
+    # Separate instrumented run so the timings above stay untouched
+    rec_list, stats = generate_recursion_with_stats(proj)
+    r,t,f = stats.phase_totals()
+    result['phases'] = {'recurse_s': r, 'triangulate_s': t, 'footer_s': f}
+    result['stop_reasons'] = stats.stop_reasons()
+    result['iterations'] = sum(s.iterations for s in stats.shapes)
+    return result
+
+
+def collect_cases(examples_dir, synthetic, scratch_dir):
+    cases = []
+    for filename in sorted(glob.glob(os.path.join(examples_dir, '*.json'))):
+        cases.append((os.path.splitext(os.path.basename(filename))[0], filename))
+    if synthetic:
+        for name,(columns, rows, depth) in SYNTHETIC_LAYOUTS:
+            filename = os.path.join(scratch_dir, name + '.json')
+            with open(filename, 'w') as f:
+                json.dump(synthetic_project_dict(columns, rows, depth), f)
+            cases.append((name, filename))
+    return cases
+
+
+def run_benchmarks(examples_dir=EXAMPLES_DIR, synthetic=True, repeat=3, match=None, log=sys.stdout):
+    scratch_dir = tempfile.mkdtemp(prefix='vrw-bench-')
+    try:
+        cases = collect_cases(examples_dir, synthetic, scratch_dir)
+        if match:
+            cases = [c for c in cases if match in c[0]]
+        results = {}
+        # One process per case, never reused
+        pool = multiprocessing.Pool(1, maxtasksperchild=1)
+        try:
+            for name,filename in cases:
+                r = pool.apply(run_case, ((filename, repeat),))
+                results[name] = r
+                log.write('%-32s load %8.4fs  recursion %8.4fs  svg %8.4fs  %8d tris\n' %
+                          (name, r['load_s'], r['recursion_s'], r['svg_s'], r['triangles']))
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    return {
+        'engine_version': ENGINE_VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'cases': results,
+    }
+
+
+def compare(results, baseline, time_threshold, memory_threshold, min_seconds, log=sys.stdout):
+    """ Report differences against baseline, returns number of regressions """
+    regressions = 0
+    for name in sorted(results['cases']):
+        cur = results['cases'][name]
+        old = baseline.get('cases', {}).get(name)
+        if old is None:
+            log.write('NEW         %s\n' % name)
+            continue
+        for k in TIME_METRICS + SIZE_METRICS:
+            if (cur.get(k) is None) or (old.get(k) is None):
+                continue
+            threshold = time_threshold if k in TIME_METRICS else memory_threshold
+            delta = cur[k] - old[k]
+            # Ignore jitter on cases too quick to time reliably
+            if (k in TIME_METRICS) and (max(cur[k], old[k]) < min_seconds):
+                continue
+            if (old[k] > 0) and (delta / float(old[k]) > threshold):
+                regressions += 1
+                log.write('REGRESSION  %s %s: %g -> %g (%+.1f%%)\n' %
+                          (name, k, old[k], cur[k], 100.0 * delta / old[k]))
+            elif (old[k] > 0) and (-delta / float(old[k]) > threshold):
+                log.write('IMPROVED    %s %s: %g -> %g (%+.1f%%)\n' %
+                          (name, k, old[k], cur[k], 100.0 * delta / old[k]))
+        for k in OUTPUT_METRICS:
+            if cur.get(k) != old.get(k):
+                # Not slower, but the output itself changed
+                log.write('CHANGED     %s %s: %s -> %s\n' % (name, k, old.get(k), cur.get(k)))
+    return regressions
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Time loading, recursion and SVG generation over the examples.')
+    parser.add_argument('-o', '--output', default='benchmark.json',
+                        help='write results as JSON to this file (default: benchmark.json)')
+    parser.add_argument('-b', '--baseline', metavar='FILE',
+                        help='compare against results previously written to FILE')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='also write the results to the --baseline file')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='runs per case, the fastest is kept (default: 3)')
+    parser.add_argument('-k', '--match', help='only run cases whose name contains this')
+    parser.add_argument('--examples', default=EXAMPLES_DIR, help='directory of project JSON files')
+    parser.add_argument('--no-synthetic', action='store_true', help='skip the synthetic scaled-up layouts')
+    parser.add_argument('--time-threshold', type=float, default=0.15,
+                        help='relative slowdown counted as a regression (default: 0.15)')
+    parser.add_argument('--memory-threshold', type=float, default=0.20,
+                        help='relative peak memory growth counted as a regression (default: 0.20)')
+    parser.add_argument('--min-seconds', type=float, default=0.01,
+                        help='ignore timings below this many seconds (default: 0.01)')
+    args = parser.parse_args()
+    results = run_benchmarks(args.examples, not args.no_synthetic, args.repeat, args.match)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, sort_keys=True, indent=4, separators=(',', ': '))
+    status = 0
+    if args.baseline:
+        if args.save_baseline:
+            shutil.copyfile(args.output, args.baseline)
+        else:
+            with open(args.baseline, 'r') as f:
+                baseline = json.load(f)
+            if compare(results, baseline, args.time_threshold, args.memory_threshold, args.min_seconds):
+                status = 1
+    sys.exit(status)
@@ -0,0 +1,369 @@
+#
+# Vector Recursion Workbench
+# Copyright (c) 2014-2016 Nathan Williams, Jason Fletcher
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+import collections
+import contextlib
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+
+from recursion_excursion import generate_dxf, generate_svg, open_svgz, shape_colors, shape_recursion
+from recursion_cache import shape_key
+from mesh import MESH_EXT, generate_mesh
+
+MANIFEST_FILENAME = '.vrw-manifest.json'
+
+
+class ExportCancelled(Exception):
+    """ Raised by a progress callback to stop an export """
+    pass
+
+
+def replace_file(src, dst):
+    if os.path.exists(dst):
+        # Windows won't rename over an existing file
+        os.remove(dst)
+    os.rename(src, dst)
+
+
+def new_file_mode(filename):
+    """ Permissions filename gets: those it already has, else what open() would give """
+    try:
+        return os.stat(filename).st_mode & 0o7777
+    except OSError:
+        pass
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+class AtomicFile(object):
+    """
+        Temporary file next to filename, in f. close() renames it over
+        filename, abort() removes it. Named <filename>.XXXXXX.tmp so
+        interrupted writes can be found and cleaned up.
+    """
+    def __init__(self, filename, mode='w'):
+        self.filename = filename
+        directory = os.path.dirname(os.path.abspath(filename))
+        fd, self.tmp = tempfile.mkstemp(prefix=os.path.basename(filename) + '.', suffix='.tmp', dir=directory)
+        self.f = os.fdopen(fd, mode)
+
+    def close(self):
+        self.f.close()
+        # mkstemp() makes it private, the result shouldn't be
+        os.chmod(self.tmp, new_file_mode(self.filename))
+        replace_file(self.tmp, self.filename)
+
+    def abort(self):
+        self.f.close()
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+
+
+@contextlib.contextmanager
+def atomic_write(filename, mode='w'):
+    """ Write to a temporary file next to filename, then rename over it """
+    af = AtomicFile(filename, mode)
+    try:
+        yield af.f
+        af.close()
+    except:
+        af.abort()
+        raise
+
+
+def job_count(jobs=None):
+    """ Worker processes to use for jobs, None meaning one per CPU """
+    return jobs or multiprocessing.cpu_count()
+
+
+def add_jobs_argument(parser):
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='worker processes (default: number of CPUs)')
+
+
+class WorkerPool(object):
+    """
+        Pool of up to jobs worker processes for tasks independent tasks,
+        or none if there is only one of either and map() runs them in this
+        process. tasks None means an open ended stream (e.g. a server),
+        always run in workers. Use in a with block: leaving it early (an
+        exception, ExportCancelled, ctrl-c) terminates the workers, or with
+        wait lets the tasks already started finish first.
+    """
+    def __init__(self, jobs, tasks, wait=False):
+        self.jobs = job_count(jobs) if tasks is None else min(job_count(jobs), tasks)
+        self.wait = wait
+        self.in_process = (tasks is not None) and (self.jobs <= 1)
+        self.pool = None if self.in_process else multiprocessing.Pool(max(1, self.jobs))
+
+    def map(self, func, args, ordered=True):
+        """
+            Yields func(a) for each of args. In order, only two tasks per
+            worker are queued at a time so memory doesn't grow with the
+            number of tasks and stopping early doesn't wait for them all.
+            Otherwise as they finish.
+        """
+        if self.in_process:
+            for a in args:
+                yield func(a)
+        elif not ordered:
+            for r in self.pool.imap_unordered(func, args):
+                yield r
+        else:
+            running = collections.deque()
+            for a in args:
+                running.append(self.pool.apply_async(func, (a,)))
+                if len(running) >= 2 * self.jobs:
+                    yield running.popleft().get()
+            while running:
+                yield running.popleft().get()
+
+    def apply(self, func, a, timeout=None):
+        """
+            func(a) on a worker, raising multiprocessing.TimeoutError after
+            timeout seconds (the worker carries on with it)
+        """
+        if self.in_process:
+            return func(a)
+        return self.pool.apply_async(func, (a,)).get(timeout)
+
+    def terminate(self):
+        if not self.in_process:
+            self.pool.terminate()
+            self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if self.in_process:
+            return
+        if (exc_type is None) or self.wait:
+            self.pool.close()
+            self.pool.join()
+        else:
+            self.terminate()
+
+
+def shape_svg_filename(index):
+    return '%02d.svg' % (index + 1)
+
+SHAPE_SVG_FILENAME = re.compile(r'^\d{2,}\.svg$')
+
+
+def write_svg(filename, canvas, rec_list, progress=None, **options):
+    """
+        progress, if given, is called as progress(shapes done, bytes written)
+        after each shape. Raising ExportCancelled from it leaves any
+        existing file untouched. Gzipped if filename ends in .svgz, options
+        are passed on to generate_svg().
+    """
+    compressed = filename.lower().endswith('.svgz')
+    with atomic_write(filename, 'wb' if compressed else 'w') as f:
+        hook = None
+        if progress is not None:
+            hook = lambda n: progress(n, f.tell())
+        output = open_svgz(f) if compressed else f
+        generate_svg(canvas, rec_list, output, hook, **options)
+        if compressed:
+            # Only ends the gzip stream, f is closed by atomic_write
+            output.close()
+
+
+def write_dxf(filename, canvas, rec_list, progress=None):
+    """ As write_svg() """
+    with atomic_write(filename) as f:
+        hook = None
+        if progress is not None:
+            hook = lambda n: progress(n, f.tell())
+        generate_dxf(canvas, rec_list, f, hook)
+
+
+def write_mesh(filename, canvas, rec_list, progress=None, **options):
+    """ As write_svg(), options (coords, grid) go to generate_mesh() """
+    with atomic_write(filename, 'wb') as f:
+        hook = None
+        if progress is not None:
+            hook = lambda n: progress(n, f.tell())
+        generate_mesh(canvas, rec_list, f, hook, **options)
+
+
+def write_output(filename, canvas, rec_list, progress=None, **options):
+    """
+        write_svg() (.svg or .svgz), write_dxf() or write_mesh() depending on
+        the extension, options are those of the writer picked
+    """
+    ext = filename.lower()
+    if ext.endswith('.dxf'):
+        write_dxf(filename, canvas, rec_list, progress)
+    elif ext.endswith(MESH_EXT):
+        write_mesh(filename, canvas, rec_list, progress, **options)
+    else:
+        write_svg(filename, canvas, rec_list, progress, **options)
+
+
+def export_shapes(directory, canvas, rec_list, progress=None):
+    """
+        Write one SVG per non-empty shape, returns the filenames written.
+        progress is called as for write_svg() after each shape.
+    """
+    written = []
+    bytes_written = 0
+    for i,r in enumerate(rec_list):
+        if r:
+            filename = os.path.join(directory, shape_svg_filename(i))
+            write_svg(filename, canvas, [r])
+            written.append(filename)
+            if progress is not None:
+                bytes_written += os.path.getsize(filename)
+        if progress is not None:
+            progress(i + 1, bytes_written)
+    return written
+
+
+def shape_export_hash(shape, palette, canvas):
+    """ Hash of everything a shape's SVG depends on, engine version included """
+    colors = shape_colors(shape, palette)
+    h = hashlib.sha1(shape_key(shape, len(colors)))
+    h.update(json.dumps([colors, list(canvas)]))
+    return h.hexdigest()
+
+
+def export_shape_job(args):
+    """
+        Worker: generate one shape and write its SVG, returns bytes written
+        or None if the recursion came out empty and nothing was written,
+        as export_shapes() skips those
+    """
+    filename, canvas, shape, palette = args
+    poly_output = shape_recursion(shape, palette)
+    if not poly_output:
+        return None
+    write_svg(filename, canvas, [poly_output])
+    return os.path.getsize(filename)
+
+
+def export_project_shapes(directory, proj, jobs=None, skip_unchanged=False, progress=None):
+    """
+        Like export_shapes() but generates and writes the shapes of proj in
+        a pool of jobs worker processes. With skip_unchanged, shapes whose
+        inputs match the directory's manifest and whose file still exists
+        are left alone. Files of shapes that are now disabled, empty or
+        gone are removed. progress is called as for write_svg(), raising
+        ExportCancelled from it waits for the shapes already being written
+        then stops. Returns the filenames written.
+    """
+    manifest = Manifest(directory)
+    todo = []
+    names = set()
+    stale = []
+    for i,s in enumerate(proj.shapes):
+        name = shape_svg_filename(i)
+        if s.disabled:
+            stale.append(name)
+            continue
+        names.add(name)
+        filename = os.path.join(directory, name)
+        digest = shape_export_hash(s, proj.colors, proj.canvas)
+        if skip_unchanged and manifest.is_current(name, digest) and os.path.exists(filename):
+            continue
+        # Only recorded again once written
+        manifest.discard(name)
+        todo.append((name, digest, (filename, proj.canvas, s, proj.colors)))
+    # Written for shapes since removed
+    stale.extend(n for n in manifest.entries if SHAPE_SVG_FILENAME.match(n) and (n not in names))
+    for name in stale:
+        remove_output(os.path.join(directory, name))
+        manifest.discard(name)
+    total = len(proj.shapes)
+    done = total - len(todo)
+    bytes_written = 0
+    written = []
+    try:
+        if progress is not None:
+            progress(done, bytes_written)
+        with WorkerPool(jobs, len(todo), wait=True) as pool:
+            sizes = pool.map(export_shape_job, [t[2] for t in todo])
+            for i,size in enumerate(sizes):
+                name,digest,args = todo[i]
+                done += 1
+                if size is not None:
+                    manifest.set(name, digest)
+                    written.append(args[0])
+                    bytes_written += size
+                else:
+                    remove_output(args[0])
+                if progress is not None:
+                    progress(done, bytes_written)
+    finally:
+        manifest.save()
+    return written
+
+
+def remove_output(filename):
+    if os.path.exists(filename):
+        os.remove(filename)
+
+
+def file_hash(filename, *extra):
+    """ SHA-1 of a file's contents plus any extra strings (options, versions) """
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), ''):
+            h.update(chunk)
+    for e in extra:
+        h.update('\0' + str(e))
+    return h.hexdigest()
+
+
+class Manifest(object):
+    """
+        Sidecar file recording the input hash each output in a directory
+        was generated from, so unchanged outputs can be skipped.
+    """
+    def __init__(self, directory):
+        self.filename = os.path.join(directory, MANIFEST_FILENAME)
+        self.entries = {}
+        try:
+            with open(self.filename, 'r') as f:
+                self.entries = json.load(f)
+        except (IOError, ValueError):
+            pass
+
+    def is_current(self, name, digest):
+        return self.entries.get(name) == digest
+
+    def set(self, name, digest):
+        self.entries[name] = digest
+
+    def discard(self, name):
+        self.entries.pop(name, None)
+
+    def save(self):
+        with atomic_write(self.filename) as f:
+            json.dump(self.entries, f, sort_keys=True, indent=4, separators=(',', ': '))
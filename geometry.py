@@ -93,6 +93,30 @@ class vec2(object):
                 return a + (ab * t)
 
 
+def _at_x(a, b, x):
+    """ Point on segment ab at x """
+    t = float(x - a.x) / (b.x - a.x)
+    return vec2(x, a.y + (b.y - a.y) * t)
+
+
+def _at_y(a, b, y):
+    t = float(y - a.y) / (b.y - a.y)
+    return vec2(a.x + (b.x - a.x) * t, y)
+
+
+def _clip_edge(points, inside, intersect):
+    out = []
+    for i,cur in enumerate(points):
+        prev = points[i-1]
+        if inside(cur):
+            if not inside(prev):
+                out.append(intersect(prev, cur))
+            out.append(cur)
+        elif inside(prev):
+            out.append(intersect(prev, cur))
+    return out
+
+
 class polygon(object):
     def __init__(self, points, make_clockwise=True):
         self.points = []
@@ -199,3 +223,51 @@ class polygon(object):
         # Input polygon already clockwise => recurse is clockwise
         return polygon(p, make_clockwise=False)
 
+    def bounds(self):
+        """ (min x, min y, max x, max y) """
+        xs = [p.x for p in self.points]
+        ys = [p.y for p in self.points]
+        return (min(xs), min(ys), max(xs), max(ys))
+
+    def area(self):
+        """ Unsigned area """
+        a = 0.0
+        n = len(self.points)
+        for i,p in enumerate(self.points):
+            q = self.points[(i+1)%n]
+            a += p.x * q.y - q.x * p.y
+        return abs(0.5 * a)
+
+    def clip(self, x0, y0, x1, y1):
+        """
+            Part of the polygon within the rectangle (Sutherland-Hodgman),
+            None if nothing is left. Point order is kept.
+        """
+        points = self.points
+        points = _clip_edge(points, lambda p: p.x >= x0, lambda a, b: _at_x(a, b, x0))
+        points = _clip_edge(points, lambda p: p.x <= x1, lambda a, b: _at_x(a, b, x1))
+        points = _clip_edge(points, lambda p: p.y >= y0, lambda a, b: _at_y(a, b, y0))
+        points = _clip_edge(points, lambda p: p.y <= y1, lambda a, b: _at_y(a, b, y1))
+        if len(points) < 3:
+            return None
+        return polygon(points, make_clockwise=False)
+
+    def overlaps(self, rhs, eps=1e-6):
+        """
+            True if the interiors intersect, polygons sharing only an edge
+            don't overlap. Exact for convex polygons, concave ones may
+            report an overlap that isn't there.
+        """
+        for poly in (self, rhs):
+            n = len(poly.points)
+            for i,a in enumerate(poly.points):
+                b = poly.points[(i+1)%n]
+                # Separating axis test along the edge normal
+                axis = vec2(a.y - b.y, b.x - a.x)
+                p0 = [axis.dot(p) for p in self.points]
+                p1 = [axis.dot(p) for p in rhs.points]
+                # Shared edges of split shapes are only equal to rounding
+                tol = eps * math.hypot(axis.x, axis.y)
+                if (max(p0) <= min(p1) + tol) or (max(p1) <= min(p0) + tol):
+                    return False
+        return True
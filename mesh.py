@@ -0,0 +1,321 @@
+#
+# Vector Recursion Workbench
+# Copyright (c) 2014-2016 Nathan Williams, Jason Fletcher
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+import array
+import math
+import mmap
+import os
+import struct
+import sys
+
+from geometry import vec2, polygon
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#
+# Triangle mesh file layout (.vrwm), all little endian:
+#
+#   header      magic, format version, coordinate type, color count, shape
+#               count, triangle count, vertex count, canvas (4 doubles),
+#               grid, vertices offset, indices offset, colors offset
+#   palette     16 bytes per color, NUL padded HTML string
+#   shapes      shape count + 1 uint32, shape i owns triangles
+#               [shapes[i], shapes[i+1])
+#   vertices    x,y per vertex as float64, float32 or int32 (multiples of
+#               grid), 8 byte aligned
+#   indices     3 uint32 vertex indices per triangle
+#   colors      1 byte per triangle, index into palette
+#
+# So e.g. numpy.fromfile(f, '<f4', 2 * vertex count, offset=vertices
+# offset) gets every vertex without parsing anything else.
+#
+MESH_MAGIC = 'VRWMESH2'
+MESH_VERSION = 2
+MESH_HEADER = struct.Struct('<8sIIIIII4ddQQQ')
+MESH_COLOR = struct.Struct('<16s')
+MESH_EXT = '.vrwm'
+
+# Coordinate storage: (code stored in files, array typecode, numpy dtype)
+MESH_COORDS = {
+    'f64': (0, 'd', '<f8'),
+    'f32': (1, 'f', '<f4'),
+    'i32': (2, 'i', '<i4'),
+}
+MESH_COORDS_BY_CODE = dict((v[0], k) for k,v in MESH_COORDS.items())
+
+FLOAT32 = struct.Struct('<f')
+INT32_MIN = -2 ** 31
+INT32_MAX = 2 ** 31 - 1
+
+
+def check_coords(coords, grid):
+    if coords not in MESH_COORDS:
+        raise ValueError('Coordinates must be one of %s, not %s' % (', '.join(sorted(MESH_COORDS)), coords))
+    if (coords == 'i32') and not (grid > 0):
+        raise ValueError('i32 coordinates need a grid > 0')
+
+
+class VertexTable(object):
+    """
+        Triangles as deduplicated vertices plus 3 indices each. Coordinates
+        are quantized to the storage type first (f32: nearest float, i32:
+        nearest multiple of grid), so points that end up equal share a
+        vertex. Quantizing only uses IEEE double arithmetic, so the same
+        input gives the same bytes on every run and machine.
+    """
+    def __init__(self, coords='f64', grid=None):
+        check_coords(coords, grid)
+        self.coords = coords
+        self.grid = grid
+        self.vertices = array.array(MESH_COORDS[coords][1])
+        self.indices = array.array('I')
+        self._index = {}
+        self.quantize = {'f64': float, 'f32': self._f32, 'i32': self._i32}[coords]
+
+    def __len__(self):
+        return len(self.vertices) // 2
+
+    def _f32(self, v):
+        return FLOAT32.unpack(FLOAT32.pack(v))[0]
+
+    def _i32(self, v):
+        q = int(math.floor(v / self.grid + 0.5))
+        if (q < INT32_MIN) or (q > INT32_MAX):
+            raise ValueError('%g does not fit i32 coordinates on a %g grid' % (v, self.grid))
+        return q
+
+    def add(self, poly):
+        """
+            Adds poly as triangles, fanned out from its first point if it
+            has more than 3 (e.g. clipped to the canvas, convex). Returns
+            the number of triangles added.
+        """
+        corners = []
+        for p in poly.points:
+            key = (self.quantize(p.x), self.quantize(p.y))
+            i = self._index.get(key)
+            if i is None:
+                i = self._index[key] = len(self.vertices) // 2
+                self.vertices.extend(key)
+            corners.append(i)
+        if len(corners) == 3:
+            self.indices.extend(corners)
+            return 1
+        for j in range(1, len(corners) - 1):
+            self.indices.extend((corners[0], corners[j], corners[j+1]))
+        return len(corners) - 2
+
+    def points(self):
+        """ vec2 per vertex, in canvas units """
+        v = self.vertices
+        s = self.grid if self.coords == 'i32' else 1.0
+        if s == 1.0:
+            return [vec2(v[i], v[i+1]) for i in xrange(0, len(v), 2)]
+        return [vec2(v[i] * s, v[i+1] * s) for i in xrange(0, len(v), 2)]
+
+
+def mesh_palette(recursion_list):
+    """ Colors in order of first use, with their indices """
+    colors = []
+    idx = {}
+    for poly_list in recursion_list:
+        for c,poly in poly_list:
+            if c not in idx:
+                idx[c] = len(colors)
+                colors.append(c)
+    return colors, idx
+
+
+def mesh_layout(num_colors, num_shapes):
+    """ Offset of the vertices array """
+    offset = MESH_HEADER.size + num_colors * MESH_COLOR.size + (num_shapes + 1) * 4
+    return (offset + 7) & ~7
+
+
+def mesh_size(num_colors, num_shapes, num_triangles, num_vertices, coords='f64'):
+    """ Bytes of a .vrwm file with these counts """
+    itemsize = array.array(MESH_COORDS[coords][1]).itemsize
+    return mesh_layout(num_colors, num_shapes) + num_vertices * 2 * itemsize + num_triangles * (3 * 4 + 1)
+
+
+def little_endian(a):
+    """ a.tostring() in little endian order """
+    if sys.byteorder != 'little':
+        a = array.array(a.typecode, a)
+        a.byteswap()
+    return a.tostring()
+
+
+def generate_mesh(canvas, recursion_list, output, progress=None, coords='f64', grid=None):
+    """
+        Write recursion_list as a .vrwm mesh to the binary file output with
+        coordinates stored as coords (see MESH_COORDS, i32 needs grid).
+        progress, if given, is called with the number of shapes indexed.
+    """
+    colors, idx = mesh_palette(recursion_list)
+    if len(colors) > 256:
+        raise ValueError('Mesh palette is limited to 256 colors, got %d' % len(colors))
+    table = VertexTable(coords, grid)
+    offsets = array.array('I', [0])
+    color_index = array.array('B')
+    for n,poly_list in enumerate(recursion_list):
+        for c,poly in poly_list:
+            color_index.extend([idx[c]] * table.add(poly))
+        offsets.append(len(color_index))
+        if progress is not None:
+            progress(n + 1)
+    count = len(color_index)
+    vertices_offset = mesh_layout(len(colors), len(recursion_list))
+    indices_offset = vertices_offset + len(table.vertices) * table.vertices.itemsize
+    colors_offset = indices_offset + count * 3 * 4
+    output.write(MESH_HEADER.pack(MESH_MAGIC, MESH_VERSION, MESH_COORDS[coords][0], len(colors),
+                                  len(recursion_list), count, len(table),
+                                  canvas[0], canvas[1], canvas[2], canvas[3], grid or 0.0,
+                                  vertices_offset, indices_offset, colors_offset))
+    for c in colors:
+        output.write(MESH_COLOR.pack(str(c)))
+    output.write(little_endian(offsets))
+    output.write('\0' * (vertices_offset - (MESH_HEADER.size + len(colors) * MESH_COLOR.size + len(offsets) * 4)))
+    output.write(little_endian(table.vertices))
+    output.write(little_endian(table.indices))
+    output.write(color_index.tostring())
+
+
+class Mesh(object):
+    """
+        Memory-mapped .vrwm file. vertices, indices and color_index are
+        views into the file when numpy is available (shaped (vertices, 2)
+        and (triangles, 3)), otherwise flat arrays read from it. i32
+        vertices are in units of grid. Views, and arrays sliced or reshaped
+        from them, must not be used after close(): they point into the
+        unmapped file. Take a copy() of any that need to outlive it.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < MESH_HEADER.size:
+                raise ValueError('%s: not a mesh file' % filename)
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._parse(size)
+        except:
+            self._mm.close()
+            raise
+
+    def __repr__(self):
+        return 'Mesh(%s,%s,shapes=%d,triangles=%d,vertices=%d)' % (self.filename, self.coords,
+                                                                   len(self.shape_offsets) - 1, len(self),
+                                                                   self.vertex_count)
+
+    def __len__(self):
+        return self.shape_offsets[-1]
+
+    def _array(self, typecode, dtype, start, count):
+        if numpy is not None:
+            return numpy.frombuffer(self._mm, numpy.dtype(dtype), count, start)
+        a = array.array(typecode)
+        a.fromstring(self._mm[start:start + count * a.itemsize])
+        if sys.byteorder != 'little':
+            a.byteswap()
+        return a
+
+    def _parse(self, size):
+        mm = self._mm
+        header = MESH_HEADER.unpack_from(mm, 0)
+        magic, version, code, num_colors, num_shapes, count, num_vertices = header[:7]
+        self.canvas = list(header[7:11])
+        self.grid = header[11] or None
+        vertices_offset, indices_offset, colors_offset = header[12:]
+        if (magic != MESH_MAGIC) or (version != MESH_VERSION) or (code not in MESH_COORDS_BY_CODE):
+            raise ValueError('%s: not a version %d mesh file' % (self.filename, MESH_VERSION))
+        self.coords = MESH_COORDS_BY_CODE[code]
+        typecode, dtype = MESH_COORDS[self.coords][1:]
+        itemsize = array.array(typecode).itemsize
+        if (vertices_offset != mesh_layout(num_colors, num_shapes)) or \
+           (indices_offset != vertices_offset + num_vertices * 2 * itemsize) or \
+           (colors_offset != indices_offset + count * 3 * 4) or (size != colors_offset + count):
+            raise ValueError('%s: truncated mesh file' % self.filename)
+        self.colors = []
+        offset = MESH_HEADER.size
+        for i in range(num_colors):
+            self.colors.append(MESH_COLOR.unpack_from(mm, offset)[0].rstrip('\0'))
+            offset += MESH_COLOR.size
+        self.shape_offsets = self._array('I', '<u4', offset, num_shapes + 1).tolist()
+        self.vertex_count = num_vertices
+        self.vertices = self._array(typecode, dtype, vertices_offset, num_vertices * 2)
+        self.indices = self._array('I', '<u4', indices_offset, count * 3)
+        self.color_index = self._array('B', 'u1', colors_offset, count)
+        if numpy is not None:
+            self.vertices = self.vertices.reshape(num_vertices, 2)
+            self.indices = self.indices.reshape(count, 3)
+
+    def shape_range(self, index):
+        """ (first, end) triangle of shape index """
+        return self.shape_offsets[index], self.shape_offsets[index + 1]
+
+    def triangle_coords(self):
+        """
+            (triangles, 3, 2) float64 array in canvas units, or without
+            numpy a list of [(x, y), (x, y), (x, y)] per triangle.
+        """
+        scale = self.grid if self.coords == 'i32' else 1.0
+        if numpy is None:
+            v = self.vertices
+            points = [(v[2*i] * scale, v[2*i+1] * scale) for i in range(len(v) // 2)]
+            indices = self.indices
+            return [[points[indices[3*t]], points[indices[3*t+1]], points[indices[3*t+2]]]
+                    for t in range(len(indices) // 3)]
+        coords = self.vertices[self.indices].astype(numpy.float64)
+        if scale != 1.0:
+            coords *= scale
+        return coords
+
+    def recursion_list(self):
+        """ Back to generate_recursion() form, e.g. for generate_svg() """
+        table = VertexTable(self.coords, self.grid)
+        table.vertices = array.array(table.vertices.typecode, self.vertices.ravel().tolist()
+                                     if numpy is not None else self.vertices)
+        points = table.points()
+        indices = self.indices.ravel().tolist() if numpy is not None else self.indices
+        out = []
+        for i in range(len(self.shape_offsets) - 1):
+            first, end = self.shape_range(i)
+            poly_list = []
+            for t in range(first, end):
+                tri = [points[indices[3*t]], points[indices[3*t+1]], points[indices[3*t+2]]]
+                poly_list.append((self.colors[self.color_index[t]], polygon(tri, make_clockwise=False)))
+            out.append(poly_list)
+        return out
+
+    def close(self):
+        """ Unmaps the file, any view still held elsewhere becomes invalid """
+        # Views must go before the map they point into
+        self.vertices = None
+        self.indices = None
+        self.color_index = None
+        self._mm.close()
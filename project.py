@@ -21,6 +21,7 @@
 # SOFTWARE.
 #
 
+import copy
 import json
 
 from geometry import vec2, polygon
@@ -59,6 +60,12 @@ class shape(object):
         assert footer_offset >= 0
         self.footer_offset = footer_offset
 
+    def copy(self):
+        """ Copy with its own polygon and points, safe to modify in place """
+        s = copy.copy(self)
+        s.poly = polygon([vec2(p.x, p.y) for p in self.poly.points], make_clockwise=False)
+        return s
+
 
 COLOR_NAME_TO_HTML = {
     'black' : "#000000",
@@ -84,8 +91,35 @@ class project(object):
         assert (type(colors) == list)
         self.colors = colors
         self.shapes = shapes
+        # Shapes only this project refers to, see edit_shape()
+        self._owned = set()
 
-    def to_json(self, filename=None):
+    def snapshot(self):
+        """
+            Copy sharing every shape, so only the lists are copied. From
+            then on neither project owns its shapes: anything about to
+            modify one in place goes through edit_shape() first.
+        """
+        self._owned = set()
+        return project(list(self.canvas), list(self.colors), list(self.shapes))
+
+    def edit_shape(self, s, index=None):
+        """
+            Shape to modify in place of s, which is copied and replaced by
+            the copy unless the project already owns it. index is where s
+            is in shapes if the caller knows, otherwise it's looked up.
+        """
+        if s in self._owned:
+            return s
+        if index is None:
+            index = self.shapes.index(s)
+        assert self.shapes[index] is s
+        e = s.copy()
+        self.shapes[index] = e
+        self._owned.add(e)
+        return e
+
+    def to_dict(self):
         raw_shapes = []
         for s in self.shapes:
             points = []
@@ -103,24 +137,40 @@ class project(object):
                 'footer_inc': s.footer_inc,
                 'footer_offset': s.footer_offset,
             })
-        obj = {
+        return {
             'canvas': self.canvas,
             'colors': self.colors,
             'shapes': raw_shapes,
         }
+
+    def to_json(self, filename=None):
+        obj = self.to_dict()
         args = { 'sort_keys': True, 'indent': 4, 'separators': (',', ': ') }
         if filename:
-            with open(filename, 'w') as f:
+            # Not imported at the top, export imports this module
+            from export import atomic_write
+            with atomic_write(filename) as f:
                 json.dump(obj, f, **args)
             return None
         else:
             return json.dumps(obj, **args)
 
     def save_file(self, filename):
-        self.to_json(filename)
+        """ JSON, or columnar if filename ends in .vrwc (see project_columns) """
+        if filename.lower().endswith('.vrwc'):
+            from export import atomic_write
+            from project_columns import write_columns
+            with atomic_write(filename, 'wb') as f:
+                write_columns(self.to_dict(), f)
+        else:
+            self.to_json(filename)
 
     @classmethod
     def load_file(cls, filename):
+        """ As save_file(), .vrwc shapes are built as they are used """
+        if filename.lower().endswith('.vrwc'):
+            from project_columns import load_columns
+            return load_columns(filename)
         with open(filename, 'r') as f:
             data = json.load(f)
             return cls.load_dict(data)
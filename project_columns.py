@@ -0,0 +1,369 @@
+#
+# Vector Recursion Workbench
+# Copyright (c) 2014-2016 Nathan Williams, Jason Fletcher
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+import array
+import json
+import os
+import struct
+import sys
+
+from geometry import vec2, polygon
+from mesh import little_endian
+from project import project, shape, convert_color_names
+
+#
+# Columnar project file layout (.vrwc), all little endian:
+#
+#   header      magic, format version, shape count, point count, meta length
+#   meta        JSON object: every top level key of the project JSON but
+#               'shapes' (canvas, colors as written, footer_buffer, ...),
+#               plus 'shape_extras' for unknown per-shape keys
+#   (padding to 8 bytes)
+#   points      x,y float64 per point, every shape's points in order
+#   params      float64 columns of shape count each: step, inc, footer,
+#               footer_inc
+#   depths      int32 per shape
+#   footers     footer_offset float64 per shape
+#   shapes      shape count + 1 uint32, shape i owns points
+#               [shapes[i], shapes[i+1])
+#   flags       uint16 per shape, COL_* bits
+#   point types uint8 per point, PT_* bits (from version 2)
+#
+# Numbers are stored as float64 with a bit saying which were integers in
+# the JSON, so converting back gives the same JSON. Version 1 files have
+# no such bits and give floats, except whole footer_offset values.
+#
+# Nothing per shape is built on load, see ColumnShapes.
+#
+COLUMNS_MAGIC = 'VRWCOLS1'
+COLUMNS_VERSION = 2
+COLUMNS_VERSIONS = (1, 2)
+COLUMNS_HEADER = struct.Struct('<8sIIII')
+COLUMNS_EXT = '.vrwc'
+
+PARAM_COLUMNS = ('step', 'inc', 'footer', 'footer_inc')
+
+COL_CLOCKWISE = 1 << 0
+COL_REVERSE_COLORS = 1 << 1
+COL_DISABLED = 1 << 2
+# Points already in make_clockwise() order, no sort needed on load
+COL_SORTED = 1 << 3
+# Optional keys present in the JSON, so they are written back the same
+COL_HAS = {
+    'reverse_colors': 1 << 4,
+    'disabled': 1 << 5,
+    'footer': 1 << 6,
+    'footer_inc': 1 << 7,
+    'footer_offset': 1 << 8,
+}
+# Value was an integer in the JSON
+COL_INT = {
+    'step': 1 << 9,
+    'inc': 1 << 10,
+    'footer': 1 << 11,
+    'footer_inc': 1 << 12,
+    'footer_offset': 1 << 13,
+}
+SHAPE_KEYS = ('points', 'depth', 'step', 'inc', 'clockwise') + tuple(sorted(COL_HAS))
+
+PT_INT_X = 1 << 0
+PT_INT_Y = 1 << 1
+
+
+def is_int(v):
+    return type(v) in (int, long)
+
+
+def whole(v):
+    """ int if v is a whole number, as version 1 files give footer_offset """
+    return int(v) if v == int(v) else v
+
+
+def columns_layout(meta_len):
+    """ Offset of the points array """
+    return (COLUMNS_HEADER.size + meta_len + 7) & ~7
+
+
+def write_columns(data, output):
+    """ Write a project JSON dict (see project.load_dict()) to the binary file output """
+    meta = dict((k, v) for k,v in data.items() if k != 'shapes')
+    raw_shapes = data.get('shapes', [])
+    footer_buffer = float(data.get('footer_buffer', 0.0))
+    points = array.array('d')
+    params = [array.array('d') for k in PARAM_COLUMNS]
+    depths = array.array('i')
+    footer_offsets = array.array('d')
+    offsets = array.array('I', [0])
+    flags = array.array('H')
+    point_types = array.array('B')
+    extras = {}
+    for i,s in enumerate(raw_shapes):
+        raw_points = [vec2(float(p[0]), float(p[1])) for p in s['points']]
+        for p in raw_points:
+            points.append(p.x)
+            points.append(p.y)
+        for p in s['points']:
+            point_types.append((PT_INT_X if is_int(p[0]) else 0) | (PT_INT_Y if is_int(p[1]) else 0))
+        offsets.append(len(points) // 2)
+        params[0].append(float(s['step']))
+        params[1].append(float(s['inc']))
+        params[2].append(float(s.get('footer', footer_buffer)))
+        params[3].append(float(s.get('footer_inc', 0.0)))
+        depths.append(int(s['depth']))
+        footer_offsets.append(float(s.get('footer_offset', 0)))
+        f = 0
+        if bool(s['clockwise']):
+            f |= COL_CLOCKWISE
+        if bool(s.get('reverse_colors', False)):
+            f |= COL_REVERSE_COLORS
+        if bool(s.get('disabled', False)):
+            f |= COL_DISABLED
+        if polygon(raw_points).points == raw_points:
+            f |= COL_SORTED
+        for k,bit in COL_HAS.items():
+            if k in s:
+                f |= bit
+        for k,bit in COL_INT.items():
+            if is_int(s.get(k)):
+                f |= bit
+        flags.append(f)
+        extra = dict((k, v) for k,v in s.items() if k not in SHAPE_KEYS)
+        if extra:
+            extras[str(i)] = extra
+    if extras:
+        meta['shape_extras'] = extras
+    meta = json.dumps(meta, sort_keys=True, separators=(',', ':'))
+    output.write(COLUMNS_HEADER.pack(COLUMNS_MAGIC, COLUMNS_VERSION, len(flags), len(points) // 2, len(meta)))
+    output.write(meta)
+    output.write('\0' * (columns_layout(len(meta)) - COLUMNS_HEADER.size - len(meta)))
+    output.write(little_endian(points))
+    for a in params:
+        output.write(little_endian(a))
+    output.write(little_endian(depths))
+    output.write(little_endian(footer_offsets))
+    output.write(little_endian(offsets))
+    output.write(little_endian(flags))
+    output.write(little_endian(point_types))
+
+
+class Columns(object):
+    """ Arrays of a .vrwc file, see the layout above """
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            buf = f.read()
+        if len(buf) < COLUMNS_HEADER.size:
+            raise ValueError('%s: not a columnar project file' % filename)
+        magic, version, count, num_points, meta_len = COLUMNS_HEADER.unpack_from(buf, 0)
+        if (magic != COLUMNS_MAGIC) or (version not in COLUMNS_VERSIONS):
+            raise ValueError('%s: not a version %d columnar project file' % (filename, COLUMNS_VERSION))
+        self.version = version
+        self.meta = json.loads(buf[COLUMNS_HEADER.size:COLUMNS_HEADER.size + meta_len])
+        self.extras = self.meta.pop('shape_extras', {})
+        self.count = count
+        offset = columns_layout(meta_len)
+        def take(typecode, n):
+            a = array.array(typecode)
+            end = offset + n * a.itemsize
+            if end > len(buf):
+                raise ValueError('%s: truncated columnar project file' % filename)
+            a.fromstring(buf[offset:end])
+            if sys.byteorder != 'little':
+                a.byteswap()
+            return a, end
+        self.points, offset = take('d', num_points * 2)
+        self.params = {}
+        for k in PARAM_COLUMNS:
+            self.params[k], offset = take('d', count)
+        self.depths, offset = take('i', count)
+        self.footer_offsets, offset = take('d', count)
+        self.offsets, offset = take('I', count + 1)
+        self.flags, offset = take('H', count)
+        self.point_types = None
+        if version >= 2:
+            self.point_types, offset = take('B', num_points)
+        if offset != len(buf):
+            raise ValueError('%s: truncated columnar project file' % filename)
+
+    def shape(self, i):
+        """ shape i, as project.load_dict() would build it """
+        f = self.flags[i]
+        pts = self.points
+        points = [vec2(pts[2*j], pts[2*j+1]) for j in range(self.offsets[i], self.offsets[i+1])]
+        return shape(
+            poly=polygon(points, make_clockwise=not (f & COL_SORTED)),
+            depth=int(self.depths[i]),
+            step=self.params['step'][i],
+            inc=self.params['inc'][i],
+            clockwise=bool(f & COL_CLOCKWISE),
+            reverse_colors=bool(f & COL_REVERSE_COLORS),
+            disabled=bool(f & COL_DISABLED),
+            footer=self.params['footer'][i],
+            footer_inc=self.params['footer_inc'][i],
+            footer_offset=self.footer_offsets[i],
+        )
+
+    def shape_dict(self, i):
+        """ shape i as it was in the project JSON """
+        f = self.flags[i]
+        pts = self.points
+        points = []
+        for j in range(self.offsets[i], self.offsets[i+1]):
+            x, y = pts[2*j], pts[2*j+1]
+            t = self.point_types[j] if self.point_types is not None else 0
+            points.append([int(x) if t & PT_INT_X else x, int(y) if t & PT_INT_Y else y])
+        values = {
+            'step': self.params['step'][i],
+            'inc': self.params['inc'][i],
+            'reverse_colors': bool(f & COL_REVERSE_COLORS),
+            'disabled': bool(f & COL_DISABLED),
+            'footer': self.params['footer'][i],
+            'footer_inc': self.params['footer_inc'][i],
+            'footer_offset': self.footer_offsets[i],
+        }
+        if self.version < 2:
+            values['footer_offset'] = whole(values['footer_offset'])
+        for k,bit in COL_INT.items():
+            if f & bit:
+                values[k] = int(values[k])
+        out = {
+            'points': points,
+            'depth': int(self.depths[i]),
+            'step': values['step'],
+            'inc': values['inc'],
+            'clockwise': bool(f & COL_CLOCKWISE),
+        }
+        for k,bit in COL_HAS.items():
+            if f & bit:
+                out[k] = values[k]
+        out.update(self.extras.get(str(i), {}))
+        return out
+
+    def to_dict(self):
+        """ The project JSON dict written to the file """
+        data = dict(self.meta)
+        data['shapes'] = [self.shape_dict(i) for i in range(self.count)]
+        return data
+
+
+class ColumnShapes(object):
+    """
+        Stands in for project.shapes, building each shape on first access
+        and keeping it. Has the list methods the workbench uses on
+        project.shapes.
+    """
+    def __init__(self, columns):
+        self.columns = columns
+        # Shapes not built yet are their index in columns
+        self._shapes = range(columns.count)
+
+    def __repr__(self):
+        return 'ColumnShapes(%d,built=%d)' % (len(self._shapes), self.built())
+
+    def __len__(self):
+        return len(self._shapes)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self._shapes)))]
+        if i < 0:
+            i += len(self._shapes)
+        s = self._shapes[i]
+        if type(s) is int:
+            s = self._shapes[i] = self.columns.shape(s)
+        return s
+
+    def __setitem__(self, i, s):
+        self._shapes[i] = s
+
+    def __delitem__(self, i):
+        del self._shapes[i]
+
+    def __iter__(self):
+        for i in range(len(self._shapes)):
+            yield self[i]
+
+    def __contains__(self, s):
+        return any(b is s for b in self._shapes)
+
+    def append(self, s):
+        self._shapes.append(s)
+
+    def extend(self, shapes):
+        self._shapes.extend(shapes)
+
+    def insert(self, i, s):
+        self._shapes.insert(i, s)
+
+    def pop(self, i=-1):
+        s = self[i]
+        del self._shapes[i]
+        return s
+
+    def remove(self, s):
+        del self._shapes[self.index(s)]
+
+    def index(self, s):
+        # Never built => can't be s
+        for i,b in enumerate(self._shapes):
+            if b is s:
+                return i
+        raise ValueError('shape not in project')
+
+    def built(self):
+        return sum(1 for s in self._shapes if type(s) is not int)
+
+
+def load_columns(filename):
+    """ project of a .vrwc file, its shapes built as they are used """
+    columns = Columns(filename)
+    return project(columns.meta['canvas'], convert_color_names(columns.meta['colors']), ColumnShapes(columns))
+
+
+def convert(src, dst):
+    """ Project JSON to .vrwc or back, by the extension of dst """
+    if dst.lower().endswith(COLUMNS_EXT):
+        with open(src, 'r') as f:
+            data = json.load(f)
+        with open(dst, 'wb') as f:
+            write_columns(data, f)
+    else:
+        data = Columns(src).to_dict()
+        with open(dst, 'w') as f:
+            json.dump(data, f, sort_keys=True, indent=4, separators=(',', ': '))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Convert a project between JSON and the columnar .vrwc format.')
+    parser.add_argument('input', help='project JSON or .vrwc file')
+    parser.add_argument('output', nargs='?',
+                        help='output file, .vrwc or JSON by its extension (default: input with the other one)')
+    args = parser.parse_args()
+    output = args.output
+    if output is None:
+        base = os.path.splitext(args.input)[0]
+        output = base + ('.json' if args.input.lower().endswith(COLUMNS_EXT) else COLUMNS_EXT)
+    convert(args.input, output)
+    print '%s -> %s (%d -> %d bytes)' % (args.input, output, os.path.getsize(args.input), os.path.getsize(output))
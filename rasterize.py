@@ -0,0 +1,262 @@
+#
+# Vector Recursion Workbench
+# Copyright (c) 2014-2016 Nathan Williams, Jason Fletcher
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+#
+# Headless PNG rendering of a project, without wx.
+#
+# The image is split into horizontal bands, each filled and deflated by a
+# worker process. The main process only stitches the compressed bands into
+# one PNG in order, so neither holds the whole image.
+#
+
+import math
+import operator
+import os
+import struct
+import zlib
+from timeit import default_timer
+
+from project import project, COLOR_NAME_TO_HTML
+from recursion_excursion import shape_recursion
+from recursion_cache import GeometryCache
+from export import WorkerPool, add_jobs_argument, atomic_write, job_count
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+PNG_SIGNATURE = '\x89PNG\r\n\x1a\n'
+# Upper bound on one band's pixels in memory, supersampled
+BAND_BYTES = 16 * 1024 * 1024
+ADLER_BASE = 65521
+
+# One per worker process, see band_cache()
+_band_cache = None
+
+
+def band_cache():
+    """ Worker's GeometryCache, so shapes spanning its bands are generated once """
+    global _band_cache
+    if _band_cache is None:
+        _band_cache = GeometryCache()
+    return _band_cache
+
+
+def parse_color(color):
+    """ '#RRGGBB', '#RGB' or a name from COLOR_NAME_TO_HTML as 3 bytes """
+    c = COLOR_NAME_TO_HTML.get(color, color).lstrip('#')
+    if len(c) == 3:
+        c = ''.join(ch * 2 for ch in c)
+    if len(c) != 6:
+        raise ValueError('Unsupported color %r' % color)
+    return c.decode('hex')
+
+
+def png_chunk(tag, data):
+    crc = zlib.crc32(tag)
+    crc = zlib.crc32(data, crc)
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', crc & 0xffffffff)
+
+
+def adler32_combine(adler1, adler2, len2):
+    """ Adler-32 of two strings joined, from the checksums of each (as zlib's) """
+    rem = len2 % ADLER_BASE
+    sum1 = adler1 & 0xffff
+    sum2 = (rem * sum1) % ADLER_BASE
+    sum1 += (adler2 & 0xffff) + ADLER_BASE - 1
+    sum2 += ((adler1 >> 16) & 0xffff) + ((adler2 >> 16) & 0xffff) + ADLER_BASE - rem
+    if sum1 >= ADLER_BASE:
+        sum1 -= ADLER_BASE
+    if sum1 >= ADLER_BASE:
+        sum1 -= ADLER_BASE
+    if sum2 >= (ADLER_BASE << 1):
+        sum2 -= (ADLER_BASE << 1)
+    if sum2 >= ADLER_BASE:
+        sum2 -= ADLER_BASE
+    return sum1 | (sum2 << 16)
+
+
+def fill_triangle(buf, width, rows, points, color):
+    """
+        Scanline fill of a triangle (pixel coordinates) into an RGB buffer
+        of width by rows. Pixels are filled when their center is covered,
+        spans are half open so neighbouring triangles neither overlap nor
+        leave gaps.
+    """
+    (ax,ay),(bx,by),(cx,cy) = sorted(points, key=lambda p: p[1])
+    row0 = max(0, int(math.ceil(ay - 0.5)))
+    row1 = min(rows, int(math.ceil(cy - 0.5)))
+    stride = width * 3
+    for y in xrange(row0, row1):
+        yc = y + 0.5
+        # Long edge a-c against a-b above b, b-c below
+        xl = ax + (yc - ay) * (cx - ax) / (cy - ay)
+        if yc < by:
+            xr = ax + (yc - ay) * (bx - ax) / (by - ay)
+        else:
+            xr = bx + (yc - by) * (cx - bx) / (cy - by)
+        if xl > xr:
+            xl,xr = xr,xl
+        x0 = max(0, int(math.ceil(xl - 0.5)))
+        x1 = min(width, int(math.ceil(xr - 0.5)))
+        if x1 > x0:
+            o = y * stride
+            buf[o + 3 * x0:o + 3 * x1] = color * (x1 - x0)
+
+
+def downsample(buf, width, rows, s):
+    """ Average s by s pixel blocks, width and rows are the output size """
+    if numpy is not None:
+        a = numpy.frombuffer(buf, dtype=numpy.uint8).reshape(rows, s, width, s, 3)
+        a = a.astype(numpy.uint32).sum(axis=3).sum(axis=1)
+        return bytearray(((a + (s * s) // 2) // (s * s)).astype(numpy.uint8).tostring())
+    out = bytearray(width * rows * 3)
+    n = s * s
+    stride_in = width * s * 3
+    for y in xrange(rows):
+        for ch in range(3):
+            acc = [0] * width
+            for sy in range(s):
+                o = (y * s + sy) * stride_in
+                row = buf[o:o + stride_in]
+                for sx in range(s):
+                    acc = map(operator.add, acc, row[sx * 3 + ch::s * 3])
+            out[y * width * 3 + ch:(y + 1) * width * 3:3] = bytearray((v + n // 2) // n for v in acc)
+    return out
+
+
+def render_band(args):
+    """
+        Worker: renders rows [row0, row1) of the image. Only shapes overlapping
+        the band are generated, or taken from cache (default: the worker's
+        band_cache()). Returns (raw deflate data ending on a byte boundary,
+        adler32 and length of the uncompressed PNG rows).
+    """
+    proj,width,height,row0,row1,supersample,background,level,cache = args
+    if cache is None:
+        cache = band_cache()
+    s = supersample
+    rows = row1 - row0
+    cx0,cy0,cx1,cy1 = [float(v) for v in proj.canvas]
+    sx = width * s / (cx1 - cx0)
+    sy = height * s / (cy1 - cy0)
+    # Band in canvas coordinates
+    top = cy0 + row0 / float(height) * (cy1 - cy0)
+    bottom = cy0 + row1 / float(height) * (cy1 - cy0)
+    buf = bytearray(parse_color(background) * (width * s * rows * s))
+    colors = {}
+    for shp in proj.shapes:
+        if shp.disabled:
+            continue
+        b = shp.poly.bounds()
+        if (b[3] <= top) or (b[1] >= bottom):
+            continue
+        for c,poly in shape_recursion(shp, proj.colors, cache):
+            pts = poly.points
+            if (max(p.y for p in pts) <= top) or (min(p.y for p in pts) >= bottom):
+                continue
+            color = colors.get(c)
+            if color is None:
+                color = colors[c] = str(parse_color(c))
+            fill_triangle(buf, width * s, rows * s,
+                          [((p.x - cx0) * sx, (p.y - top) * sy) for p in pts], color)
+    if s > 1:
+        buf = downsample(buf, width, rows, s)
+    # Filter type 0 (none) in front of each row
+    stride = width * 3
+    raw = bytearray(rows * (stride + 1))
+    for y in xrange(rows):
+        o = y * (stride + 1) + 1
+        raw[o:o + stride] = buf[y * stride:(y + 1) * stride]
+    del buf
+    raw = str(raw)
+    c = zlib.compressobj(level, zlib.DEFLATED, -15)
+    data = c.compress(raw) + c.flush(zlib.Z_SYNC_FLUSH)
+    return data, zlib.adler32(raw) & 0xffffffff, len(raw)
+
+
+def band_ranges(width, height, supersample, jobs):
+    """ Row ranges small enough for BAND_BYTES, at least one per job """
+    row_bytes = width * 3 * supersample * supersample
+    count = max(jobs, int(math.ceil(height * row_bytes / float(BAND_BYTES))))
+    rows = max(1, int(math.ceil(height / float(count))))
+    return [(r, min(r + rows, height)) for r in range(0, height, rows)]
+
+
+def rasterize(proj, filename, width, height=None, supersample=1, jobs=None, background='#FFFFFF', level=6,
+              cache=None):
+    """
+        Render proj to a width by height PNG (height defaults to keeping the
+        canvas aspect ratio). supersample averages that many samples per
+        pixel along each axis. cache (see generate_recursion) is only used
+        when rendering in this process, i.e. jobs=1, otherwise a shape
+        spanning several bands is generated once per worker.
+    """
+    canvas_w = float(proj.canvas[2] - proj.canvas[0])
+    canvas_h = float(proj.canvas[3] - proj.canvas[1])
+    if height is None:
+        height = max(1, int(round(width * canvas_h / canvas_w)))
+    jobs = job_count(jobs)
+    bands = band_ranges(width, height, supersample, jobs)
+    with WorkerPool(jobs, len(bands)) as pool, atomic_write(filename, 'wb') as f:
+        if not pool.in_process:
+            cache = None
+        elif cache is None:
+            cache = GeometryCache()
+        args = [(proj, width, height, r0, r1, supersample, background, level, cache) for r0,r1 in bands]
+        f.write(PNG_SIGNATURE)
+        # 8 bit RGB
+        f.write(png_chunk('IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        # zlib header, then each band's deflate blocks as they come in
+        f.write(png_chunk('IDAT', '\x78\x9c'))
+        adler = 1
+        for data,band_adler,length in pool.map(render_band, args):
+            f.write(png_chunk('IDAT', data))
+            adler = adler32_combine(adler, band_adler, length)
+        final = zlib.compressobj(level, zlib.DEFLATED, -15).flush(zlib.Z_FINISH)
+        f.write(png_chunk('IDAT', final + struct.pack('>I', adler)))
+        f.write(png_chunk('IEND', ''))
+    return width, height
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Render a project to PNG without the GUI.')
+    parser.add_argument('project', help='project JSON file')
+    parser.add_argument('output', nargs='?', help='PNG file (default: project name with .png)')
+    parser.add_argument('-W', '--width', type=int, default=2000, help='image width in pixels (default: 2000)')
+    parser.add_argument('-H', '--height', type=int, default=None,
+                        help='image height in pixels (default: keep the canvas aspect ratio)')
+    parser.add_argument('-s', '--supersample', type=int, default=1,
+                        help='samples per pixel along each axis for anti-aliasing (default: 1)')
+    add_jobs_argument(parser)
+    parser.add_argument('--background', default='#FFFFFF', help='color of uncovered areas (default: #FFFFFF)')
+    parser.add_argument('--level', type=int, default=6, help='zlib compression level 0-9 (default: 6)')
+    args = parser.parse_args()
+    proj = project.load_file(args.project)
+    output = args.output or (os.path.splitext(args.project)[0] + '.png')
+    start = default_timer()
+    w,h = rasterize(proj, output, args.width, args.height, args.supersample, args.jobs, args.background, args.level)
+    print '%s: %dx%d in %.2fs' % (output, w, h, default_timer() - start)
@@ -0,0 +1,360 @@
+#
+# Vector Recursion Workbench
+# Copyright (c) 2014-2016 Nathan Williams, Jason Fletcher
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+import array
+import collections
+import copy
+import hashlib
+import os
+import struct
+import sys
+import tempfile
+
+from geometry import polygon
+from mesh import MESH_COORDS, MESH_COORDS_BY_CODE, VertexTable, check_coords
+from recursion_excursion import ENGINE_VERSION, derive_shape_recursion, generate_shape_recursion
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 512
+
+#
+# Cache file layout, one file per shape named <key>.rec:
+#
+#   header      magic, engine version, little endian flag, coordinate
+#               type, grid, triangle count, vertex count
+#   vertices    x,y per vertex as float64, float32 or int32 (multiples of
+#               grid), see mesh.MESH_COORDS, native order
+#   indices     3 uint32 vertex indices per triangle, native order
+#   colors      uint16 per triangle, index into the shape's color sequence,
+#               native order
+#
+# Caches with quantized coordinates name their files <key>-<type>-<grid>.rec
+# so they can share a directory.
+#
+CACHE_MAGIC = 'VRWREC03'
+CACHE_HEADER = struct.Struct('<8sIBBdII')
+CACHE_EXT = '.rec'
+
+
+def default_cache_dir():
+    return os.path.join(os.path.expanduser('~'), '.vrw', 'cache')
+
+
+def shape_key(shape, num_colors):
+    """
+        Stable hash of everything the recursion of shape depends on. Colors
+        are stored as indices so only their count is part of the key.
+    """
+    h = hashlib.sha1()
+    h.update(struct.pack('<IIq', ENGINE_VERSION, num_colors, int(shape.depth)))
+    h.update(struct.pack('<5d?',
+                         float(shape.step),
+                         float(shape.inc),
+                         float(shape.footer),
+                         float(shape.footer_inc),
+                         float(shape.footer_offset),
+                         bool(shape.clockwise)))
+    for p in shape.poly.points:
+        h.update(struct.pack('<2d', float(p.x), float(p.y)))
+    return h.hexdigest()
+
+
+def color_indices(colors):
+    """ Map of color to (first) index within a shape's color sequence """
+    out = {}
+    for i,c in enumerate(colors):
+        out.setdefault(c, i)
+    return out
+
+
+class MemoryRecursionCache(object):
+    """
+        In-process counterpart of RecursionCache, keeps up to max_entries
+        shape recursions alive, dropping the least recently used first.
+        Polygons are shared between everything loaded from the same entry.
+    """
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def __repr__(self):
+        return 'MemoryRecursionCache(%d,hits=%d,misses=%d)' % (len(self._entries), self.hits, self.misses)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self, shape, colors):
+        key = shape_key(shape, len(colors))
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Re-insert as most recently used
+        self._entries[key] = entry
+        return [(colors[i], poly) for i,poly in entry]
+
+    def store(self, shape, colors, poly_output):
+        key = shape_key(shape, len(colors))
+        idx = color_indices(colors)
+        self._entries.pop(key, None)
+        self._entries[key] = [(idx[c], poly) for c,poly in poly_output]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+def geometry_key(shape):
+    """ Hash of what a shape's triangles depend on before depth, footer and colors """
+    h = hashlib.sha1()
+    h.update(struct.pack('<I2d?', ENGINE_VERSION, float(shape.step), float(shape.inc), bool(shape.clockwise)))
+    for p in shape.poly.points:
+        h.update(struct.pack('<2d', float(p.x), float(p.y)))
+    return h.hexdigest()
+
+
+class GeometryCache(object):
+    """
+        In-process cache for renders of the same shapes at changing depth,
+        footer or colors, e.g. animation frames. Keeps each shape's
+        triangles without footer, generated as deep as asked for so far,
+        and derives everything else from them. load() generates what is
+        missing so never misses, store() has nothing left to do.
+    """
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def __repr__(self):
+        return 'GeometryCache(%d,hits=%d,misses=%d)' % (len(self._entries), self.hits, self.misses)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self, shape, colors):
+        key = geometry_key(shape)
+        entry = self._entries.pop(key, None)
+        if (entry is not None) and (entry[0] >= shape.depth):
+            self.hits += 1
+        else:
+            self.misses += 1
+            base = copy.copy(shape)
+            # Deepening at least doubles, so a growing depth (e.g. tweened)
+            # isn't regenerated every time
+            base.depth = max(shape.depth, 2 * entry[0]) if entry else shape.depth
+            base.footer = base.footer_inc = 0.0
+            base.footer_offset = 0
+            entry = (base.depth, [poly for c,poly in generate_shape_recursion(base, [None])])
+        # Re-insert as most recently used
+        self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return derive_shape_recursion(shape, colors, entry[1])
+
+    def store(self, shape, colors, poly_output):
+        pass
+
+    def clear(self):
+        self._entries.clear()
+
+
+class RecursionCache(object):
+    """
+        Persistent, size bounded cache of generate_shape_recursion() output.
+        Entries are read straight into arrays and evicted least recently used
+        first once the directory grows past max_bytes. coords and grid
+        quantize what is stored (see mesh.VertexTable), store() then
+        returns the output as it will be loaded so every run sees the same.
+    """
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, coords='f64', grid=None):
+        check_coords(coords, grid)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.coords = coords
+        self.grid = grid if coords == 'i32' else None
+        self._tag = '' if coords == 'f64' else '-%s-%r' % (coords, self.grid or 0.0)
+        self.hits = 0
+        self.misses = 0
+        self._total_bytes = None
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def __repr__(self):
+        return 'RecursionCache(%s,hits=%d,misses=%d)' % (self.directory, self.hits, self.misses)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self._tag + CACHE_EXT)
+
+    def load(self, shape, colors):
+        filename = self.path(shape_key(shape, len(colors)))
+        try:
+            poly_output = self._read(filename, colors)
+        except (IOError, OSError, ValueError, struct.error):
+            poly_output = None
+            # Truncated or foreign, don't trip over it again
+            self._remove(filename)
+        if poly_output is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            # Mark as recently used for eviction
+            os.utime(filename, None)
+        except OSError:
+            pass
+        return poly_output
+
+    def store(self, shape, colors, poly_output):
+        filename = self.path(shape_key(shape, len(colors)))
+        color_idx = color_indices(colors)
+        table = VertexTable(self.coords, self.grid)
+        idx = array.array('H')
+        for c,poly in poly_output:
+            table.add(poly)
+            idx.append(color_idx[c])
+        header = CACHE_HEADER.pack(CACHE_MAGIC, ENGINE_VERSION, sys.byteorder == 'little',
+                                   MESH_COORDS[self.coords][0], self.grid or 0.0, len(idx), len(table))
+        quantized = None
+        if self.coords != 'f64':
+            quantized = self._triangles(table, idx, colors)
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header)
+                table.vertices.tofile(f)
+                table.indices.tofile(f)
+                idx.tofile(f)
+            # What it replaces was already counted
+            old_size = os.path.getsize(filename) if os.path.exists(filename) else 0
+            self._replace(tmp, filename)
+        except (IOError, OSError):
+            self._remove(tmp)
+            return quantized
+        self._account(os.path.getsize(filename) - old_size)
+        return quantized
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(CACHE_EXT):
+                self._remove(os.path.join(self.directory, name))
+        self._total_bytes = 0
+
+    #
+    # Internal
+    #
+
+    def _read(self, filename, colors):
+        if not os.path.exists(filename):
+            return None
+        with open(filename, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < CACHE_HEADER.size:
+                raise ValueError('truncated header')
+            magic, version, little, code, grid, count, num_vertices = CACHE_HEADER.unpack(f.read(CACHE_HEADER.size))
+            if (magic != CACHE_MAGIC) or (version != ENGINE_VERSION) or \
+               (MESH_COORDS_BY_CODE.get(code) != self.coords) or ((grid or None) != self.grid):
+                raise ValueError('stale entry')
+            table = VertexTable(self.coords, self.grid)
+            idx = array.array('H')
+            if size != (CACHE_HEADER.size + num_vertices * 2 * table.vertices.itemsize +
+                        count * (3 * table.indices.itemsize + idx.itemsize)):
+                raise ValueError('truncated entry')
+            # Read straight into the arrays, the triangles are built from
+            # them anyway
+            table.vertices.fromfile(f, num_vertices * 2)
+            table.indices.fromfile(f, count * 3)
+            idx.fromfile(f, count)
+        if bool(little) != (sys.byteorder == 'little'):
+            table.vertices.byteswap()
+            table.indices.byteswap()
+            idx.byteswap()
+        return self._triangles(table, idx, colors)
+
+    def _triangles(self, table, idx, colors):
+        # Triangles sharing a vertex share its vec2
+        points = table.points()
+        indices = table.indices
+        poly_output = []
+        for t in range(len(idx)):
+            o = t * 3
+            tri = [points[indices[o]], points[indices[o+1]], points[indices[o+2]]]
+            poly_output.append((colors[idx[t]], polygon(tri, make_clockwise=False)))
+        return poly_output
+
+    def _replace(self, src, dst):
+        try:
+            os.rename(src, dst)
+        except OSError:
+            # Windows won't rename over an existing file
+            self._remove(dst)
+            os.rename(src, dst)
+
+    def _remove(self, filename):
+        try:
+            size = os.path.getsize(filename)
+            os.remove(filename)
+        except OSError:
+            return
+        if (self._total_bytes is not None) and filename.endswith(CACHE_EXT):
+            self._total_bytes -= size
+
+    def _entries(self):
+        out = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(CACHE_EXT):
+                continue
+            filename = os.path.join(self.directory, name)
+            try:
+                st = os.stat(filename)
+            except OSError:
+                continue
+            out.append((st.st_mtime, st.st_size, filename))
+        return out
+
+    def _account(self, size):
+        if self._total_bytes is None:
+            self._total_bytes = sum(e[1] for e in self._entries())
+        else:
+            self._total_bytes += size
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        entries = self._entries()
+        entries.sort()
+        total = sum(e[1] for e in entries)
+        for mtime,size,filename in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(filename)
+                total -= size
+            except OSError:
+                pass
+        self._total_bytes = total
@@ -21,119 +21,827 @@
 # SOFTWARE.
 #
 
-from project import project
-from geometry import polygon
+import copy
+import gzip
+import sys
+from StringIO import StringIO
+from timeit import default_timer
+
+from project import project, COLOR_NAME_TO_HTML
+from geometry import vec2, polygon
+from mesh import generate_mesh, mesh_size
+
+# Bump whenever generate_recursion output changes for the same input so that
+# results cached by older engines are ignored.
+ENGINE_VERSION = 2
 
 def svg_vec2_str(vec2):
     return "%g,%g" % (vec2.x, vec2.y)
 
-def generate_svg(canvas, recursion_list, output):
-    output.write('<?xml version="1.0" standalone="no"?>\n')
-    output.write('<!DOCTYPE svg PUBLIC "-//W3C//DTD SVG 1.1//EN" "http://www.w3.org/Graphics/SVG/1.1/DTD/svg11.dtd">\n')
-    output.write('<svg viewBox="%s" xmlns="http://www.w3.org/2000/svg" version="1.1">\n' % str(canvas)[1:-1])
+def svg_header(view_box):
+    return ('<?xml version="1.0" standalone="no"?>\n'
+            '<!DOCTYPE svg PUBLIC "-//W3C//DTD SVG 1.1//EN" "http://www.w3.org/Graphics/SVG/1.1/DTD/svg11.dtd">\n'
+            '<svg viewBox="%s" xmlns="http://www.w3.org/2000/svg" version="1.1">\n' % str(view_box)[1:-1])
+
+SVG_FOOTER = '</svg>\n'
+
+def svg_shape_comment(n):
+    return '  <!-- Shape %d -->\n' % (n + 1)
+
+def svg_polygon(c, poly):
+    return '  <polygon fill="%s" points="%s" />\n' % (c, ", ".join(map(svg_vec2_str, poly.points)))
+
+def svg_number_format(digits=None, significant=None):
+    """
+        Function formatting a coordinate with digits after the point
+        (trailing zeros dropped), else significant digits, else %g
+    """
+    if digits is not None:
+        fmt = '%%.%df' % digits
+        def fixed(v):
+            s = fmt % v
+            if '.' in s:
+                s = s.rstrip('0').rstrip('.')
+            return '0' if s == '-0' else s
+        return fixed
+    fmt = ('%%.%dg' % significant) if significant else '%g'
+    return lambda v: fmt % v
+
+def svg_element_format(digits=None, significant=None, relative=False):
+    """
+        Function of (color, poly) to its SVG element. svg_polygon() unless
+        asked for compact numbers or relative path commands.
+    """
+    if (digits is None) and (significant is None) and (not relative):
+        return svg_polygon
+    num = svg_number_format(digits, significant)
+    if not relative:
+        def compact_polygon(c, poly):
+            points = ' '.join('%s,%s' % (num(p.x), num(p.y)) for p in poly.points)
+            return '<polygon fill="%s" points="%s"/>\n' % (c, points)
+        return compact_polygon
+    def relative_path(c, poly):
+        if digits is not None:
+            # Differences of rounded points so rounding errors don't add up
+            xs = [round(p.x, digits) for p in poly.points]
+            ys = [round(p.y, digits) for p in poly.points]
+        else:
+            xs = [p.x for p in poly.points]
+            ys = [p.y for p in poly.points]
+        d = ['M%s,%s l' % (num(xs[0]), num(ys[0]))]
+        for i in range(1, len(xs)):
+            d.append('%s,%s' % (num(xs[i] - xs[i-1]), num(ys[i] - ys[i-1])))
+        return '<path fill="%s" d="%s z"/>\n' % (c, ' '.join(d))
+    return relative_path
+
+# Elements per SVG write
+SVG_BUFFER_ELEMENTS = 1024
+
+def generate_svg(canvas, recursion_list, output, progress=None, digits=None, significant=None, relative=False):
+    """
+        progress, if given, is called with the number of shapes written so
+        far. digits (fixed) or significant (relative precision) shorten the
+        coordinates, relative writes paths with relative line commands.
+        Elements are buffered and written SVG_BUFFER_ELEMENTS at a time.
+    """
+    element = svg_element_format(digits, significant, relative)
+    output.write(svg_header(canvas))
+    buf = []
     for n,poly_list in enumerate(recursion_list):
-        output.write('  <!-- Shape %d -->\n' % (n + 1))
+        buf.append(svg_shape_comment(n))
         for c,poly in poly_list:
-            output.write('  <polygon fill="%s" points="%s" />\n' % (c, ", ".join(map(svg_vec2_str, poly.points))))
-    output.write('</svg>\n')
+            buf.append(element(c, poly))
+            if len(buf) >= SVG_BUFFER_ELEMENTS:
+                output.write(''.join(buf))
+                del buf[:]
+        if progress is not None:
+            output.write(''.join(buf))
+            del buf[:]
+            progress(n + 1)
+    output.write(''.join(buf))
+    output.write(SVG_FOOTER)
+
+def open_svgz(fileobj):
+    """ Gzip stream for .svgz output, reproducible (no name or time stamp) """
+    return gzip.GzipFile(filename='', mode='wb', fileobj=fileobj, compresslevel=6, mtime=0)
+
+
+# Triangles per DXF write
+DXF_BUFFER_ENTITIES = 4096
+
+# Handles of the tables, records and objects every R2000 (AC1015) file
+# needs, layers and entities are numbered from DXF_FIRST_HANDLE
+DXF_FIRST_HANDLE = 0x20
+DXF_MODEL_SPACE = '17'
+DXF_PLOT_STYLE = 'F'
+
+DXF_RECORD = '0\n%s\n%s\n%s\n330\n%s\n100\nAcDbSymbolTableRecord\n100\n%s\n2\n%s\n70\n0\n'
+
+DXF_LTYPES = ''.join(DXF_RECORD % ('LTYPE', 5, handle, 5, 'AcDbLinetypeTableRecord', name) +
+                     '3\n%s\n72\n65\n73\n0\n40\n0.0\n' % description
+                     for handle,name,description in (('14', 'ByBlock', ''), ('15', 'ByLayer', ''),
+                                                     ('16', 'Continuous', 'Solid line')))
+
+DXF_BLOCKS = ('0\nSECTION\n2\nBLOCKS\n'
+              '0\nBLOCK\n5\n18\n330\n17\n100\nAcDbEntity\n8\n0\n100\nAcDbBlockBegin\n'
+              '2\n*Model_Space\n70\n0\n10\n0.0\n20\n0.0\n30\n0.0\n3\n*Model_Space\n1\n\n'
+              '0\nENDBLK\n5\n19\n330\n17\n100\nAcDbEntity\n8\n0\n100\nAcDbBlockEnd\n'
+              '0\nBLOCK\n5\n1B\n330\n1A\n100\nAcDbEntity\n67\n1\n8\n0\n100\nAcDbBlockBegin\n'
+              '2\n*Paper_Space\n70\n0\n10\n0.0\n20\n0.0\n30\n0.0\n3\n*Paper_Space\n1\n\n'
+              '0\nENDBLK\n5\n1C\n330\n1A\n100\nAcDbEntity\n67\n1\n8\n0\n100\nAcDbBlockEnd\n'
+              '0\nENDSEC\n')
+
+DXF_OBJECTS = ('0\nSECTION\n2\nOBJECTS\n'
+               '0\nDICTIONARY\n5\nC\n330\n0\n100\nAcDbDictionary\n281\n1\n'
+               '3\nACAD_GROUP\n350\nD\n3\nACAD_PLOTSTYLENAME\n350\nE\n'
+               '0\nDICTIONARY\n5\nD\n330\nC\n100\nAcDbDictionary\n281\n1\n'
+               '0\nACDBDICTIONARYWDFLT\n5\nE\n330\nC\n100\nAcDbDictionary\n281\n1\n3\nNormal\n350\nF\n'
+               '100\nAcDbDictionaryWithDefault\n340\nF\n'
+               '0\nACDBPLACEHOLDER\n5\nF\n330\nE\n'
+               '0\nENDSEC\n')
+
+def dxf_layer_name(n, color):
+    """ Layer per shape and color, e.g. S01_000000 """
+    return 'S%02d_%s' % (n + 1, COLOR_NAME_TO_HTML.get(color, color).lstrip('#').upper())
+
+def dxf_true_color(color):
+    return int(COLOR_NAME_TO_HTML.get(color, color).lstrip('#'), 16)
+
+def dxf_table(name, handle, records, count, extra=''):
+    return ('0\nTABLE\n2\n%s\n5\n%s\n330\n0\n100\nAcDbSymbolTable\n70\n%d\n%s%s0\nENDTAB\n' %
+            (name, handle, count, extra, records))
+
+def dxf_tables(layers):
+    """ TABLES section with the standard entries plus layers [(name, rgb)] """
+    layer_records = [DXF_RECORD % ('LAYER', 5, '10', 2, 'AcDbLayerTableRecord', '0') +
+                     '62\n7\n6\nContinuous\n390\n%s\n' % DXF_PLOT_STYLE]
+    for i,(name,rgb) in enumerate(layers):
+        layer_records.append(DXF_RECORD % ('LAYER', 5, '%X' % (DXF_FIRST_HANDLE + i), 2, 'AcDbLayerTableRecord', name) +
+                             '62\n7\n420\n%d\n6\nContinuous\n390\n%s\n' % (rgb, DXF_PLOT_STYLE))
+    return ''.join([
+        '0\nSECTION\n2\nTABLES\n',
+        dxf_table('VPORT', '8', '', 0),
+        dxf_table('LTYPE', '5', DXF_LTYPES, 3),
+        dxf_table('LAYER', '2', ''.join(layer_records), len(layer_records)),
+        dxf_table('STYLE', '3', DXF_RECORD % ('STYLE', 5, '11', 3, 'AcDbTextStyleTableRecord', 'Standard') +
+                  '40\n0.0\n41\n1.0\n50\n0.0\n71\n0\n42\n2.5\n3\ntxt\n4\n\n', 1),
+        dxf_table('VIEW', '6', '', 0),
+        dxf_table('UCS', '7', '', 0),
+        dxf_table('APPID', '9', DXF_RECORD % ('APPID', 5, '12', 9, 'AcDbRegAppTableRecord', 'ACAD'), 1),
+        dxf_table('DIMSTYLE', 'A', DXF_RECORD % ('DIMSTYLE', 105, '13', 'A', 'AcDbDimStyleTableRecord', 'Standard'), 1,
+                  '100\nAcDbDimStyleTable\n'),
+        dxf_table('BLOCK_RECORD', '1',
+                  DXF_RECORD % ('BLOCK_RECORD', 5, DXF_MODEL_SPACE, 1, 'AcDbBlockTableRecord', '*Model_Space') +
+                  DXF_RECORD % ('BLOCK_RECORD', 5, '1A', 1, 'AcDbBlockTableRecord', '*Paper_Space'), 2),
+        '0\nENDSEC\n'])
+
+def generate_dxf(canvas, recursion_list, output, progress=None):
+    """
+        Writes the recursion as an AutoCAD 2000 DXF of LWPOLYLINE entities,
+        one layer per shape and color. y is flipped as DXF y points up.
+        Entities are buffered and written DXF_BUFFER_ENTITIES at a time.
+    """
+    flip = canvas[1] + canvas[3]
+    layers = []
+    for n,poly_list in enumerate(recursion_list):
+        seen = set()
+        for c,poly in poly_list:
+            if c not in seen:
+                seen.add(c)
+                layers.append((dxf_layer_name(n, c), dxf_true_color(c)))
+    handle = DXF_FIRST_HANDLE + len(layers)
+    handle_seed = handle + sum(len(poly_list) for poly_list in recursion_list)
+    output.write('0\nSECTION\n2\nHEADER\n9\n$ACADVER\n1\nAC1015\n9\n$HANDSEED\n5\n%X\n'
+                 '9\n$EXTMIN\n10\n%g\n20\n%g\n30\n0.0\n9\n$EXTMAX\n10\n%g\n20\n%g\n30\n0.0\n0\nENDSEC\n'
+                 '0\nSECTION\n2\nCLASSES\n0\nENDSEC\n' %
+                 (handle_seed, canvas[0], canvas[1], canvas[2], canvas[3]))
+    output.write(dxf_tables(layers))
+    output.write(DXF_BLOCKS)
+    output.write('0\nSECTION\n2\nENTITIES\n')
+    buf = []
+    for n,poly_list in enumerate(recursion_list):
+        entity_heads = {}
+        for c,poly in poly_list:
+            head = entity_heads.get(c)
+            if head is None:
+                head = entity_heads[c] = ('100\nAcDbEntity\n8\n%s\n420\n%d\n100\nAcDbPolyline\n' %
+                                          (dxf_layer_name(n, c), dxf_true_color(c)))
+            buf.append('0\nLWPOLYLINE\n5\n%X\n330\n%s\n' % (handle, DXF_MODEL_SPACE))
+            handle += 1
+            buf.append(head)
+            buf.append('90\n%d\n70\n1\n' % len(poly.points))
+            for p in poly.points:
+                buf.append('10\n%g\n20\n%g\n' % (p.x, flip - p.y))
+            if len(buf) >= DXF_BUFFER_ENTITIES * 6:
+                output.write(''.join(buf))
+                del buf[:]
+        if progress is not None:
+            output.write(''.join(buf))
+            del buf[:]
+            progress(n + 1)
+    output.write(''.join(buf))
+    output.write('0\nENDSEC\n')
+    output.write(DXF_OBJECTS)
+    output.write('0\nEOF\n')
+
+
+# Why a shape's recursion ended
+STOP_DEPTH = 'depth'        # ran all shape.depth iterations
+STOP_STEP = 'step'          # step + inc left (0.0, 1.0)
+STOP_FOOTER = 'footer'      # footer_scale went negative
+STOP_DEGENERATE = 'degenerate'
+STOP_DISABLED = 'disabled'
+STOP_CACHED = 'cached'      # loaded from a cache, not generated
+STOP_OFF_CANVAS = 'off canvas'
+
+
+def _object_sizes():
+    """ Bytes taken by the objects making up one vec2, polygon and output tuple """
+    v = vec2(0.5, 0.5)
+    p = polygon([v, v, v], make_clockwise=False)
+    vec = sys.getsizeof(v) + sys.getsizeof(v.__dict__) + 2 * sys.getsizeof(0.5)
+    poly = sys.getsizeof(p) + sys.getsizeof(p.__dict__) + sys.getsizeof(p.points)
+    return vec, poly, sys.getsizeof(('', p))
+
+
+class ShapeStats(object):
+    """ What generate_recursion did for one shape """
+    def __init__(self, index):
+        self.index = index
+        self.iterations = 0
+        self.stop_reason = None
+        self.triangles = 0
+        self.recurse_s = 0.0
+        self.triangulate_s = 0.0
+        self.footer_s = 0.0
+        # Estimated from object sizes, excludes shared color strings
+        self.bytes_allocated = 0
+
+    def __repr__(self):
+        return 'ShapeStats(%d,%s,iterations=%d,triangles=%d)' % (self.index, self.stop_reason, self.iterations, self.triangles)
+
+    def total_s(self):
+        return self.recurse_s + self.triangulate_s + self.footer_s
+
+
+class RecursionStats(object):
+    """
+        Per shape statistics collected by generate_recursion when passed
+        one of these. hook, if given, is called with each ShapeStats as
+        soon as that shape is done.
+    """
+    def __init__(self, hook=None):
+        self.hook = hook
+        self.shapes = []
+        self.wall_s = 0.0
+
+    def add(self, shape_stats):
+        self.shapes.append(shape_stats)
+        if self.hook:
+            self.hook(shape_stats)
+
+    def triangles(self):
+        return sum(s.triangles for s in self.shapes)
+
+    def bytes_allocated(self):
+        return sum(s.bytes_allocated for s in self.shapes)
+
+    def stop_reasons(self):
+        out = {}
+        for s in self.shapes:
+            out[s.stop_reason] = out.get(s.stop_reason, 0) + 1
+        return out
+
+    def phase_totals(self):
+        return (sum(s.recurse_s for s in self.shapes),
+                sum(s.triangulate_s for s in self.shapes),
+                sum(s.footer_s for s in self.shapes))
+
+    def report(self, output):
+        output.write('Shape  Iter  Triangles  Stop        Recurse  Triangulate   Footer       KB\n')
+        for s in self.shapes:
+            output.write('%5d %5d %10d  %-10s %8.4fs %10.4fs %8.4fs %8d\n' %
+                         (s.index + 1, s.iterations, s.triangles, s.stop_reason,
+                          s.recurse_s, s.triangulate_s, s.footer_s, s.bytes_allocated // 1024))
+        r,t,f = self.phase_totals()
+        output.write('Total %5s %10d  %-10s %8.4fs %10.4fs %8.4fs %8d  (%.4fs wall)\n' %
+                     ('', self.triangles(), '', r, t, f, self.bytes_allocated() // 1024, self.wall_s))
+
+
+def shape_colors(shape, colors):
+    """ Color sequence used by shape, taking reverse_colors into account """
+    if shape.reverse_colors:
+        colors = list(colors)
+        colors.reverse()
+    return colors
+
+
+def plan_shape_recursion(shape):
+    """
+        (iterations, stop reason) generate_shape_recursion() will end up
+        with. Only the step and footer arithmetic is replayed, in the same
+        order, so the answer is exact without touching any geometry.
+    """
+    step = shape.step / 2.0
+    inc = shape.inc / 2.0
+    if not shape.clockwise:
+        step = 1.0 - step
+        inc = 0.0 - inc
+    footer_scale = 1.0 - shape.footer
+    for d in range(shape.depth):
+        if d >= shape.footer_offset:
+            footer_scale -= shape.footer_inc
+            if footer_scale < 0:
+                return d, STOP_FOOTER
+        step += inc
+        if (step <= 0.0) or (step >= 1.0):
+            return d + 1, STOP_STEP
+    return shape.depth, STOP_DEPTH
+
+
+class ShapePlan(object):
+    """ What generate_recursion will produce for one shape, see plan_recursion() """
+    def __init__(self, index, shape):
+        self.index = index
+        if shape.disabled:
+            self.iterations, self.stop_reason = 0, STOP_DISABLED
+        else:
+            self.iterations, self.stop_reason = plan_shape_recursion(shape)
+        self.triangles = self.iterations * len(shape.poly.points)
+
+    def __repr__(self):
+        return 'ShapePlan(%d,%s,iterations=%d,triangles=%d)' % (self.index, self.stop_reason, self.iterations, self.triangles)
+
+
+def plan_recursion(proj):
+    """ ShapePlan per shape of proj, nothing is generated """
+    return [ShapePlan(n, s) for n,s in enumerate(proj.shapes)]
+
+
+def derive_shape_recursion(shape, colors, base):
+    """
+        generate_shape_recursion(shape, colors) from base, the triangles
+        (polygons only) of the same shape generated without footer and at
+        least as deep. Only the coloring and footer scaling are redone, in
+        the same order as the engine, so the output is identical.
+    """
+    iterations = plan_shape_recursion(shape)[0]
+    l = len(shape.poly.points)
+    footer_scale = 1.0 - shape.footer
+    poly_output = []
+    for d in range(iterations):
+        c = colors[d % len(colors)]
+        if d >= shape.footer_offset:
+            footer_scale -= shape.footer_inc
+        tris = base[d*l:(d+1)*l]
+        if footer_scale != 1.0:
+            tris = [tri_poly.scale(footer_scale) or tri_poly for tri_poly in tris]
+        poly_output.extend([(c, tri_poly) for tri_poly in tris])
+    return poly_output
+
+
+# Writers estimate_output_bytes() knows, by file extension
+OUTPUT_FORMATS = {
+    'svg': generate_svg,
+    'dxf': generate_dxf,
+    'vrwm': generate_mesh,
+}
+
+# Stand-in for size estimates, 6 significant digits like most coordinates
+PLAN_TRIANGLE = polygon([vec2(123.456, 234.567), vec2(345.678, 123.456), vec2(234.567, 345.678)],
+                        make_clockwise=False)
 
+# Exports planned past either of these get a warning first
+PLAN_WARN_TRIANGLES = 5000000
+PLAN_WARN_BYTES = 1024 * 1024 * 1024
 
-def generate_recursion(proj):
+def estimate_output_bytes(proj, plans, fmt):
+    """
+        Bytes proj would take written as fmt (a key of OUTPUT_FORMATS).
+        The writer is run on PLAN_TRIANGLE, once per shape and color used,
+        and scaled up to the planned triangle counts. For vrwm it allows a
+        vertex per triangle plus the shape corners, about what recursion
+        adds, so it is at most a little high.
+    """
+    generate = OUTPUT_FORMATS[fmt]
+    def size(rec_list):
+        output = StringIO()
+        generate(proj.canvas, rec_list, output)
+        return len(output.getvalue())
+    standin = []
+    for s,plan in zip(proj.shapes, plans):
+        colors = shape_colors(s, proj.colors)
+        used = []
+        for d in range(min(plan.iterations, len(colors))):
+            if colors[d] not in used:
+                used.append(colors[d])
+        standin.append([(c, PLAN_TRIANGLE) for c in used])
+    triangles = sum(p.triangles for p in plans)
+    if fmt == 'vrwm':
+        palette = set(c for r in standin for c,poly in r)
+        corners = sum(len(s.poly.points) for s,plan in zip(proj.shapes, plans) if plan.triangles)
+        return mesh_size(len(palette), len(plans), triangles, triangles + corners)
+    c = proj.colors[0] if proj.colors else '#000000'
+    per_triangle = size([[(c, PLAN_TRIANGLE)] * 2]) - size([[(c, PLAN_TRIANGLE)]])
+    extra = triangles - sum(len(r) for r in standin)
+    return size(standin) + extra * per_triangle
+
+
+def plan_warning(proj, fmt, plans=None):
+    """ Message if writing proj as fmt would be huge, otherwise None """
+    if plans is None:
+        plans = plan_recursion(proj)
+    triangles = sum(p.triangles for p in plans)
+    size = estimate_output_bytes(proj, plans, fmt)
+    if (triangles < PLAN_WARN_TRIANGLES) and (size < PLAN_WARN_BYTES):
+        return None
+    return 'This writes %d triangles, about %.0f MB of %s.' % (triangles, size / (1024.0 * 1024.0), fmt.upper())
+
+
+def generate_shape_recursion(shape, colors, stats=None):
+    """
+        Returns list of color,polygon tuples for a single (enabled) shape:
+            [ ('color', poly_recursion0), ('color', poly_recursion1), ... ]
+        colors should already be ordered by shape_colors(). If stats (a
+        ShapeStats) is given it is filled in, otherwise nothing is timed.
+    """
+    step = shape.step
+    inc = shape.inc
+    footer_scale = 1.0 - shape.footer
+    footer_inc = shape.footer_inc
+    footer_offset = shape.footer_offset
+    poly = shape.poly
+    # real step (0.0,0.5) appears clockwise and (0.5, 1.0) counter-clockwise
+    step /= 2.0
+    inc /= 2.0
+    if not shape.clockwise:
+        step = 1.0 - step
+        inc = 0.0 - inc
+    l = len(poly.points)
+    # Sized up front, the plan is exact
+    iterations = plan_shape_recursion(shape)[0]
+    poly_output = [None] * (iterations * l)
+    k = 0
+    stop_reason = STOP_DEPTH
+    if stats is not None:
+        timer = default_timer
+        vec_size, poly_size, tuple_size = _object_sizes()
+    for d in range(shape.depth):
+        c = colors[d % len(colors)]
+        if stats is not None:
+            t0 = timer()
+        new_poly = poly.recurse(step)
+        if stats is not None:
+            t1 = timer()
+            stats.recurse_s += t1 - t0
+        if new_poly is None:
+            stop_reason = STOP_DEGENERATE
+            break
+        if d >= footer_offset:
+            footer_scale -= footer_inc
+            if footer_scale < 0:
+                stop_reason = STOP_FOOTER
+                break
+        #
+        # 0 is poly[0], 0` is new_poly[0], etc:
+        #
+        # 0...0`....1
+        # .         .
+        # .         .
+        # .         .
+        # .         1`
+        # 3`        .
+        # .         .
+        # .         .
+        # .         .
+        # 3....2`...2
+        #
+        # Would triangulate as:
+        #   [0, 0`, 3`],
+        #   [1, 1`, 0`],
+        #   [2, 2`, 1`],
+        #   [3, 3`, 2`]
+        #
+        # That is, for i in p:
+        #   [i, i`, (i-1)`]
+        #
+        assert len(poly.points) == len(new_poly.points)
+        # Starting poly clockwise => tri already is
+        tris = [polygon([poly.points[i], new_poly.points[i], new_poly.points[(i-1)%l]], make_clockwise=False)
+                for i in range(l)]
+        if stats is not None:
+            t2 = timer()
+            stats.triangulate_s += t2 - t1
+        # Footer shrinks tri to add a gap, zero area ones have no center
+        # to shrink towards and stay as they are
+        if footer_scale != 1.0:
+            tris = [tri_poly.scale(footer_scale) or tri_poly for tri_poly in tris]
+        poly_output[k:k+l] = [(c, tri_poly) for tri_poly in tris]
+        k += l
+        if stats is not None:
+            stats.footer_s += timer() - t2
+            stats.iterations += 1
+            # new_poly, its points and the triangles plus their output tuples
+            stats.bytes_allocated += poly_size + l * (vec_size + poly_size + tuple_size)
+            if footer_scale != 1.0:
+                stats.bytes_allocated += l * (poly_size + 3 * vec_size)
+        poly = new_poly
+        step += inc
+        if (step <= 0.0) or (step >= 1.0):
+            stop_reason = STOP_STEP
+            break
+    # Only a degenerate polygon, which the plan can't see, stops short
+    del poly_output[k:]
+    if stats is not None:
+        stats.stop_reason = stop_reason
+        stats.triangles = len(poly_output)
+    return poly_output
+
+
+def iteration_bounds(shape, poly_output):
+    """
+        Bounds (min x, min y, max x, max y) per iteration of a shape's
+        poly_output, outermost first. Each includes every later iteration
+        so once one is out of view or small enough, so is the rest.
+    """
+    n = len(shape.poly.points)
+    out = []
+    x0 = y0 = float('inf')
+    x1 = y1 = float('-inf')
+    # Innermost first, growing outwards
+    for start in reversed(range(0, len(poly_output), n)):
+        group = poly_output[start:start+n]
+        xs = [p.x for c,poly in group for p in poly.points]
+        ys = [p.y for c,poly in group for p in poly.points]
+        x0 = min(x0, min(xs))
+        y0 = min(y0, min(ys))
+        x1 = max(x1, max(xs))
+        y1 = max(y1, max(ys))
+        out.append((x0, y0, x1, y1))
+    out.reverse()
+    return out
+
+
+def rect_relation(bounds, rect):
+    """ 'outside', 'inside' or 'crossing' of bounds against rect, both (x0, y0, x1, y1) """
+    if (bounds[2] <= rect[0]) or (bounds[0] >= rect[2]) or (bounds[3] <= rect[1]) or (bounds[1] >= rect[3]):
+        return 'outside'
+    if (bounds[0] >= rect[0]) and (bounds[1] >= rect[1]) and (bounds[2] <= rect[2]) and (bounds[3] <= rect[3]):
+        return 'inside'
+    return 'crossing'
+
+
+def cull_shape_recursion(shape, poly_output, rect, clip=False):
+    """
+        poly_output without the triangles outside rect (x0, y0, x1, y1),
+        those crossing its edge clipped to it if clip. Iterations are
+        tested outermost first by iteration_bounds(), so as soon as one is
+        wholly inside or outside, every later one is kept or dropped
+        without looking at its triangles.
+    """
+    relation = rect_relation(shape.poly.bounds(), rect)
+    if relation != 'crossing':
+        return poly_output if relation == 'inside' else []
+    n = len(shape.poly.points)
+    out = []
+    for i,bounds in enumerate(iteration_bounds(shape, poly_output)):
+        relation = rect_relation(bounds, rect)
+        if relation == 'outside':
+            break
+        if relation == 'inside':
+            out.extend(poly_output[i*n:])
+            break
+        for c,poly in poly_output[i*n:(i+1)*n]:
+            relation = rect_relation(poly.bounds(), rect)
+            if relation == 'outside':
+                continue
+            if clip and (relation == 'crossing'):
+                poly = poly.clip(*rect)
+                if poly is None:
+                    continue
+            out.append((c, poly))
+    return out
+
+
+def cull_recursion(proj, rec_list, clip=False):
+    """ rec_list of proj culled to the canvas, see cull_shape_recursion() """
+    return [cull_shape_recursion(s, r, proj.canvas, clip) for s,r in zip(proj.shapes, rec_list)]
+
+
+def shape_recursion(shape, palette, cache=None, stats=None):
+    """
+        Recursion of a single shape of a project with the given palette,
+        empty if disabled. Goes through cache (see generate_recursion) and
+        fills in stats (a ShapeStats) if given.
+    """
+    if shape.disabled:
+        if stats is not None:
+            stats.stop_reason = STOP_DISABLED
+        return []
+    colors = shape_colors(shape, palette)
+    poly_output = None
+    if cache is not None:
+        poly_output = cache.load(shape, colors)
+        if (poly_output is not None) and (stats is not None):
+            stats.stop_reason = STOP_CACHED
+            stats.triangles = len(poly_output)
+            stats.iterations = len(poly_output) // len(shape.poly.points)
+    if poly_output is None:
+        poly_output = generate_shape_recursion(shape, colors, stats)
+        if cache is not None:
+            # Caches that store a lossy copy hand it back, so hits and
+            # misses give the same output
+            poly_output = cache.store(shape, colors, poly_output) or poly_output
+    return poly_output
+
+
+def generate_recursion(proj, cache=None, stats=None):
     """
         Returns list of list of color,polygon tuples:
         [
             [ ('color', poly0_recursion0), ('color', poly1_recursion1), ...],
             [ ('color', poly1_recursion0), ... ]
         ]
+        If a cache (see recursion_cache) is given, shapes already in it are
+        loaded instead of generated and newly generated ones are stored.
+        If stats (a RecursionStats) is given, it is filled in per shape.
     """
     all_output = []
+    if stats is None:
+        for shape in proj.shapes:
+            all_output.append(shape_recursion(shape, proj.colors, cache))
+        return all_output
+    start = default_timer()
     for n,shape in enumerate(proj.shapes):
-        if shape.disabled:
-            all_output.append([])
+        shape_stats = ShapeStats(n)
+        all_output.append(shape_recursion(shape, proj.colors, cache, shape_stats))
+        stats.add(shape_stats)
+    stats.wall_s += default_timer() - start
+    return all_output
+
+
+def budget_depths(proj, budget):
+    """
+        Depth per shape so the whole project comes to about budget
+        triangles. Shapes count what they generate before stopping by
+        themselves (see plan_recursion()) and if the project fits the
+        budget every depth is left alone. Otherwise each shape's share
+        follows its area on the canvas and is turned into iterations by its
+        vertex count (one triangle per vertex per iteration). What a shape
+        can't use is shared among the rest. Shapes with no area on the
+        canvas keep their depth, the others keep at least one iteration.
+    """
+    x0,y0,x1,y1 = proj.canvas
+    depths = [s.depth for s in proj.shapes]
+    plans = plan_recursion(proj)
+    if sum(p.triangles for p in plans) <= budget:
+        return depths
+    remaining = float(budget)
+    weights = {}
+    for i,s in enumerate(proj.shapes):
+        if s.disabled:
             continue
-        if shape.reverse_colors:
-            colors = list(proj.colors)
-            colors.reverse()
+        visible = s.poly.clip(x0, y0, x1, y1)
+        area = visible.area() if visible else 0.0
+        if area > 0:
+            weights[i] = area
         else:
-            colors = proj.colors
-        step = shape.step
-        inc = shape.inc
-        footer_scale = 1.0 - shape.footer
-        footer_inc = shape.footer_inc
-        footer_offset = shape.footer_offset
-        poly = shape.poly
-        # real step (0.0,0.5) appears clockwise and (0.5, 1.0) counter-clockwise
-        step /= 2.0
-        inc /= 2.0
-        if not shape.clockwise:
-            step = 1.0 - step
-            inc = 0.0 - inc
-        poly_output = []
-        for d in range(shape.depth):
-            c = colors[d % len(colors)]
-            new_poly = poly.recurse(step)
-            if new_poly is None:
-                break
-            if d >= footer_offset:
-                footer_scale -= footer_inc
-                if footer_scale < 0:
-                    break
-            #
-            # 0 is poly[0], 0` is new_poly[0], etc:
-            #
-            # 0...0`....1
-            # .         .
-            # .         .
-            # .         .
-            # .         1`
-            # 3`        .
-            # .         .
-            # .         .
-            # .         .
-            # 3....2`...2
-            #
-            # Would triangulate as:
-            #   [0, 0`, 3`],
-            #   [1, 1`, 0`],
-            #   [2, 2`, 1`],
-            #   [3, 3`, 2`]
-            #
-            # That is, for i in p:
-            #   [i, i`, (i-1)`]
-            #
-            assert len(poly.points) == len(new_poly.points)
-            l = len(poly.points)
-            for i in range(l):
-                tri = [
-                    poly.points[i],
-                    new_poly.points[i],
-                    new_poly.points[(i-1)%l]
-                ]
-                # Starting poly clockwise => tri already is
-                tri_poly = polygon(tri, make_clockwise=False)
-                # Footer shrinks tri to add a gap
-                if footer_scale != 1.0:
-                    tri_poly = tri_poly.scale(footer_scale)
-                poly_output.append((c, tri_poly))
-            poly = new_poly
-            step += inc
-            if (step <= 0.0) or (step >= 1.0):
-                print 'Recursion stopped due to step size'
-                break
-        all_output.append(poly_output)
-    return all_output
+            remaining -= plans[i].triangles
+    # Shapes needing the fewest triangles for their area first, so what
+    # they leave over goes to the ones after them
+    order = sorted(weights, key=lambda i: plans[i].triangles / weights[i])
+    total = sum(weights.values())
+    for i in order:
+        n = len(proj.shapes[i].poly.points)
+        iterations = int(max(0.0, remaining) * weights[i] / total // n)
+        if iterations < plans[i].iterations:
+            depths[i] = max(1, iterations)
+        remaining -= min(depths[i], plans[i].iterations) * n
+        total -= weights[i]
+    return depths
+
+
+def generate_budget_recursion(proj, budget, cache=None, stats=None):
+    """
+        generate_recursion() limited to about budget triangles for previews,
+        see budget_depths(). Returns (recursion list, indices of shapes cut
+        short of their depth). Exports should use generate_recursion().
+    """
+    depths = budget_depths(proj, budget)
+    shapes = []
+    for s,d in zip(proj.shapes, depths):
+        if d < s.depth:
+            s = copy.copy(s)
+            s.depth = d
+        shapes.append(s)
+    rl = generate_recursion(project(proj.canvas, proj.colors, shapes), cache, stats)
+    truncated = []
+    for i,(s,d,r) in enumerate(zip(proj.shapes, depths, rl)):
+        # Only if it would have gone on and ran every iteration it was
+        # given, otherwise it stopped by itself
+        if (d < s.depth) and (d < plan_shape_recursion(s)[0]) and (len(r) >= d * len(s.poly.points)):
+            truncated.append(i)
+    return rl, truncated
+
+
+def generate_visible_recursion(proj, cache=None, stats=None, clip=False):
+    """
+        generate_recursion() of only what shows on the canvas, see
+        cull_recursion(). Shapes entirely off the canvas aren't generated,
+        their stats say STOP_OFF_CANVAS.
+    """
+    shapes = []
+    off_canvas = []
+    for i,s in enumerate(proj.shapes):
+        if (not s.disabled) and (rect_relation(s.poly.bounds(), proj.canvas) == 'outside'):
+            s = copy.copy(s)
+            s.disabled = True
+            off_canvas.append(i)
+        shapes.append(s)
+    rl = generate_recursion(project(proj.canvas, proj.colors, shapes), cache, stats)
+    if stats is not None:
+        shape_stats = stats.shapes[-len(shapes):]
+        for i in off_canvas:
+            shape_stats[i].stop_reason = STOP_OFF_CANVAS
+    return cull_recursion(proj, rl, clip)
+
+
+def generate_recursion_with_stats(proj, cache=None, hook=None):
+    """ generate_recursion() returning (recursion list, RecursionStats) """
+    stats = RecursionStats(hook)
+    rec_list = generate_recursion(proj, cache, stats)
+    return rec_list, stats
 
 
 if __name__ == "__main__":
-    import sys
-    if len(sys.argv) not in (2,3):
-        sys.stderr.write('Usage: %s <project.json> [output.svg]\n' % sys.argv[0])
-        sys.exit(1)
-    proj = project.load_file(sys.argv[1])
-    rec_list = generate_recursion(proj)
-    if len(sys.argv) == 3:
-        output = open(sys.argv[2], 'w')
+    import argparse
+    parser = argparse.ArgumentParser(description='Write the recursion of a project as an SVG or DXF.')
+    parser.add_argument('project', help='project JSON file')
+    parser.add_argument('output', nargs='?', help='output SVG file, DXF if it ends in .dxf (default: stdout)')
+    parser.add_argument('--dxf', action='store_true', help='write DXF instead of SVG')
+    parser.add_argument('--digits', type=int, default=None,
+                        help='SVG coordinates with this many digits after the point')
+    parser.add_argument('--significant', type=int, default=None,
+                        help='SVG coordinates with this many significant digits (default: 6)')
+    parser.add_argument('--relative', action='store_true',
+                        help='SVG paths with relative line commands instead of polygons')
+    parser.add_argument('--coords', choices=('f64', 'f32', 'i32'), default='f64',
+                        help='.vrwm and --cache-dir coordinates as doubles, floats or integer '
+                             'multiples of --grid, equal vertices stored once (default: f64)')
+    parser.add_argument('--grid', type=float, default=None,
+                        help='spacing of i32 coordinates (default: 0.01)')
+    parser.add_argument('--cull', action='store_true',
+                        help='leave out triangles entirely off the canvas')
+    parser.add_argument('--clip', action='store_true',
+                        help='as --cull, and cut triangles crossing the canvas edge to it')
+    parser.add_argument('--cache-dir', metavar='DIR',
+                        help='reuse shape recursions cached in DIR across runs')
+    parser.add_argument('--stats', action='store_true',
+                        help='print per-shape recursion statistics to stderr')
+    parser.add_argument('--plan', action='store_true',
+                        help='print planned iterations, triangles and output sizes, generate nothing')
+    args = parser.parse_args()
+    grid = args.grid
+    if (args.coords == 'i32') and (grid is None):
+        grid = 0.01
+    cache = None
+    if args.cache_dir:
+        from recursion_cache import RecursionCache
+        cache = RecursionCache(args.cache_dir, coords=args.coords, grid=grid)
+    proj = project.load_file(args.project)
+    ext = (args.output or '').lower()
+    fmt = 'dxf' if (args.dxf or ext.endswith('.dxf')) else ('vrwm' if ext.endswith('.vrwm') else 'svg')
+    plans = plan_recursion(proj)
+    if args.plan:
+        print 'Shape  Iter  Triangles  Stop'
+        for p in plans:
+            print '%5d %5d %10d  %s' % (p.index + 1, p.iterations, p.triangles, p.stop_reason)
+        print 'Total %5s %10d' % ('', sum(p.triangles for p in plans))
+        for f in sorted(OUTPUT_FORMATS):
+            print '%-5s %14.1f KB' % (f, estimate_output_bytes(proj, plans, f) / 1024.0)
+        sys.exit(0)
+    warning = plan_warning(proj, fmt, plans)
+    if warning:
+        sys.stderr.write('Warning: %s\n' % warning)
+    stats = RecursionStats() if args.stats else None
+    if args.cull or args.clip:
+        rec_list = generate_visible_recursion(proj, cache, stats, args.clip)
+    else:
+        rec_list = generate_recursion(proj, cache, stats)
+    if stats:
+        stats.report(sys.stderr)
+    if args.output:
+        output = open(args.output, 'wb' if ext.endswith(('.svgz', '.vrwm')) else 'w')
     else:
         output = sys.stdout
-    generate_svg(proj.canvas, rec_list, output)
-
+    if fmt == 'dxf':
+        generate_dxf(proj.canvas, rec_list, output)
+    elif fmt == 'vrwm':
+        generate_mesh(proj.canvas, rec_list, output, None, args.coords, grid)
+    elif ext.endswith('.svgz'):
+        svgz = open_svgz(output)
+        generate_svg(proj.canvas, rec_list, svgz, None, args.digits, args.significant, args.relative)
+        svgz.close()
+    else:
+        generate_svg(proj.canvas, rec_list, output, None, args.digits, args.significant, args.relative)
+    output.close()
@@ -0,0 +1,324 @@
+#
+# Vector Recursion Workbench
+# Copyright (c) 2014-2016 Nathan Williams, Jason Fletcher
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+#
+# Local render service:
+#
+#   POST /render          project JSON in, SVG out
+#   POST /render?shapes=1 project JSON in, JSON object of per-shape SVGs out
+#   GET  /metrics         JSON of request counts, cache hit rate, latencies
+#
+
+import BaseHTTPServer
+import SocketServer
+import collections
+import hashlib
+import json
+import multiprocessing
+import signal
+import threading
+import urlparse
+from StringIO import StringIO
+from timeit import default_timer
+
+from project import project
+from recursion_excursion import ENGINE_VERSION, generate_recursion, generate_svg
+from export import WorkerPool, shape_svg_filename
+
+DEFAULT_PORT = 8642
+MAX_BODY_BYTES = 16 * 1024 * 1024
+LATENCY_WINDOW = 1000
+DEFAULT_TIMEOUT = 60.0
+# Waited beyond the timeout for a worker to give up by itself
+TIMEOUT_GRACE = 5.0
+
+
+class RenderTimeout(Exception):
+    pass
+
+
+def raise_timeout(signum, frame):
+    raise RenderTimeout()
+
+
+def render(data, shapes):
+    """ Worker: returns (content type, body) for a parsed project dict """
+    proj = project.load_dict(data)
+    rec_list = generate_recursion(proj)
+    if not shapes:
+        output = StringIO()
+        generate_svg(proj.canvas, rec_list, output)
+        return 'image/svg+xml', output.getvalue()
+    out = {}
+    for i,r in enumerate(rec_list):
+        if r:
+            output = StringIO()
+            generate_svg(proj.canvas, [r], output)
+            out[shape_svg_filename(i)] = output.getvalue()
+    return 'application/json', json.dumps(out, sort_keys=True)
+
+
+def render_safe(args):
+    """
+        Worker: (True, render()), (False, error) or (None, error) if it took
+        longer than timeout seconds. The timeout frees the worker where
+        there is SIGALRM, elsewhere only the request gives up waiting.
+    """
+    data, shapes, timeout = args
+    alarm = bool(timeout) and hasattr(signal, 'SIGALRM')
+    if alarm:
+        signal.signal(signal.SIGALRM, raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return True, render(data, shapes)
+    except RenderTimeout:
+        return None, 'Render took longer than %gs' % timeout
+    except Exception as e:
+        return False, '%s: %s' % (type(e).__name__, e)
+    finally:
+        if alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    i = int(round((p / 100.0) * (len(sorted_values) - 1)))
+    return sorted_values[i]
+
+
+class ResponseCache(object):
+    """ LRU of rendered responses by request hash, bounded in bytes """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._bytes = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries[key] = entry
+            return entry
+
+    def put(self, key, entry):
+        size = len(entry[1])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[1])
+            self._entries[key] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                k,e = self._entries.popitem(last=False)
+                self._bytes -= len(e[1])
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (float(self.hits) / lookups) if lookups else None,
+            }
+
+
+class RenderServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, workers, queue_size, cache_bytes, timeout=DEFAULT_TIMEOUT):
+        # Before binding so workers don't inherit the listening socket
+        self.pool = WorkerPool(workers, None)
+        workers = self.pool.jobs
+        self.render_timeout = timeout
+        BaseHTTPServer.HTTPServer.__init__(self, address, RenderHandler)
+        # Renders running plus waiting for a worker, beyond that callers
+        # get a 503 rather than piling up threads
+        self.max_pending = workers + queue_size
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+        self.cache = ResponseCache(cache_bytes)
+        self.started = default_timer()
+        self._lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self._counts = collections.Counter()
+        self._pending = 0
+
+    def count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def record_latency(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def enter(self):
+        if not self.slots.acquire(False):
+            return False
+        with self._lock:
+            self._pending += 1
+        return True
+
+    def leave(self):
+        with self._lock:
+            self._pending -= 1
+        self.slots.release()
+
+    def metrics(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            counts = dict(self._counts)
+            pending = self._pending
+        ms = lambda v: None if v is None else round(v * 1000.0, 3)
+        return {
+            'engine_version': ENGINE_VERSION,
+            'uptime_s': round(default_timer() - self.started, 3),
+            'requests': counts,
+            'pending': pending,
+            'max_pending': self.max_pending,
+            'cache': self.cache.stats(),
+            'latency_ms': {
+                'samples': len(latencies),
+                'p50': ms(percentile(latencies, 50)),
+                'p90': ms(percentile(latencies, 90)),
+                'p99': ms(percentile(latencies, 99)),
+                'max': ms(latencies[-1] if latencies else None),
+            },
+        }
+
+    def server_close(self):
+        BaseHTTPServer.HTTPServer.server_close(self)
+        self.pool.terminate()
+
+
+class RenderHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    server_version = 'VRWRender/%d' % ENGINE_VERSION
+
+    def send_body(self, code, content_type, body, extra_headers=()):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for k,v in extra_headers:
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, code, message, extra_headers=()):
+        self.server.count('error_%d' % code)
+        body = json.dumps({'error': message})
+        self.send_body(code, 'application/json', body, extra_headers)
+
+    def do_GET(self):
+        path = urlparse.urlparse(self.path).path
+        if path == '/metrics':
+            body = json.dumps(self.server.metrics(), sort_keys=True, indent=4)
+            self.send_body(200, 'application/json', body)
+        else:
+            self.send_error_json(404, 'Not found')
+
+    def do_POST(self):
+        url = urlparse.urlparse(self.path)
+        if url.path != '/render':
+            self.send_error_json(404, 'Not found')
+            return
+        start = default_timer()
+        query = urlparse.parse_qs(url.query)
+        shapes = query.get('shapes', ['0'])[0] not in ('0', '', 'false')
+        try:
+            length = int(self.headers.getheader('Content-Length'))
+        except (TypeError, ValueError):
+            self.send_error_json(411, 'Content-Length required')
+            return
+        if length > MAX_BODY_BYTES:
+            self.send_error_json(413, 'Project larger than %d bytes' % MAX_BODY_BYTES)
+            return
+        try:
+            data = json.loads(self.rfile.read(length))
+        except ValueError as e:
+            self.send_error_json(400, 'Invalid JSON: %s' % e)
+            return
+        # Same project however it was formatted => same response
+        h = hashlib.sha1(json.dumps(data, sort_keys=True, separators=(',', ':')))
+        h.update('\0%d\0%d' % (ENGINE_VERSION, shapes))
+        key = h.hexdigest()
+        entry = self.server.cache.get(key)
+        if entry is None:
+            if not self.server.enter():
+                self.send_error_json(503, 'Render queue full', [('Retry-After', '1')])
+                return
+            timeout = self.server.render_timeout
+            try:
+                ok, result = self.server.pool.apply(render_safe, (data, shapes, timeout),
+                                                    (timeout + TIMEOUT_GRACE) if timeout else None)
+            except multiprocessing.TimeoutError:
+                ok, result = None, 'Render took longer than %gs' % timeout
+            finally:
+                self.server.leave()
+            if ok is None:
+                self.send_error_json(504, result)
+                return
+            if not ok:
+                self.send_error_json(400, result)
+                return
+            entry = result
+            self.server.cache.put(key, entry)
+        self.server.count('rendered')
+        self.send_body(200, entry[0], entry[1], [('ETag', '"%s"' % key)])
+        self.server.record_latency(default_timer() - start)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Serve project renders over HTTP on this machine.')
+    parser.add_argument('-p', '--port', type=int, default=DEFAULT_PORT,
+                        help='port to listen on (default: %d)' % DEFAULT_PORT)
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='address to bind (default: 127.0.0.1, local only)')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='render processes (default: number of CPUs)')
+    parser.add_argument('-q', '--queue', type=int, default=16,
+                        help='renders allowed to wait for a worker before rejecting (default: 16)')
+    parser.add_argument('--cache-mb', type=float, default=128,
+                        help='response cache size in MB (default: 128)')
+    parser.add_argument('-t', '--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help='seconds a render may take before answering 504, 0 for no limit (default: %g)' %
+                             DEFAULT_TIMEOUT)
+    args = parser.parse_args()
+    server = RenderServer((args.host, args.port), args.workers, args.queue, int(args.cache_mb * 1024 * 1024),
+                          args.timeout)
+    print 'Serving renders on http://%s:%d/render (metrics at /metrics)' % (args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
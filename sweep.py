@@ -0,0 +1,241 @@
+#
+# Vector Recursion Workbench
+# Copyright (c) 2014-2016 Nathan Williams, Jason Fletcher
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+import itertools
+import os
+import sys
+from timeit import default_timer
+
+from project import project, shape, convert_color_names
+from recursion_excursion import derive_shape_recursion, generate_shape_recursion, shape_colors
+from export import WorkerPool, add_jobs_argument, atomic_write, job_count, write_svg
+
+# Parameters that can be swept, with how to read them from the command line
+SWEEP_PARAMS = {
+    'depth': int,
+    'step': float,
+    'inc': float,
+    'clockwise': lambda v: v.lower() in ('1', 'true', 'yes'),
+    'footer': float,
+    'footer_inc': float,
+    'footer_offset': int,
+    'reverse_colors': lambda v: v.lower() in ('1', 'true', 'yes'),
+    # Whole palette, e.g. #000000/#FFFFFF
+    'colors': lambda v: convert_color_names(v.split('/')),
+}
+
+# Only these change the triangles themselves. Variants differing in
+# anything else (depth, footer, colors) are derived from one generation.
+GEOMETRY_PARAMS = ('step', 'inc', 'clockwise')
+
+
+def sweep_variants(params):
+    """ Every combination of [(name, values)], as override dicts in order """
+    names = [name for name,values in params]
+    return [dict(zip(names, combo)) for combo in itertools.product(*[values for name,values in params])]
+
+
+def variant_label(overrides):
+    out = []
+    for k in sorted(overrides):
+        v = overrides[k]
+        out.append('%s=%s' % (k, '/'.join(v) if k == 'colors' else ('%g' % v)))
+    return ' '.join(out)
+
+
+def variant_svg_filename(index):
+    return 'variant_%03d.svg' % (index + 1)
+
+
+def apply_variant(proj, overrides, shapes=None):
+    """
+        Copy of proj with overrides applied to the shapes indexed by shapes
+        (default: all). Shapes are rebuilt so out of range values fail the
+        same checks as loading a project would.
+    """
+    colors = overrides.get('colors', proj.colors)
+    out = []
+    for i,s in enumerate(proj.shapes):
+        if (shapes is not None) and (i not in shapes):
+            out.append(s)
+            continue
+        get = lambda k: overrides.get(k, getattr(s, k))
+        out.append(shape(poly=s.poly,
+                         depth=get('depth'),
+                         step=get('step'),
+                         inc=get('inc'),
+                         clockwise=get('clockwise'),
+                         reverse_colors=get('reverse_colors'),
+                         disabled=s.disabled,
+                         footer=get('footer'),
+                         footer_inc=get('footer_inc'),
+                         footer_offset=get('footer_offset')))
+    return project(proj.canvas, colors, out)
+
+
+def geometry_key(overrides):
+    return tuple(sorted((k, v) for k,v in overrides.items() if k in GEOMETRY_PARAMS))
+
+
+def sweep_job(args):
+    """
+        Worker: renders variants sharing their geometry parameters. Each
+        shape is generated once, without footer at the deepest depth asked
+        for, and every variant is derived from that. Returns
+        [(variant index, filename, triangles)] as written.
+    """
+    directory,proj,variants,shapes = args
+    variant_projs = [(index, apply_variant(proj, overrides, shapes)) for index,overrides in variants]
+    bases = []
+    for n,s in enumerate(proj.shapes):
+        deepest = max(vp.shapes[n].depth for index,vp in variant_projs)
+        b = variant_projs[0][1].shapes[n]
+        if b.disabled:
+            bases.append(None)
+            continue
+        base_shape = shape(poly=b.poly, depth=deepest, step=b.step, inc=b.inc, clockwise=b.clockwise,
+                           reverse_colors=False, disabled=False, footer=0.0, footer_inc=0.0,
+                           footer_offset=0)
+        bases.append([poly for c,poly in generate_shape_recursion(base_shape, [None])])
+    out = []
+    for index,vp in variant_projs:
+        rec_list = []
+        for s,base in zip(vp.shapes, bases):
+            if base is None:
+                rec_list.append([])
+            else:
+                rec_list.append(derive_shape_recursion(s, shape_colors(s, vp.colors), base))
+        filename = os.path.join(directory, variant_svg_filename(index))
+        write_svg(filename, vp.canvas, rec_list)
+        out.append((index, filename, sum(len(r) for r in rec_list)))
+    return out
+
+
+def sweep_jobs(directory, proj, variants, shapes, jobs):
+    """ Variants grouped by geometry, big groups split so every worker has some """
+    groups = {}
+    for index,overrides in enumerate(variants):
+        groups.setdefault(geometry_key(overrides), []).append((index, overrides))
+    groups = sorted(groups.values(), key=lambda g: g[0][0])
+    while len(groups) < jobs:
+        largest = max(groups, key=len)
+        if len(largest) < 2:
+            break
+        groups.remove(largest)
+        half = len(largest) // 2
+        groups.extend([largest[:half], largest[half:]])
+    return [(directory, proj, g, shapes) for g in groups]
+
+
+def write_contact_sheet(filename, canvas, entries, columns):
+    """
+        SVG laying out the variant SVGs [(filename, label)] in a grid with
+        their labels. They are referenced rather than copied in, so the
+        sheet can be written before any of them exist.
+    """
+    w = canvas[2] - canvas[0]
+    h = canvas[3] - canvas[1]
+    label_h = 0.08 * h
+    rows = (len(entries) + columns - 1) // columns
+    with atomic_write(filename) as f:
+        f.write('<?xml version="1.0" standalone="no"?>\n'
+                '<svg viewBox="0, 0, %g, %g" xmlns="http://www.w3.org/2000/svg" '
+                'xmlns:xlink="http://www.w3.org/1999/xlink" version="1.1">\n' % (columns * w, rows * (h + label_h)))
+        for n,(name,label) in enumerate(entries):
+            x = (n % columns) * w
+            y = (n // columns) * (h + label_h)
+            f.write('  <image x="%g" y="%g" width="%g" height="%g" xlink:href="%s" />\n' % (x, y, w, h, name))
+            f.write('  <text x="%g" y="%g" font-family="sans-serif" font-size="%g">%d: %s</text>\n' %
+                    (x + 0.02 * w, y + h + 0.7 * label_h, 0.5 * label_h, n + 1, label))
+        f.write('</svg>\n')
+
+
+def run_sweep(directory, proj, params, shapes=None, jobs=None, columns=None, progress=None):
+    """
+        Render every combination of params [(name, values)] applied to the
+        shapes indexed by shapes (default: all), one SVG per variant plus
+        contact_sheet.svg in directory. Groups of variants are rendered in
+        jobs processes and written as they finish. progress, if given, is
+        called with (variant index, filename, triangles) for each. Returns
+        the variants as override dicts.
+    """
+    for name,values in params:
+        if name not in SWEEP_PARAMS:
+            raise ValueError('Cannot sweep %s, one of: %s' % (name, ', '.join(sorted(SWEEP_PARAMS))))
+    variants = sweep_variants(params)
+    # Check every variant before starting anything
+    for overrides in variants:
+        apply_variant(proj, overrides, shapes)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    columns = columns or max(1, int(round(len(variants) ** 0.5)))
+    write_contact_sheet(os.path.join(directory, 'contact_sheet.svg'), proj.canvas,
+                        [(variant_svg_filename(i), variant_label(o)) for i,o in enumerate(variants)], columns)
+    jobs = job_count(jobs)
+    args = sweep_jobs(directory, proj, variants, shapes, jobs)
+    with WorkerPool(jobs, len(args)) as pool:
+        for written in pool.map(sweep_job, args, ordered=False):
+            for w in written:
+                if progress is not None:
+                    progress(*w)
+    return variants
+
+
+def parse_sweep_param(text):
+    """ name=v1,v2,... """
+    name, sep, values = text.partition('=')
+    if (not sep) or (name not in SWEEP_PARAMS):
+        raise ValueError('Expected name=v1,v2,... with name one of: %s' % ', '.join(sorted(SWEEP_PARAMS)))
+    return name, [SWEEP_PARAMS[name](v) for v in values.split(',')]
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Render a project over a grid of shape parameter values.')
+    parser.add_argument('project', help='project JSON file')
+    parser.add_argument('params', nargs='+', metavar='name=v1,v2,...',
+                        help='parameter and its values, e.g. step=0.1,0.2 footer=0,0.05')
+    parser.add_argument('-s', '--shapes', help='comma separated shape numbers to change (default: all)')
+    parser.add_argument('-o', '--output-dir', metavar='DIR',
+                        help='write SVGs to DIR (default: directory named after the project)')
+    add_jobs_argument(parser)
+    parser.add_argument('-c', '--columns', type=int, default=None,
+                        help='contact sheet columns (default: square)')
+    args = parser.parse_args()
+    try:
+        params = [parse_sweep_param(p) for p in args.params]
+    except ValueError as e:
+        parser.error(str(e))
+    shapes = None
+    if args.shapes:
+        shapes = set(int(n) - 1 for n in args.shapes.split(','))
+    proj = project.load_file(args.project)
+    output_dir = args.output_dir or (os.path.splitext(args.project)[0] + '_sweep')
+    start = default_timer()
+    def report(index, filename, triangles):
+        print '%s: %d triangles' % (filename, triangles)
+        sys.stdout.flush()
+    variants = run_sweep(output_dir, proj, params, shapes, args.jobs, args.columns, report)
+    print '%d variants in %.2fs, see %s' % (len(variants), default_timer() - start,
+                                            os.path.join(output_dir, 'contact_sheet.svg'))
@@ -0,0 +1,39 @@
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from batch_render import run_batch
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       'Examples', 'GoldenRatio_001b.json')
+
+
+class BatchRenderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for d in ('a', 'b'):
+            os.makedirs(os.path.join(self.directory, d))
+            shutil.copy(EXAMPLE, os.path.join(self.directory, d, 'x.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_colliding_outputs_rejected(self):
+        inputs = [os.path.join(self.directory, d, 'x.json') for d in ('a', 'b')]
+        out = os.path.join(self.directory, 'out')
+        with self.assertRaises(ValueError):
+            run_batch(inputs, out, jobs=1, log=StringIO())
+        self.assertFalse(os.path.exists(out))
+
+    def test_same_name_in_own_directories(self):
+        inputs = [os.path.join(self.directory, d, 'x.json') for d in ('a', 'b')]
+        results = run_batch(inputs, jobs=1, log=StringIO())
+        self.assertEqual([r.error for r in results], [None, None])
+        for d in ('a', 'b'):
+            self.assertTrue(os.path.exists(os.path.join(self.directory, d, 'x.svg')))
+
+
+if __name__ == '__main__':
+    unittest.main()
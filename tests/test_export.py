@@ -0,0 +1,145 @@
+import multiprocessing.pool
+import os
+import shutil
+import stat
+import tempfile
+import time
+import unittest
+
+from export import MANIFEST_FILENAME, Manifest, WorkerPool, atomic_write, export_project_shapes
+from project import project
+
+
+def square_shape(x, **params):
+    s = {'points': [[x, 0], [x + 100, 0], [x + 100, 100], [x, 100]],
+         'depth': 10, 'step': 0.1, 'inc': 0.0, 'clockwise': True}
+    s.update(params)
+    return s
+
+
+def square(x):
+    return x * x
+
+
+def file_mode(filename):
+    return stat.S_IMODE(os.stat(filename).st_mode)
+
+
+class AtomicWriteTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.umask = os.umask(0o022)
+
+    def tearDown(self):
+        os.umask(self.umask)
+        shutil.rmtree(self.directory)
+
+    def test_new_file_follows_umask(self):
+        filename = os.path.join(self.directory, 'out.svg')
+        with atomic_write(filename) as f:
+            f.write('x')
+        self.assertEqual(file_mode(filename), 0o644)
+        os.umask(0o077)
+        other = os.path.join(self.directory, 'other.svg')
+        with atomic_write(other) as f:
+            f.write('x')
+        self.assertEqual(file_mode(other), 0o600)
+
+    def test_existing_file_keeps_its_mode(self):
+        filename = os.path.join(self.directory, 'out.svg')
+        with open(filename, 'w') as f:
+            f.write('old')
+        os.chmod(filename, 0o640)
+        with atomic_write(filename) as f:
+            f.write('new')
+        self.assertEqual(file_mode(filename), 0o640)
+        with open(filename) as f:
+            self.assertEqual(f.read(), 'new')
+
+    def test_failed_write_leaves_nothing(self):
+        filename = os.path.join(self.directory, 'out.svg')
+        with self.assertRaises(ValueError):
+            with atomic_write(filename) as f:
+                f.write('x')
+                raise ValueError()
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class ExportProjectShapesTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_empty_recursion_skipped(self):
+        proj = project.load_dict({
+            'canvas': [0, 0, 300, 100],
+            'colors': ['#000000', '#FFFFFF'],
+            'shapes': [
+                square_shape(0),
+                # Footer used up before the first iteration
+                square_shape(100, footer=0.5, footer_inc=0.6),
+                square_shape(200, disabled=True),
+            ],
+        })
+        done = []
+        written = export_project_shapes(self.directory, proj, jobs=1,
+                                        progress=lambda n, size: done.append(n))
+        self.assertEqual([os.path.basename(f) for f in written], ['01.svg'])
+        self.assertTrue(os.path.exists(os.path.join(self.directory, '01.svg')))
+        self.assertFalse(os.path.exists(os.path.join(self.directory, '02.svg')))
+        self.assertEqual(done[-1], 3)
+
+    def test_stale_files_removed(self):
+        data = {
+            'canvas': [0, 0, 400, 100],
+            'colors': ['#000000', '#FFFFFF'],
+            'shapes': [square_shape(0), square_shape(100), square_shape(200), square_shape(300)],
+        }
+        export_project_shapes(self.directory, project.load_dict(data), jobs=1)
+        data['shapes'][0]['disabled'] = True
+        # Now empty
+        data['shapes'][1].update(footer=0.5, footer_inc=0.6)
+        # Removed
+        del data['shapes'][3]
+        written = export_project_shapes(self.directory, project.load_dict(data), jobs=1, skip_unchanged=True)
+        self.assertEqual(written, [])
+        self.assertEqual(sorted(os.listdir(self.directory)), [MANIFEST_FILENAME, '03.svg'])
+        self.assertEqual(sorted(Manifest(self.directory).entries), ['03.svg'])
+
+
+class WorkerPoolTest(unittest.TestCase):
+    def test_in_process(self):
+        for jobs,tasks in ((1, 5), (4, 1), (4, 0)):
+            with WorkerPool(jobs, tasks) as pool:
+                self.assertTrue(pool.in_process)
+                self.assertEqual(list(pool.map(square, range(tasks))), [x * x for x in range(tasks)])
+
+    def test_ordered(self):
+        with WorkerPool(2, 20) as pool:
+            self.assertFalse(pool.in_process)
+            self.assertEqual(list(pool.map(square, range(20))), [x * x for x in range(20)])
+
+    def test_unordered(self):
+        with WorkerPool(2, 20) as pool:
+            self.assertEqual(sorted(pool.map(square, range(20), ordered=False)), [x * x for x in range(20)])
+
+    def test_stopped_early(self):
+        with self.assertRaises(ValueError):
+            with WorkerPool(2, 20) as pool:
+                for r in pool.map(square, range(20)):
+                    raise ValueError()
+        self.assertEqual(pool.pool._state, multiprocessing.pool.TERMINATE)
+
+    def test_apply(self):
+        with WorkerPool(1, None) as pool:
+            self.assertFalse(pool.in_process)
+            self.assertEqual(pool.apply(square, 3, 10), 9)
+            with self.assertRaises(multiprocessing.TimeoutError):
+                pool.apply(time.sleep, 5, 0.1)
+            pool.terminate()
+
+
+if __name__ == '__main__':
+    unittest.main()
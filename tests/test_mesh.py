@@ -0,0 +1,55 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mesh
+from mesh import Mesh, generate_mesh
+from project import project
+from recursion_excursion import generate_recursion
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       'Examples', 'GoldenRatio_001b.json')
+
+
+class TriangleCoordsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        proj = project.load_file(EXAMPLE)
+        self.canvas = proj.canvas
+        self.recursion = generate_recursion(proj)
+        self.numpy = mesh.numpy
+
+    def tearDown(self):
+        mesh.numpy = self.numpy
+        shutil.rmtree(self.directory)
+
+    def check(self, coords, grid=None, places=7):
+        filename = os.path.join(self.directory, 'out.vrwm')
+        with open(filename, 'wb') as f:
+            generate_mesh(self.canvas, self.recursion, f, coords=coords, grid=grid)
+        m = Mesh(filename)
+        try:
+            triangles = m.triangle_coords()
+            expected = [poly.points for poly_list in self.recursion for c,poly in poly_list]
+            self.assertEqual(len(triangles), len(expected))
+            for tri,points in zip(triangles, expected):
+                for (x,y),p in zip(tri, points):
+                    self.assertAlmostEqual(x, p.x, places)
+                    self.assertAlmostEqual(y, p.y, places)
+        finally:
+            m.close()
+
+    def test_coords(self):
+        self.check('f64')
+        self.check('f32', places=3)
+        self.check('i32', grid=0.01, places=2)
+
+    def test_without_numpy(self):
+        mesh.numpy = None
+        self.check('f64')
+        self.check('i32', grid=0.01, places=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
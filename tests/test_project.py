@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from project import project
+
+
+def square_shape(x):
+    return {'points': [[x, 0], [x + 100, 0], [x + 100, 100], [x, 100]],
+            'depth': 10, 'step': 0.1, 'inc': 0.0, 'clockwise': True}
+
+
+class EditShapeTest(unittest.TestCase):
+    def setUp(self):
+        self.proj = project.load_dict({
+            'canvas': [0, 0, 300, 100],
+            'colors': ['#000000', '#FFFFFF'],
+            'shapes': [square_shape(0), square_shape(100), square_shape(200)],
+        })
+        self.before = self.proj.snapshot()
+
+    def test_copies_once(self):
+        s = self.proj.shapes[1]
+        e = self.proj.edit_shape(s)
+        self.assertIsNot(e, s)
+        self.assertIs(self.proj.shapes[1], e)
+        self.assertIs(self.before.shapes[1], s)
+        # Owned from then on
+        self.assertIs(self.proj.edit_shape(e), e)
+
+    def test_index(self):
+        for i,s in enumerate(self.proj.shapes):
+            self.proj.edit_shape(s, i).step = 0.3
+        self.assertEqual([s.step for s in self.proj.shapes], [0.3] * 3)
+        self.assertEqual([s.step for s in self.before.shapes], [0.1] * 3)
+        self.assertEqual(len(set(map(id, self.proj.shapes + self.before.shapes))), 6)
+
+    def test_wrong_index(self):
+        with self.assertRaises(AssertionError):
+            self.proj.edit_shape(self.proj.shapes[0], 2)
+
+
+class SaveFileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.proj = project.load_dict({
+            'canvas': [0, 0, 200, 100],
+            'colors': ['#000000', '#FFFFFF'],
+            'shapes': [square_shape(0), square_shape(100)],
+        })
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_failed_save_keeps_old_file(self):
+        for name in ('p.json', 'p.vrwc'):
+            filename = os.path.join(self.directory, name)
+            self.proj.save_file(filename)
+            self.assertEqual(project.load_file(filename).to_dict(), self.proj.to_dict())
+            with open(filename, 'rb') as f:
+                saved = f.read()
+            broken = self.proj.snapshot()
+            broken.colors[1] = object()
+            with self.assertRaises(Exception):
+                broken.save_file(filename)
+            with open(filename, 'rb') as f:
+                self.assertEqual(f.read(), saved)
+        self.assertEqual(sorted(os.listdir(self.directory)), ['p.json', 'p.vrwc'])
+
+
+if __name__ == '__main__':
+    unittest.main()
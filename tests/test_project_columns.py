@@ -0,0 +1,59 @@
+import glob
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from project import project
+from project_columns import Columns, load_columns, write_columns
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Examples')
+
+
+class ColumnsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'p.vrwc')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, data):
+        with open(self.filename, 'wb') as f:
+            write_columns(data, f)
+
+    def test_examples_round_trip(self):
+        examples = sorted(glob.glob(os.path.join(EXAMPLES, '*.json')))
+        self.assertTrue(examples)
+        for example in examples:
+            with open(example) as f:
+                data = json.load(f)
+            self.write(data)
+            # As JSON text, 0 == 0.0 in a dict comparison
+            self.assertEqual(json.dumps(Columns(self.filename).to_dict(), sort_keys=True),
+                             json.dumps(data, sort_keys=True), example)
+            self.assertEqual(load_columns(self.filename).to_dict(), project.load_dict(data).to_dict(), example)
+
+    def test_shapes_list_methods(self):
+        with open(os.path.join(EXAMPLES, 'hands_001.json')) as f:
+            data = json.load(f)
+        self.write(data)
+        expected = project.load_dict(data).shapes
+        shapes = load_columns(self.filename).shapes
+        first = shapes[0]
+        shapes.remove(first)
+        self.assertFalse(first in shapes)
+        shapes.insert(1, first)
+        shapes.append(shapes.pop(2))
+        del shapes[3]
+        self.assertEqual(shapes.built(), 2)
+        order = [1, 0, 3] + range(5, len(expected)) + [2]
+        self.assertEqual(len(shapes), len(order))
+        for i,s in zip(order, shapes):
+            self.assertEqual(s.poly.points, expected[i].poly.points)
+            self.assertEqual(s.depth, expected[i].depth)
+
+
+if __name__ == '__main__':
+    unittest.main()
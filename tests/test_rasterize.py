@@ -0,0 +1,49 @@
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+import rasterize
+import recursion_cache
+import recursion_excursion
+from project import project
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       'Examples', 'GoldenRatio_001b.json')
+
+
+class RasterizeTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.umask = os.umask(0o022)
+        self.band_bytes = rasterize.BAND_BYTES
+        self.generate = recursion_excursion.generate_shape_recursion
+        self.generated = []
+        def generate(shape, *args, **kwargs):
+            self.generated.append(shape)
+            return self.generate(shape, *args, **kwargs)
+        recursion_excursion.generate_shape_recursion = generate
+        recursion_cache.generate_shape_recursion = generate
+
+    def tearDown(self):
+        rasterize.BAND_BYTES = self.band_bytes
+        recursion_excursion.generate_shape_recursion = self.generate
+        recursion_cache.generate_shape_recursion = self.generate
+        os.umask(self.umask)
+        shutil.rmtree(self.directory)
+
+    def test_shapes_generated_once(self):
+        proj = project.load_file(EXAMPLE)
+        # Many bands, each crossed by the same shapes
+        rasterize.BAND_BYTES = 20000
+        self.assertTrue(len(rasterize.band_ranges(200, 100, 2, 1)) > 4)
+        filename = os.path.join(self.directory, 'out.png')
+        rasterize.rasterize(proj, filename, 200, 100, supersample=2, jobs=1)
+        self.assertEqual(len(self.generated), len([s for s in proj.shapes if not s.disabled]))
+        self.assertEqual(stat.S_IMODE(os.stat(filename).st_mode), 0o644)
+        self.assertEqual(os.listdir(self.directory), ['out.png'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from project import project
+from recursion_cache import RecursionCache
+from recursion_excursion import generate_shape_recursion
+
+
+def triangles(poly_output):
+    return [(c, [(p.x, p.y) for p in poly.points]) for c,poly in poly_output]
+
+
+class RecursionCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        proj = project.load_dict({
+            'canvas': [0, 0, 100, 100],
+            'colors': ['#000000', '#FFFFFF'],
+            'shapes': [{'points': [[0, 0], [100, 0], [100, 100], [0, 100]],
+                        'depth': 300, 'step': 0.01, 'inc': 0.0, 'clockwise': True}],
+        })
+        self.shape = proj.shapes[0]
+        # More colors than fit a byte
+        self.colors = ['#%06X' % i for i in range(300)]
+        self.output = generate_shape_recursion(self.shape, self.colors)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def directory_bytes(self):
+        return sum(os.path.getsize(os.path.join(self.directory, name)) for name in os.listdir(self.directory))
+
+    def test_round_trip(self):
+        cache = RecursionCache(self.directory)
+        self.assertEqual(cache.load(self.shape, self.colors), None)
+        cache.store(self.shape, self.colors, self.output)
+        loaded = RecursionCache(self.directory).load(self.shape, self.colors)
+        self.assertEqual(triangles(loaded), triangles(self.output))
+
+    def test_replacing_counts_once(self):
+        cache = RecursionCache(self.directory)
+        for i in range(3):
+            cache.store(self.shape, self.colors, self.output)
+        self.assertEqual(cache._total_bytes, self.directory_bytes())
+
+
+if __name__ == '__main__':
+    unittest.main()
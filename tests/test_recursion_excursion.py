@@ -0,0 +1,168 @@
+import os
+import unittest
+from StringIO import StringIO
+
+from project import project
+from recursion_excursion import (ShapeStats, budget_depths, generate_budget_recursion, generate_dxf, generate_recursion,
+                                 generate_shape_recursion, plan_shape_recursion, shape_colors)
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Examples')
+
+
+def dxf_pairs(text):
+    lines = text.split('\n')
+    return [(int(lines[i]), lines[i + 1]) for i in range(0, len(lines) - 1, 2)]
+
+
+def dxf_sections(pairs):
+    """ {section name: [(code, value)]} """
+    sections = {}
+    for i,(code,value) in enumerate(pairs):
+        if (code, value) == (0, 'SECTION'):
+            name = pairs[i + 1][1]
+            end = pairs.index((0, 'ENDSEC'), i)
+            sections[name] = pairs[i + 2:end]
+    return sections
+
+
+def dxf_table_entries(pairs, table):
+    """ Names of the records in a TABLES table """
+    start = pairs.index((2, table))
+    end = pairs.index((0, 'ENDTAB'), start)
+    names = []
+    in_record = False
+    for code,value in pairs[start + 1:end]:
+        if code == 0:
+            in_record = True
+        elif (code == 2) and in_record:
+            names.append(value)
+            in_record = False
+    return names
+
+
+class DxfTest(unittest.TestCase):
+    def setUp(self):
+        proj = project.load_file(os.path.join(EXAMPLES, 'hands_001.json'))
+        self.recursion = generate_recursion(proj)
+        output = StringIO()
+        generate_dxf(proj.canvas, self.recursion, output)
+        self.pairs = dxf_pairs(output.getvalue())
+        self.sections = dxf_sections(self.pairs)
+
+    def test_sections(self):
+        self.assertEqual(self.pairs[-1], (0, 'EOF'))
+        for name in ('HEADER', 'CLASSES', 'TABLES', 'BLOCKS', 'ENTITIES', 'OBJECTS'):
+            self.assertIn(name, self.sections)
+        tables = self.sections['TABLES']
+        for table in ('VPORT', 'LTYPE', 'LAYER', 'STYLE', 'VIEW', 'UCS', 'APPID', 'DIMSTYLE', 'BLOCK_RECORD'):
+            self.assertIn((2, table), tables)
+        self.assertEqual(dxf_table_entries(tables, 'BLOCK_RECORD'), ['*Model_Space', '*Paper_Space'])
+
+    def test_references_defined(self):
+        tables = self.sections['TABLES']
+        linetypes = set(dxf_table_entries(tables, 'LTYPE'))
+        layers = set(dxf_table_entries(tables, 'LAYER'))
+        self.assertIn('0', layers)
+        for code,value in self.pairs:
+            if code == 6:
+                self.assertIn(value, linetypes)
+        for code,value in self.sections['ENTITIES'] + self.sections['BLOCKS']:
+            if code == 8:
+                self.assertIn(value, layers)
+
+    def test_handles(self):
+        header = self.sections['HEADER']
+        seed = int(header[header.index((9, '$HANDSEED')) + 1][1], 16)
+        handles = [int(value, 16) for name,pairs in self.sections.items() if name != 'HEADER'
+                   for code,value in pairs if code in (5, 105)]
+        self.assertEqual(len(handles), len(set(handles)))
+        self.assertTrue(max(handles) < seed)
+        entities = [value for code,value in self.sections['ENTITIES'] if code == 0]
+        self.assertEqual(len(entities), sum(len(r) for r in self.recursion))
+        self.assertEqual(set(entities), set(['LWPOLYLINE']))
+
+
+class BudgetTest(unittest.TestCase):
+    def setUp(self):
+        self.proj = project.load_file(os.path.join(EXAMPLES, 'hands_001.json'))
+        self.full = [len(r) for r in generate_recursion(self.proj)]
+
+    def test_fits(self):
+        self.assertEqual(sum(self.full), 6161)
+        self.assertEqual(budget_depths(self.proj, 100000), [s.depth for s in self.proj.shapes])
+        rl, truncated = generate_budget_recursion(self.proj, 100000)
+        self.assertEqual(sum(len(r) for r in rl), 6161)
+        self.assertEqual(truncated, [])
+
+    def test_cut(self):
+        depths = budget_depths(self.proj, 3000)
+        # Shape 40 is a single point with no area on the canvas
+        self.assertEqual(depths[40], self.proj.shapes[40].depth)
+        rl, truncated = generate_budget_recursion(self.proj, 3000)
+        self.assertTrue(sum(len(r) for r in rl) <= 3000)
+        self.assertTrue(truncated)
+        for i,r in enumerate(rl):
+            if i in truncated:
+                self.assertTrue(len(r) < self.full[i])
+            else:
+                self.assertEqual(len(r), self.full[i])
+
+
+class PlanTest(unittest.TestCase):
+    def setUp(self):
+        self.proj = project.load_dict({
+            'canvas': [0, 0, 100, 100],
+            'colors': ['#000000', '#FFFFFF'],
+            'shapes': [{'points': [[0, 0], [100, 0], [100, 100], [0, 100]],
+                        'depth': 20, 'step': 0.1, 'inc': 0.0, 'clockwise': True}],
+        })
+
+    def check(self, **params):
+        base = self.proj.shapes[0]
+        for clockwise in (True, False):
+            s = base.copy()
+            # Set directly, some of these are outside what shape() accepts
+            for name,value in params.items():
+                setattr(s, name, value)
+            s.clockwise = clockwise
+            stats = ShapeStats(0)
+            output = generate_shape_recursion(s, shape_colors(s, self.proj.colors), stats)
+            iterations, stop_reason = plan_shape_recursion(s)
+            self.assertEqual((iterations * len(s.poly.points), stop_reason), (len(output), stats.stop_reason),
+                             '%r clockwise=%s' % (params, clockwise))
+
+    def test_plain(self):
+        self.check()
+        self.check(inc=0.05)
+        self.check(footer=0.2, footer_inc=0.1, footer_offset=3)
+
+    def test_step_out_of_range(self):
+        self.check(step=0.0)
+        self.check(step=2.0)
+        self.check(step=-0.5)
+
+    def test_footer_past_one(self):
+        self.check(footer=1.5)
+        self.check(footer=1.5, footer_offset=4)
+        self.check(footer=1.5, footer_offset=40)
+
+
+class FooterTest(unittest.TestCase):
+    def test_zero_area_triangles_kept(self):
+        # The repeated corner gives zero area triangles, which have no
+        # center to shrink towards
+        proj = project.load_dict({
+            'canvas': [0, 0, 100, 100],
+            'colors': ['#000000', '#FFFFFF'],
+            'shapes': [{'points': [[0, 0], [0, 0], [100, 0], [100, 100]],
+                        'depth': 3, 'step': 0.1, 'inc': 0.0, 'clockwise': True, 'footer': 0.2}],
+        })
+        s = proj.shapes[0]
+        output = generate_shape_recursion(s, shape_colors(s, proj.colors))
+        self.assertEqual(len(output), 12)
+        self.assertTrue(all(poly is not None for c,poly in output))
+        self.assertEqual(output[0][1].area(), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
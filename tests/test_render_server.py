@@ -0,0 +1,50 @@
+import httplib
+import json
+import threading
+import time
+import unittest
+
+import render_server
+from render_server import RenderServer
+
+
+def slow_render(data, shapes):
+    time.sleep(5)
+    return 'text/plain', 'late'
+
+
+class TimeoutTest(unittest.TestCase):
+    def setUp(self):
+        self.render = render_server.render
+        # Before the server forks its workers
+        render_server.render = slow_render
+        self.server = RenderServer(('127.0.0.1', 0), 1, 1, 1024, timeout=0.2)
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05})
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        render_server.render = self.render
+
+    def post(self):
+        conn = httplib.HTTPConnection(*self.server.server_address)
+        try:
+            conn.request('POST', '/render', json.dumps({'canvas': [0, 0, 1, 1]}))
+            response = conn.getresponse()
+            return response.status, json.loads(response.read())
+        finally:
+            conn.close()
+
+    def test_timed_out(self):
+        start = time.time()
+        self.assertEqual(self.post(), (504, {'error': 'Render took longer than 0.2s'}))
+        # The worker gave up too, so the next request gets it
+        self.assertEqual(self.post()[0], 504)
+        self.assertTrue(time.time() - start < 4)
+        self.assertEqual(self.server.metrics()['requests']['error_504'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from project import project
+from tile_export import export_tiles
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       'Examples', 'GoldenRatio_001b.json')
+
+
+class ExportTilesTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.umask = os.umask(0o022)
+
+    def tearDown(self):
+        os.umask(self.umask)
+        shutil.rmtree(self.directory)
+
+    def test_tiles_follow_umask(self):
+        proj = project.load_file(EXAMPLE)
+        tiles = export_tiles(self.directory, proj, 100, 100, jobs=1)
+        self.assertTrue(tiles)
+        for filename,triangles,size in tiles:
+            self.assertEqual(stat.S_IMODE(os.stat(filename).st_mode), 0o644)
+        # Nothing left behind
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted(os.path.basename(t[0]) for t in tiles))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from watch import Watcher
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       'Examples', 'GoldenRatio_001b.json')
+
+
+class WatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.inputs = []
+        for d in ('a', 'b'):
+            os.makedirs(os.path.join(self.directory, d))
+            self.inputs.append(os.path.join(self.directory, d, 'x.json'))
+            shutil.copy(EXAMPLE, self.inputs[-1])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_colliding_outputs_skipped(self):
+        log = StringIO()
+        watcher = Watcher(self.inputs, os.path.join(self.directory, 'out'), log=log)
+        self.assertEqual(watcher.poll(), 1)
+        self.assertEqual(sorted(watcher.watched), [self.inputs[0]])
+        self.assertEqual(log.getvalue().count('Skipping'), 1)
+        # Said once
+        watcher.poll()
+        self.assertEqual(log.getvalue().count('Skipping'), 1)
+        # Taken over once the first goes away
+        os.remove(self.inputs[0])
+        self.assertEqual(watcher.poll(), 1)
+        self.assertEqual(sorted(watcher.watched), [self.inputs[1]])
+
+    def test_same_name_in_own_directories(self):
+        watcher = Watcher(self.inputs, log=StringIO())
+        self.assertEqual(watcher.poll(), 2)
+        for d in ('a', 'b'):
+            self.assertTrue(os.path.exists(os.path.join(self.directory, d, 'x.svg')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,209 @@
+#
+# Vector Recursion Workbench
+# Copyright (c) 2014-2016 Nathan Williams, Jason Fletcher
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+import glob
+import math
+import os
+from timeit import default_timer
+
+from project import project
+from recursion_excursion import SVG_FOOTER, shape_recursion, svg_header, svg_polygon, svg_shape_comment
+from export import AtomicFile, WorkerPool, add_jobs_argument
+
+
+class TileGrid(object):
+    """
+        Bed sized tiles covering the canvas, neighbours overlapping by
+        overlap. Finding the tiles under a box is plain arithmetic on the
+        grid, so nothing is tested against tiles it can't touch.
+    """
+    def __init__(self, canvas, width, height, overlap=0.0):
+        if (width <= overlap) or (height <= overlap):
+            raise ValueError('Tile %gx%g must be larger than the overlap %g' % (width, height, overlap))
+        self.x0,self.y0,self.x1,self.y1 = [float(v) for v in canvas]
+        self.width = float(width)
+        self.height = float(height)
+        self.stride_x = self.width - overlap
+        self.stride_y = self.height - overlap
+        self.columns = max(1, int(math.ceil((self.x1 - self.x0 - overlap) / self.stride_x)))
+        self.rows = max(1, int(math.ceil((self.y1 - self.y0 - overlap) / self.stride_y)))
+
+    def __repr__(self):
+        return 'TileGrid(%dx%d,%gx%g)' % (self.columns, self.rows, self.width, self.height)
+
+    def rect(self, row, column):
+        """ (x0, y0, x1, y1) of a tile, the last row and column end at the canvas edge """
+        x = self.x0 + column * self.stride_x
+        y = self.y0 + row * self.stride_y
+        return (x, y, min(x + self.width, self.x1), min(y + self.height, self.y1))
+
+    def span(self, lo, hi, origin, size, stride, count):
+        """ Range of tile indices along one axis overlapping (lo, hi) """
+        first = max(0, int(math.floor((lo - origin - size) / stride)) + 1)
+        last = min(count - 1, int(math.ceil((hi - origin) / stride)) - 1)
+        return range(first, last + 1)
+
+    def tiles(self, bounds):
+        """ (row, column) of each tile overlapping bounds (x0, y0, x1, y1) """
+        rows = self.span(bounds[1], bounds[3], self.y0, self.height, self.stride_y, self.rows)
+        columns = self.span(bounds[0], bounds[2], self.x0, self.width, self.stride_x, self.columns)
+        return [(r, c) for r in rows for c in columns]
+
+    def strips(self):
+        """ Rows, or columns if there are more of them, as lists of tiles """
+        if self.rows >= self.columns:
+            return [[(r, c) for c in range(self.columns)] for r in range(self.rows)]
+        return [[(r, c) for r in range(self.rows)] for c in range(self.columns)]
+
+
+def tile_svg_filename(row, column):
+    return 'tile_r%02d_c%02d.svg' % (row + 1, column + 1)
+
+
+class TileWriter(object):
+    """ Streams one tile's SVG to a temporary file, renamed into place by close() """
+    def __init__(self, filename, rect):
+        self.filename = filename
+        self.out = AtomicFile(filename)
+        self.f = self.out.f
+        x0,y0,x1,y1 = rect
+        self.f.write(svg_header([x0, y0, x1 - x0, y1 - y0]))
+        self.shape = None
+        self.triangles = 0
+
+    def add(self, shape_index, c, poly):
+        if shape_index != self.shape:
+            self.f.write(svg_shape_comment(shape_index))
+            self.shape = shape_index
+        self.f.write(svg_polygon(c, poly))
+        self.triangles += 1
+
+    def close(self):
+        self.f.write(SVG_FOOTER)
+        self.out.close()
+        return os.path.getsize(self.filename)
+
+    def abort(self):
+        self.out.abort()
+
+
+def export_strip(args):
+    """
+        Worker: writes the tiles of one strip. Only shapes overlapping the
+        strip are generated, one at a time, and their triangles go straight
+        to the tile files. Returns [(filename, triangles, bytes)] of tiles
+        that weren't empty.
+    """
+    directory,proj,grid,strip = args
+    in_strip = set(strip)
+    rects = dict((t, grid.rect(*t)) for t in strip)
+    x0 = min(r[0] for r in rects.values())
+    y0 = min(r[1] for r in rects.values())
+    x1 = max(r[2] for r in rects.values())
+    y1 = max(r[3] for r in rects.values())
+    writers = {}
+    try:
+        for i,s in enumerate(proj.shapes):
+            if s.disabled:
+                continue
+            b = s.poly.bounds()
+            if (b[2] <= x0) or (b[0] >= x1) or (b[3] <= y0) or (b[1] >= y1):
+                continue
+            for c,poly in shape_recursion(s, proj.colors):
+                xs = [p.x for p in poly.points]
+                ys = [p.y for p in poly.points]
+                tb = (min(xs), min(ys), max(xs), max(ys))
+                for t in grid.tiles(tb):
+                    if t not in in_strip:
+                        continue
+                    r = rects[t]
+                    if (tb[0] >= r[0]) and (tb[1] >= r[1]) and (tb[2] <= r[2]) and (tb[3] <= r[3]):
+                        clipped = poly
+                    else:
+                        clipped = poly.clip(*r)
+                        if clipped is None:
+                            continue
+                    w = writers.get(t)
+                    if w is None:
+                        w = writers[t] = TileWriter(os.path.join(directory, tile_svg_filename(*t)), r)
+                    w.add(i, c, clipped)
+        out = []
+        for t in sorted(writers):
+            w = writers.pop(t)
+            out.append((w.filename, w.triangles, w.close()))
+        return out
+    finally:
+        for w in writers.values():
+            w.abort()
+
+
+def export_tiles(directory, proj, width, height, overlap=0.0, jobs=None, progress=None):
+    """
+        Write the recursion of proj as width by height (canvas units) tiles
+        overlapping by overlap, triangles clipped to each tile. Strips of
+        tiles are written in parallel by jobs processes. progress is called
+        as progress(strips done, bytes written) and may raise to stop.
+        Returns [(filename, triangles, bytes)] of the tiles written.
+    """
+    grid = TileGrid(proj.canvas, width, height, overlap)
+    strips = grid.strips()
+    args = [(directory, proj, grid, strip) for strip in strips]
+    written = []
+    bytes_written = 0
+    try:
+        with WorkerPool(jobs, len(strips)) as pool:
+            for n,tiles in enumerate(pool.map(export_strip, args, ordered=False)):
+                written.extend(tiles)
+                bytes_written += sum(t[2] for t in tiles)
+                if progress is not None:
+                    progress(n + 1, bytes_written)
+    finally:
+        # Left by terminated workers if stopped early
+        for tmp in glob.glob(os.path.join(directory, 'tile_*.svg.*.tmp')):
+            os.remove(tmp)
+    written.sort()
+    return written
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Export a project as bed sized SVG tiles.')
+    parser.add_argument('project', help='project JSON file')
+    parser.add_argument('width', type=float, help='tile width in canvas units')
+    parser.add_argument('height', type=float, help='tile height in canvas units')
+    parser.add_argument('--overlap', type=float, default=0.0,
+                        help='canvas units shared by neighbouring tiles (default: 0)')
+    parser.add_argument('-o', '--output-dir', metavar='DIR',
+                        help='write tiles to DIR (default: directory named after the project)')
+    add_jobs_argument(parser)
+    args = parser.parse_args()
+    proj = project.load_file(args.project)
+    output_dir = args.output_dir or (os.path.splitext(args.project)[0] + '_tiles')
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    start = default_timer()
+    tiles = export_tiles(output_dir, proj, args.width, args.height, args.overlap, args.jobs)
+    for filename,triangles,size in tiles:
+        print '%s: %d triangles, %d bytes' % (filename, triangles, size)
+    print '%d tiles in %.2fs' % (len(tiles), default_timer() - start)
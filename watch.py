@@ -0,0 +1,205 @@
+#
+# Vector Recursion Workbench
+# Copyright (c) 2014-2016 Nathan Williams, Jason Fletcher
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+import glob
+import os
+import sys
+import time
+from timeit import default_timer
+
+from project import project
+from recursion_excursion import shape_colors, shape_recursion
+from recursion_cache import MemoryRecursionCache, shape_key
+from export import shape_svg_filename, write_svg
+
+
+def shape_signature(shape, palette):
+    """ Everything a shape's SVG output depends on, besides the canvas """
+    if shape.disabled:
+        return None
+    colors = shape_colors(shape, palette)
+    return (shape_key(shape, len(colors)), tuple(colors))
+
+
+class WatchedProject(object):
+    """
+        Last rendered state of one project file. update() diffs a freshly
+        loaded project against it shape by shape and only regenerates and
+        rewrites what changed.
+    """
+    def __init__(self, filename, output_dir, shapes, cache):
+        self.filename = filename
+        self.name = os.path.splitext(os.path.basename(filename))[0]
+        self.svg_filename = os.path.join(output_dir, self.name + '.svg')
+        self.shapes_dir = os.path.join(output_dir, self.name) if shapes else None
+        self.cache = cache
+        self.stamp = None
+        self.canvas = None
+        self.signatures = []
+        self.rec_list = []
+
+    def file_stamp(self):
+        try:
+            st = os.stat(self.filename)
+        except OSError:
+            return None
+        return (st.st_mtime, st.st_size)
+
+    def update(self, proj):
+        """ Returns (changed shape indices, files written) """
+        signatures = [shape_signature(s, proj.colors) for s in proj.shapes]
+        canvas_changed = (proj.canvas != self.canvas)
+        changed = []
+        rec_list = []
+        for i,s in enumerate(proj.shapes):
+            same = (not canvas_changed) and (i < len(self.signatures)) and (signatures[i] == self.signatures[i])
+            if same:
+                rec_list.append(self.rec_list[i])
+            else:
+                changed.append(i)
+                rec_list.append(shape_recursion(s, proj.colors, self.cache))
+        # Shapes that no longer exist
+        removed = range(len(proj.shapes), len(self.signatures))
+        written = []
+        if changed or removed:
+            write_svg(self.svg_filename, proj.canvas, rec_list)
+            written.append(self.svg_filename)
+        if self.shapes_dir:
+            if not os.path.isdir(self.shapes_dir):
+                os.makedirs(self.shapes_dir)
+            for i in changed:
+                filename = os.path.join(self.shapes_dir, shape_svg_filename(i))
+                if rec_list[i]:
+                    write_svg(filename, proj.canvas, [rec_list[i]])
+                    written.append(filename)
+                elif os.path.exists(filename):
+                    # Now disabled, same as a fresh Export Shapes
+                    os.remove(filename)
+            for i in removed:
+                filename = os.path.join(self.shapes_dir, shape_svg_filename(i))
+                if os.path.exists(filename):
+                    os.remove(filename)
+        self.canvas = list(proj.canvas)
+        self.signatures = signatures
+        self.rec_list = rec_list
+        return changed, written
+
+
+class Watcher(object):
+    def __init__(self, patterns, output_dir=None, shapes=False, max_entries=None, log=sys.stdout):
+        self.patterns = patterns
+        self.output_dir = output_dir
+        self.shapes = shapes
+        self.log = log
+        # Warm between changes (and across files sharing shapes)
+        self.cache = MemoryRecursionCache(max_entries) if max_entries else MemoryRecursionCache()
+        self.watched = {}
+        # Not watched as another project writes the same output
+        self.skipped = set()
+        if output_dir and not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+
+    def find_files(self):
+        out = []
+        for p in self.patterns:
+            if os.path.isdir(p):
+                out.extend(glob.glob(os.path.join(p, '*.json')))
+            else:
+                out.extend(glob.glob(p))
+        return sorted(set(out))
+
+    def poll(self):
+        """
+            Check every file once, returns number of projects re-exported.
+            A project that would write the same output as one already
+            watched, e.g. a/x.json and b/x.json with one output_dir, is
+            skipped until that one goes away.
+        """
+        files = self.find_files()
+        for filename in list(self.watched.keys()):
+            if filename not in files:
+                del self.watched[filename]
+                self.log.write('Forgot %s\n' % filename)
+        self.skipped &= set(files)
+        outputs = dict((os.path.normcase(os.path.abspath(w.svg_filename)), f) for f,w in self.watched.items())
+        updated = 0
+        for filename in files:
+            w = self.watched.get(filename)
+            if w is None:
+                out_dir = self.output_dir or os.path.dirname(filename) or '.'
+                w = WatchedProject(filename, out_dir, self.shapes, self.cache)
+                key = os.path.normcase(os.path.abspath(w.svg_filename))
+                if key in outputs:
+                    if filename not in self.skipped:
+                        self.skipped.add(filename)
+                        self.log.write('Skipping %s: %s is already written to %s\n' %
+                                       (filename, outputs[key], w.svg_filename))
+                    continue
+                self.skipped.discard(filename)
+                outputs[key] = filename
+                self.watched[filename] = w
+            stamp = w.file_stamp()
+            if (stamp is None) or (stamp == w.stamp):
+                continue
+            start = default_timer()
+            try:
+                proj = project.load_file(filename)
+            except Exception as e:
+                # Likely caught mid-save, retried once the file changes again
+                self.log.write('Failed to load %s: %s\n' % (filename, e))
+                w.stamp = stamp
+                continue
+            w.stamp = stamp
+            changed, written = w.update(proj)
+            if written:
+                updated += 1
+                self.log.write('%6.2fs  %s: %d of %d shapes changed, %d files written\n' %
+                               (default_timer() - start, filename, len(changed),
+                                len(proj.shapes), len(written)))
+        return updated
+
+    def run(self, interval):
+        self.log.write('Watching %s (ctrl-c to stop)\n' % ', '.join(self.patterns))
+        try:
+            while True:
+                self.poll()
+                self.log.flush()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Re-export SVGs whenever project JSON files change.')
+    parser.add_argument('inputs', nargs='+', help='project JSON files, globs or directories to watch')
+    parser.add_argument('-o', '--output-dir', metavar='DIR',
+                        help='write SVGs to DIR (default: next to each project)')
+    parser.add_argument('-s', '--shapes', action='store_true',
+                        help='also keep one SVG per shape in a directory named after the project')
+    parser.add_argument('-i', '--interval', type=float, default=0.5,
+                        help='seconds between polls (default: 0.5)')
+    parser.add_argument('--max-entries', type=int, default=None,
+                        help='shape recursions kept in memory between changes')
+    args = parser.parse_args()
+    Watcher(args.inputs, args.output_dir, args.shapes, args.max_entries).run(args.interval)